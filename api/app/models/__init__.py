@@ -1,14 +1,21 @@
 """Módulo de modelos: enums y schemas."""
 
-from app.models.enums import SentimentType, TicketCategory
+from app.models.enums import (
+    OutputProtocol,
+    SentimentType,
+    TicketCategory,
+    TicketPriority,
+)
 from app.models.schemas import (
     TicketProcessRequest,
     TicketProcessResponse,
 )
 
 __all__ = [
+    "OutputProtocol",
     "SentimentType",
     "TicketCategory",
+    "TicketPriority",
     "TicketProcessRequest",
     "TicketProcessResponse",
 ]
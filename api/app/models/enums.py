@@ -21,3 +21,19 @@ class SentimentType(str, Enum):
     POSITIVO = "Positivo"
     NEUTRAL = "Neutral"
     NEGATIVO = "Negativo"
+
+
+class OutputProtocol(str, Enum):
+    """Formato de respuesta pedido al LLM."""
+
+    FULL = "full"
+    COMPACT = "compact"
+
+
+class TicketPriority(str, Enum):
+    """Prioridad de un ticket en la cola de admisión al LLM."""
+
+    URGENT = "urgent"
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
@@ -1,8 +1,15 @@
 """Schemas Pydantic para validación de datos."""
 
+from typing import Optional
+
 from pydantic import BaseModel, Field, StrictFloat, StrictStr, UUID4
 
-from app.models.enums import SentimentType, TicketCategory
+from app.models.enums import (
+    OutputProtocol,
+    SentimentType,
+    TicketCategory,
+    TicketPriority,
+)
 
 
 class TicketProcessRequest(BaseModel):
@@ -10,6 +17,12 @@ class TicketProcessRequest(BaseModel):
 
     ticket_id: UUID4
     description: StrictStr = Field(..., min_length=10)
+    # None = protocolo del despliegue (LLM_OUTPUT_PROTOCOL).
+    output_protocol: Optional[OutputProtocol] = None
+    # None = según el sentimiento del clasificador local, o ``normal``.
+    priority: Optional[TicketPriority] = None
+    # True = reprocesa y sobrescribe aunque el ticket ya esté clasificado.
+    force: bool = False
 
 
 class TicketProcessResponse(BaseModel):
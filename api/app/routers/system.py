@@ -0,0 +1,223 @@
+from typing import Any, Dict, Union
+
+from fastapi import APIRouter, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+
+from app.services import metrics
+from app.services.profiling import RequestProfiler, to_pstats, to_speedscope
+from app.services.registry import get_registry
+
+router = APIRouter(tags=["system"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
+    """Métricas del proceso en formato de texto de Prometheus."""
+    return PlainTextResponse(
+        metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@router.get("/health/pools")
+def pool_stats(request: Request) -> Dict[str, Dict[str, int]]:
+    """Estadísticas de los pools HTTP (abiertas, reutilizadas, en espera)."""
+    return get_registry(request.app).stats()
+
+
+@router.get("/health/cache")
+def cache_stats(request: Request) -> Dict[str, Any]:
+    """Contadores de la caché de clasificaciones (hits, misses, evicciones)."""
+    cache = get_registry(request.app).cache
+    return {"enabled": cache is not None, **(cache.stats() if cache else {})}
+
+
+@router.get("/health/near-duplicates")
+def near_duplicate_stats(request: Request) -> Dict[str, Any]:
+    """Tamaño, memoria y aciertos del índice de tickets casi duplicados."""
+    index = get_registry(request.app).near_duplicates
+    return {"enabled": index is not None, **(index.stats() if index else {})}
+
+
+@router.get("/health/single-flight")
+def single_flight_stats(request: Request) -> Dict[str, Any]:
+    """Llamadas al LLM compartidas entre requests idénticas concurrentes."""
+    group = get_registry(request.app).single_flight
+    return {"enabled": group is not None, **(group.stats() if group else {})}
+
+
+@router.get("/health/idempotency")
+def idempotency_stats(request: Request) -> Dict[str, Any]:
+    """Tickets recordados y repeticiones respondidas sin llamar al LLM."""
+    store = get_registry(request.app).idempotency
+    return {"enabled": store is not None, **(store.stats() if store else {})}
+
+
+@router.get("/health/capture")
+def capture_stats(request: Request) -> Dict[str, Any]:
+    """Requests de /process-ticket capturadas para reproducir con bench.replay."""
+    capture = get_registry(request.app).traffic_capture
+    return {"enabled": capture is not None, **(capture.stats() if capture else {})}
+
+
+@router.get("/health/cascade")
+def cascade_stats(request: Request) -> Dict[str, Any]:
+    """Tasa de escalado al LLM y latencias del clasificador local."""
+    cascade = get_registry(request.app).cascade
+    return {"enabled": cascade is not None, **(cascade.stats() if cascade else {})}
+
+
+@router.get("/health/micro-batch")
+def micro_batch_stats(request: Request) -> Dict[str, Any]:
+    """Lotes de tickets por prompt y reenvíos individuales."""
+    batcher = get_registry(request.app).micro_batch
+    return {"enabled": batcher is not None, **(batcher.stats() if batcher else {})}
+
+
+@router.get("/health/llm-resilience")
+def llm_resilience_stats(request: Request) -> Dict[str, Any]:
+    """Estado del circuit breaker, reintentos y tasa de éxito de los hedges."""
+    resilience = get_registry(request.app).resilience
+    return {
+        "enabled": resilience is not None,
+        **(resilience.stats() if resilience else {}),
+    }
+
+
+@router.get("/health/admission")
+def admission_stats(request: Request) -> Dict[str, Any]:
+    """Límite adaptativo, profundidad de la cola, esperas y rechazos."""
+    admission = get_registry(request.app).admission
+    return {
+        "enabled": admission is not None,
+        **(admission.stats() if admission else {}),
+    }
+
+
+@router.get("/health/write-behind")
+def write_behind_stats(request: Request) -> Dict[str, Any]:
+    """Profundidad del buffer de escritura diferida y latencia de sus flushes."""
+    buffer = get_registry(request.app).write_behind
+    return {"enabled": buffer is not None, **(buffer.stats() if buffer else {})}
+
+
+@router.get("/health/result-stream")
+def result_stream_stats(request: Request) -> Dict[str, Any]:
+    """Suscriptores del stream de resultados y eventos descartados."""
+    broadcaster = get_registry(request.app).result_stream
+    return {
+        "enabled": broadcaster is not None,
+        **(broadcaster.stats() if broadcaster else {}),
+    }
+
+
+@router.get("/health/queue")
+def queue_stats(request: Request) -> Dict[str, Any]:
+    """Lotes y tickets procesados por el worker de cola."""
+    worker = getattr(request.app.state, "queue_worker", None)
+    return {"enabled": worker is not None, **(worker.stats() if worker else {})}
+
+
+@router.post("/queue/wake")
+def wake_queue(request: Request) -> Any:
+    """Aviso de tickets nuevos (p. ej. Database Webhook de Supabase en INSERT).
+
+    Pide QUEUE_WAKE_TOKEN en el header ``X-Admin-Token``.
+    """
+    worker = getattr(request.app.state, "queue_worker", None)
+    if worker is None:
+        return {"enabled": False}
+    if not worker.authorized(request.headers.get("X-Admin-Token")):
+        return _error(
+            status.HTTP_403_FORBIDDEN, "No autorizado.", "X-Admin-Token inválido."
+        )
+    worker.wake()
+    return {"enabled": True}
+
+
+def _profiler(request: Request) -> Union[RequestProfiler, JSONResponse]:
+    """El profiler si está activo y ``X-Admin-Token`` es válido; si no, el error."""
+    profiler = get_registry(request.app).profiler
+    if profiler is None:
+        return _error(
+            status.HTTP_404_NOT_FOUND,
+            "Profiling no disponible.",
+            "PROFILING_ENABLED=false.",
+        )
+    if not profiler.authorized(request.headers.get("X-Admin-Token")):
+        return _error(
+            status.HTTP_403_FORBIDDEN, "No autorizado.", "X-Admin-Token inválido."
+        )
+    return profiler
+
+
+def _error(status_code: int, message: str, error: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "status": "error",
+            "message": message,
+            "data": None,
+            "errors": [error],
+        },
+    )
+
+
+@router.get("/debug/profiles")
+def list_profiles(request: Request) -> Any:
+    """Perfiles guardados de /process-ticket (los más lentos) con sus etapas."""
+    profiler = _profiler(request)
+    if isinstance(profiler, JSONResponse):
+        return profiler
+    return {
+        **profiler.stats(),
+        "profiles": [profile.summary() for profile in profiler.profiles()],
+    }
+
+
+@router.get("/debug/profiles/{profile_id}")
+def export_profile(
+    request: Request,
+    profile_id: str,
+    format: str = "speedscope",
+    mode: str = "wall",
+) -> Any:
+    """Exporta un perfil, o todos con ``all``, en formato speedscope o pstats.
+
+    ``mode=cpu`` deja solo las muestras en que la request estaba ejecutando;
+    ``wall`` (por defecto) incluye también las esperas.
+    """
+    profiler = _profiler(request)
+    if isinstance(profiler, JSONResponse):
+        return profiler
+    if format not in ("speedscope", "pstats") or mode not in ("wall", "cpu"):
+        return _error(
+            status.HTTP_400_BAD_REQUEST,
+            "Entrada inválida.",
+            "format debe ser speedscope o pstats y mode, wall o cpu.",
+        )
+    if profile_id == "all":
+        profiles = profiler.profiles()
+    else:
+        profile = profiler.get(int(profile_id)) if profile_id.isdigit() else None
+        if profile is None:
+            return _error(
+                status.HTTP_404_NOT_FOUND, "Perfil no encontrado.", profile_id
+            )
+        profiles = [profile]
+    cpu_only = mode == "cpu"
+    if format == "pstats":
+        return Response(
+            to_pstats(profiles, cpu_only),
+            media_type="application/octet-stream",
+            headers={
+                "Content-Disposition": f'attachment; filename="{profile_id}.prof"'
+            },
+        )
+    return JSONResponse(
+        to_speedscope(profiles, cpu_only),
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{profile_id}.speedscope.json"'
+            )
+        },
+    )
@@ -1,52 +1,98 @@
 import logging
 import os
 import time
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Body, Depends, status
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import APIRouter, Depends, Request, status
+from fastapi.responses import Response, StreamingResponse
 from pydantic import ValidationError
 
-from app.models import TicketProcessRequest, TicketProcessResponse
-from app.services.llm_service import (
-    LLMService,
-    LLMServiceError,
-    MockLLMService,
-)
+from app.models import TicketPriority, TicketProcessRequest, TicketProcessResponse
+from app.services import metrics
+from app.services.admission import AdmissionRejectedError, priority_for_sentiment
+from app.services.idempotency import Claim, IdempotencyStore
+from app.services.llm_service import LLMServiceError, TicketClassifier
+from app.services.pipeline import classify, process_batch, update_ticket
+from app.services.registry import get_registry
+from app.services.result_stream import ResultBroadcaster, StreamFullError
 from app.services.supabase_service import (
     SupabaseService,
     SupabaseServiceError,
+    TicketAlreadyProcessedError,
+    build_ticket_row,
 )
+from app.services.ticket_stats import TicketStats
+from app.services.traffic_capture import STAGES_SCOPE_KEY
+from app.services.write_behind import WriteBehindBuffer
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["tickets"])
 
+BATCH_MAX_TICKETS = int(os.getenv("BATCH_MAX_TICKETS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+
+# Los POST leen el cuerpo crudo; en la documentación sigue siendo un objeto JSON.
+_JSON_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {"type": "object"}}},
+    }
+}
+_serialize_result = TicketProcessResponse.__pydantic_serializer__.to_json
+
 
-def get_llm_service() -> Union[LLMService, MockLLMService]:
+async def get_llm_service(request: Request) -> TicketClassifier:
     """Dependencia para el servicio LLM. Con MOCK_LLM=true no se usa Hugging Face."""
-    if os.getenv("MOCK_LLM", "").lower() == "true":
-        return MockLLMService()
-    try:
-        return LLMService()
-    except Exception as exc:
-        logger.exception("LLM service init failed: %s", exc)
-        raise
+    return await get_registry(request.app).aget("llm")
 
 
-def get_supabase_service() -> SupabaseService:
+async def get_supabase_service(request: Request) -> SupabaseService:
     """Dependencia para el servicio de Supabase."""
-    try:
-        return SupabaseService()
-    except Exception as exc:
-        logger.exception("Supabase service init failed: %s", exc)
-        raise
+    return await get_registry(request.app).aget("supabase")
+
+
+def get_write_behind(request: Request) -> Optional[WriteBehindBuffer]:
+    """Buffer de escritura diferida, o None si WRITE_BEHIND_ENABLED no es true."""
+    return get_registry(request.app).write_behind
+
+
+async def get_idempotency(request: Request) -> Optional[IdempotencyStore]:
+    """Registro de tickets procesados, o None si IDEMPOTENCY_ENABLED=false.
+
+    Es ``async`` para que FastAPI no la ejecute en el threadpool.
+    """
+    return get_registry(request.app).idempotency
+
+
+def get_ticket_stats(request: Request) -> Optional[TicketStats]:
+    """Agregados en memoria, o None si TICKET_STATS_ENABLED=false."""
+    return get_registry(request.app).ticket_stats
+
+
+def get_result_stream(request: Request) -> Optional[ResultBroadcaster]:
+    """Broadcaster de resultados, o None si RESULT_STREAM_ENABLED=false."""
+    return get_registry(request.app).result_stream
+
+
+def _admission_priority(
+    request: Request, request_data: TicketProcessRequest
+) -> Optional[TicketPriority]:
+    """Prioridad pedida o, con admisión y clasificador local, la de su sentimiento."""
+    if request_data.priority is not None:
+        return request_data.priority
+    registry = get_registry(request.app)
+    if registry.admission is None or registry.cascade is None:
+        return None
+    sentiment, _ = registry.cascade.predict_local(request_data.description)["sentiment"]
+    return priority_for_sentiment(sentiment)
 
 
 def _response(
     status_value: str,
     message: str,
-    data: Optional[Dict[str, Any]],
+    data: Any,
     errors: Optional[list[str]],
 ) -> Dict[str, Any]:
     return {
@@ -57,84 +103,226 @@ def _response(
     }
 
 
-@router.post("/process-ticket")
-def process_ticket(
-    payload: Dict[str, Any] = Body(...),
-    llm_service: Union[LLMService, MockLLMService] = Depends(get_llm_service),
+def _json(
+    status_code: int,
+    status_value: str,
+    message: str,
+    data: Any = None,
+    errors: Optional[list[str]] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """Sobre de respuesta serializado a bytes una sola vez con orjson."""
+    return Response(
+        orjson.dumps(_response(status_value, message, data, errors)),
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def _result_json(result: TicketProcessResponse) -> orjson.Fragment:
+    """Clasificación ya serializada por Pydantic, para incrustar en el sobre."""
+    return orjson.Fragment(_serialize_result(result))
+
+
+def _capture_stages(request: Request) -> Optional[Dict[str, float]]:
+    """Tiempos por etapa para la captura de tráfico o el profiler, o None."""
+    return request.scope.get(STAGES_SCOPE_KEY)
+
+
+def _raw_ticket_id(body: bytes) -> Any:
+    # Solo para el log de un cuerpo inválido.
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return "unknown"
+    if not isinstance(payload, dict):
+        return "unknown"
+    return payload.get("ticket_id", "unknown")
+
+
+@router.post("/process-ticket", openapi_extra=_JSON_BODY)
+async def process_ticket(
+    request: Request,
+    llm_service: TicketClassifier = Depends(get_llm_service),
     supabase_service: SupabaseService = Depends(get_supabase_service),
-) -> Dict[str, Any]:
-    """Procesa un ticket con IA, clasifica categoría/sentimiento y persiste en Supabase."""
+    write_behind: Optional[WriteBehindBuffer] = Depends(get_write_behind),
+    idempotency: Optional[IdempotencyStore] = Depends(get_idempotency),
+) -> Response:
+    """Procesa un ticket con IA, clasifica categoría/sentimiento y persiste en Supabase.
+
+    Con escritura diferida activa, la fila se encola y se responde sin esperar
+    a Supabase. Con la cola de admisión al LLM llena responde 429 con
+    ``Retry-After``.
+
+    El cuerpo se valida directamente desde los bytes (un solo parseo) y la
+    respuesta se serializa con orjson.
+
+    Un ticket ya procesado, o en curso en este worker, devuelve la
+    clasificación guardada sin llamar al LLM; ``force`` lo reprocesa. La
+    actualización en Supabase tampoco sobrescribe un ticket ya procesado.
+    """
     t0 = time.perf_counter()
-    ticket_id_raw = payload.get("ticket_id", "unknown")
+    stages = _capture_stages(request)
+    body = await request.body()
 
     try:
-        request_data = TicketProcessRequest(**payload)
+        request_data = TicketProcessRequest.model_validate_json(body)
     except ValidationError as exc:
-        logger.error("Validation failed for ticket %s: %s", ticket_id_raw, exc.errors())
-        return JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content=_response(
-                "error",
-                "Entrada inválida.",
-                data=None,
-                errors=[str(e) for e in exc.errors()],
-            ),
+        metrics.VALIDATION_SECONDS.observe(time.perf_counter() - t0)
+        metrics.record_error("validation")
+        logger.error(
+            "Validation failed for ticket %s: %s", _raw_ticket_id(body), exc.errors()
+        )
+        return _json(
+            status.HTTP_400_BAD_REQUEST,
+            "error",
+            "Entrada inválida.",
+            errors=[str(e) for e in exc.errors()],
         )
 
+    validation_s = time.perf_counter() - t0
+    metrics.VALIDATION_SECONDS.observe(validation_s)
+    if stages is not None:
+        stages["validation_ms"] = round(validation_s * 1000, 3)
     logger.info("Processing ticket: %s", request_data.ticket_id)
 
+    ticket_id = str(request_data.ticket_id)
+    claim: Optional[Claim] = None
+    if idempotency is not None:
+        t_claim = time.perf_counter()
+        claim = await idempotency.claim(ticket_id, request_data.force)
+        if stages is not None:
+            stages["idempotency_ms"] = round(
+                (time.perf_counter() - t_claim) * 1000, 3
+            )
+        if claim.stored is not None:
+            logger.info("Ticket %s already processed, not reclassified", ticket_id)
+            return _already_processed(claim.stored)
+    try:
+        return await _classify_and_store(
+            request,
+            request_data,
+            llm_service,
+            supabase_service,
+            write_behind,
+            idempotency,
+            claim,
+            t0,
+        )
+    finally:
+        if idempotency is not None and claim is not None:
+            # Sin efecto si se completó o si la reserva es de otra request;
+            # si no, las repeticiones en espera reintentan.
+            idempotency.release(ticket_id, claim)
+
+
+def _already_processed(result: Optional[TicketProcessResponse]) -> Response:
+    return _json(
+        status.HTTP_200_OK,
+        "success",
+        "Ticket ya procesado.",
+        data=_result_json(result) if result is not None else None,
+    )
+
+
+async def _classify_and_store(
+    request: Request,
+    request_data: TicketProcessRequest,
+    llm_service: TicketClassifier,
+    supabase_service: SupabaseService,
+    write_behind: Optional[WriteBehindBuffer],
+    idempotency: Optional[IdempotencyStore],
+    claim: Optional[Claim],
+    t0: float,
+) -> Response:
+    """Clasifica y persiste el ticket; lo marca como terminado si salió bien."""
+
     t_llm = time.perf_counter()
     try:
-        llm_result: TicketProcessResponse = llm_service.classify_ticket(
-            request_data.description
+        llm_result: TicketProcessResponse = await classify(
+            llm_service,
+            request_data.description,
+            request_data.output_protocol,
+            _admission_priority(request, request_data),
+        )
+    except AdmissionRejectedError as exc:
+        logger.warning(
+            "Ticket %s not admitted (%s), retry after %ds",
+            request_data.ticket_id,
+            exc.reason,
+            exc.retry_after,
+        )
+        return _json(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            "error",
+            "Servicio saturado, reintenta más tarde.",
+            errors=[str(exc)],
+            headers={"Retry-After": str(exc.retry_after)},
         )
     except LLMServiceError as exc:
         logger.error("LLM error for ticket %s: %s", request_data.ticket_id, exc)
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content=_response(
-                "error",
-                "Error al clasificar el ticket con IA.",
-                data=None,
-                errors=[str(exc)],
-            ),
+        return _json(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "error",
+            "Error al clasificar el ticket con IA.",
+            errors=[str(exc)],
         )
-    llm_ms = int((time.perf_counter() - t_llm) * 1000)
+    llm_s = time.perf_counter() - t_llm
+    llm_ms = int(llm_s * 1000)
+    stages = _capture_stages(request)
+    if stages is not None:
+        stages["llm_ms"] = round(llm_s * 1000, 3)
 
     t_supabase = time.perf_counter()
     try:
-        supabase_service.update_ticket_by_id(
-            ticket_id=request_data.ticket_id,
-            category=llm_result.category,
-            sentiment=llm_result.sentiment,
-            confidence_score=llm_result.confidence_score,
-            reasoning=llm_result.reasoning,
-            processing_time_ms=llm_ms,
+        queued = write_behind is not None and write_behind.enqueue(
+            build_ticket_row(
+                ticket_id=request_data.ticket_id,
+                description=request_data.description,
+                category=llm_result.category,
+                sentiment=llm_result.sentiment,
+                confidence_score=llm_result.confidence_score,
+                reasoning=llm_result.reasoning,
+                processing_time_ms=llm_ms,
+                force=request_data.force,
+            )
         )
+        # Sin buffer, o con el buffer lleno (Supabase caído), se guarda aquí.
+        if not queued:
+            await update_ticket(supabase_service, request_data, llm_result, llm_ms)
+    except TicketAlreadyProcessedError as exc:
+        if idempotency is not None and exc.result is not None:
+            idempotency.complete_stored(
+                str(request_data.ticket_id), exc.result, claim
+            )
+        return _already_processed(exc.result)
     except SupabaseServiceError as exc:
         logger.error("Supabase error for ticket %s: %s", request_data.ticket_id, exc)
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content=_response(
-                "error",
-                "Error al actualizar el ticket.",
-                data=None,
-                errors=[str(exc)],
-            ),
+        return _json(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "error",
+            "Error al actualizar el ticket.",
+            errors=[str(exc)],
         )
     except Exception as exc:
+        metrics.record_error("unexpected")
         logger.exception("Unexpected error updating ticket %s", request_data.ticket_id)
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content=_response(
-                "error",
-                "Error al procesar el ticket.",
-                data=None,
-                errors=[str(exc)],
-            ),
+        return _json(
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "error",
+            "Error al procesar el ticket.",
+            errors=[str(exc)],
         )
     supabase_ms = (time.perf_counter() - t_supabase) * 1000
     total_ms = (time.perf_counter() - t0) * 1000
+    metrics.TOTAL_SECONDS.observe(total_ms / 1000)
+    if stages is not None:
+        stages["supabase_ms"] = round(supabase_ms, 3)
+        stages["total_ms"] = round(total_ms, 3)
+    # Los respaldos de confianza 0 no se recuerdan: un reintento puede mejorarlos.
+    if idempotency is not None and llm_result.confidence_score > 0:
+        idempotency.complete(str(request_data.ticket_id), llm_result, claim)
 
     logger.info(
         "Ticket %s processed: %s / %s (%.2fms total, LLM %.0fms, Supabase %.0fms)",
@@ -145,9 +333,177 @@ def process_ticket(
         llm_ms,
         supabase_ms,
     )
-    return _response(
+    return _json(
+        status.HTTP_200_OK,
         "success",
         "Ticket procesado correctamente.",
-        data=llm_result.model_dump(mode="json"),
-        errors=None,
+        data=_result_json(llm_result),
+    )
+
+
+def _item_result(
+    ticket_id: Any,
+    status_value: str,
+    data: Any,
+    errors: Optional[list[str]],
+) -> Dict[str, Any]:
+    return {
+        "ticket_id": str(ticket_id),
+        "status": status_value,
+        "data": data,
+        "errors": errors,
+    }
+
+
+@router.post("/process-tickets", openapi_extra=_JSON_BODY)
+async def process_tickets(
+    request: Request,
+    llm_service: TicketClassifier = Depends(get_llm_service),
+    supabase_service: SupabaseService = Depends(get_supabase_service),
+) -> Response:
+    """Procesa un lote de tickets con concurrencia acotada y una sola escritura.
+
+    El cuerpo es ``{"tickets": [TicketProcessRequest, ...]}``. Cada ticket se
+    valida y clasifica por separado; los resultados se guardan en Supabase con
+    una sola llamada (solo actualiza tickets existentes) y la respuesta
+    incluye el resultado o error de cada uno.
+    """
+    t0 = time.perf_counter()
+    try:
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError as exc:
+        return _json(
+            status.HTTP_400_BAD_REQUEST,
+            "error",
+            "Entrada inválida.",
+            errors=[str(exc)],
+        )
+    items = payload.get("tickets") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not 1 <= len(items) <= BATCH_MAX_TICKETS:
+        return _json(
+            status.HTTP_400_BAD_REQUEST,
+            "error",
+            "Entrada inválida.",
+            errors=[
+                f"'tickets' debe ser una lista de 1 a {BATCH_MAX_TICKETS} elementos."
+            ],
+        )
+
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    valid: List[Tuple[int, TicketProcessRequest]] = []
+    for index, item in enumerate(items):
+        ticket_id_raw = (
+            item.get("ticket_id", "unknown") if isinstance(item, dict) else "unknown"
+        )
+        try:
+            valid.append((index, TicketProcessRequest.model_validate(item)))
+        except ValidationError as exc:
+            results[index] = _item_result(
+                ticket_id_raw, "error", None, [str(e) for e in exc.errors()]
+            )
+
+    outcomes = await process_batch(
+        llm_service,
+        supabase_service,
+        [request_data for _, request_data in valid],
+        BATCH_CONCURRENCY,
+    )
+    for (index, _), outcome in zip(valid, outcomes):
+        if outcome.result is None:
+            results[index] = _item_result(
+                outcome.request.ticket_id, "error", None, [outcome.error or ""]
+            )
+        else:
+            results[index] = _item_result(
+                outcome.request.ticket_id,
+                "success",
+                _result_json(outcome.result),
+                None,
+            )
+
+    failed = sum(1 for r in results if r["status"] == "error")
+    total_ms = (time.perf_counter() - t0) * 1000
+    logger.info(
+        "Batch processed: %d tickets, %d failed (%.2fms total)",
+        len(items),
+        failed,
+        total_ms,
+    )
+    return _json(
+        status.HTTP_200_OK,
+        "success" if failed == 0 else "partial",
+        "Lote procesado.",
+        data={
+            "results": results,
+            "processed": len(items) - failed,
+            "failed": failed,
+        },
+    )
+
+
+@router.get("/stats")
+async def ticket_stats(
+    stats: Optional[TicketStats] = Depends(get_ticket_stats),
+) -> Response:
+    """Totales, conteos por categoría y sentimiento e histograma de latencia.
+
+    Se sirven desde memoria (ver ``TicketStats``), sin consultar Supabase.
+    """
+    if stats is None or not stats.seeded:
+        return _json(
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            "error",
+            "Estadísticas no disponibles.",
+            errors=[
+                "TICKET_STATS_ENABLED=false."
+                if stats is None
+                else "Aún no se leyeron las estadísticas de Supabase."
+            ],
+        )
+    return _json(
+        status.HTTP_200_OK,
+        "success",
+        "Estadísticas de tickets.",
+        data=stats.snapshot(),
+    )
+
+
+@router.get("/stream/results")
+async def stream_results(
+    broadcaster: Optional[ResultBroadcaster] = Depends(get_result_stream),
+) -> Any:
+    """Stream SSE de las clasificaciones a medida que se guardan en Supabase.
+
+    Cada evento ``classification`` lleva ticket_id, category, sentiment,
+    confidence_score y processing_time_ms. Un evento ``dropped`` indica
+    cuántos se perdieron por un cliente lento; ``: ping`` es el heartbeat.
+    """
+    if broadcaster is None:
+        return _stream_unavailable("RESULT_STREAM_ENABLED=false.")
+    try:
+        subscription = broadcaster.subscribe()
+    except StreamFullError as exc:
+        return _stream_unavailable(str(exc))
+
+    async def events() -> Any:
+        try:
+            yield b"retry: 5000\n\n"
+            async for frame in subscription.frames():
+                yield frame
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream_unavailable(reason: str) -> Response:
+    return _json(
+        status.HTTP_503_SERVICE_UNAVAILABLE,
+        "error",
+        "Stream de resultados no disponible.",
+        errors=[reason],
     )
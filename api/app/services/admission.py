@@ -0,0 +1,472 @@
+"""Control de admisión adaptativo delante de las llamadas al LLM.
+
+Cuando Hugging Face se vuelve lento, las requests se acumulan esperando al
+modelo hasta que todas vencen. ``AdmissionController`` deja pasar como mucho
+``limit`` clasificaciones a la vez y ajusta ese límite con AIMD según la
+latencia observada: suma ``1 / limit`` por cada llamada correcta mientras la
+latencia reciente (media móvil) está dentro del objetivo, y lo multiplica por
+``backoff`` cuando la supera o una llamada falla (como mucho una vez por
+ventana de latencia, para que una ráfaga lenta no lo desplome). El objetivo
+es ADMISSION_TARGET_LATENCY_MS o, si es 0, ``tolerance`` veces la latencia
+base: el percentil 10 de las últimas llamadas, cercano al tiempo del modelo
+sin cola.
+
+Las llamadas que no caben esperan en una cola con prioridad: primero las más
+urgentes y, dentro de cada nivel, por orden de llegada. Con la cola llena,
+una llamada más urgente desplaza a la menos urgente en espera; si no hay a
+quién desplazar, se rechaza con ``AdmissionRejectedError`` y el endpoint
+responde 429 con ``Retry-After``.
+
+``AdmissionLLMService`` va debajo de la cascada y de las cachés: los aciertos
+de caché y las respuestas del clasificador local no hacen cola ni cuentan
+para el límite. La prioridad de la request llega con una ContextVar
+(``use_priority``).
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from app.models import SentimentType, TicketPriority, TicketProcessResponse
+from app.services import metrics
+from app.services.llm_service import (
+    LLMInvalidError,
+    LLMServiceError,
+    TicketClassifier,
+)
+
+logger = logging.getLogger(__name__)
+
+# Menor rango = se atiende antes.
+PRIORITY_RANK = {
+    TicketPriority.URGENT: 0,
+    TicketPriority.HIGH: 1,
+    TicketPriority.NORMAL: 2,
+    TicketPriority.LOW: 3,
+}
+
+# Latencia base: cuantil bajo de la ventana, cercano al modelo sin cola.
+BASELINE_QUANTILE = 0.1
+# Peso de cada muestra en la media móvil de la latencia reciente.
+RECENT_WEIGHT = 0.2
+
+WAITING = "waiting"
+GRANTED = "granted"
+REJECTED = "rejected"
+ABANDONED = "abandoned"
+
+_requested: "contextvars.ContextVar[Optional[TicketPriority]]" = (
+    contextvars.ContextVar("admission_priority", default=None)
+)
+
+
+def current_priority() -> TicketPriority:
+    """Prioridad de la request en curso (``normal`` si no se fijó)."""
+    return _requested.get() or TicketPriority.NORMAL
+
+
+@contextlib.contextmanager
+def use_priority(priority: Optional[TicketPriority]) -> Iterator[None]:
+    """Fija la prioridad para el código (y las tareas) dentro del bloque."""
+    if priority is None:
+        yield
+        return
+    token = _requested.set(priority)
+    try:
+        yield
+    finally:
+        _requested.reset(token)
+
+
+def priority_for_sentiment(sentiment: Optional[str]) -> TicketPriority:
+    """Los tickets con sentimiento negativo pasan delante de los rutinarios."""
+    if sentiment == SentimentType.NEGATIVO.value:
+        return TicketPriority.HIGH
+    return TicketPriority.NORMAL
+
+
+class AdmissionRejectedError(LLMServiceError):
+    """La llamada no se admitió: cola llena, desplazada o espera vencida."""
+
+    def __init__(self, message: str, reason: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    """Llamada en cola; la despierta un future (event loop) o un Event (hilo)."""
+
+    __slots__ = ("rank", "seq", "enqueued_at", "state", "_loop", "_future", "_event")
+
+    def __init__(
+        self, rank: int, seq: int, loop: Optional[asyncio.AbstractEventLoop]
+    ) -> None:
+        self.rank = rank
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.state = WAITING
+        self._loop = loop
+        self._future: Optional["asyncio.Future[None]"] = (
+            loop.create_future() if loop is not None else None
+        )
+        self._event = threading.Event() if loop is None else None
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+    def notify(self) -> None:
+        if self._event is not None:
+            self._event.set()
+            return
+        try:
+            self._loop.call_soon_threadsafe(_wake, self._future)
+        except RuntimeError:
+            # El loop ya se cerró (apagado del worker).
+            pass
+
+    async def wait(self, timeout: Optional[float]) -> None:
+        try:
+            await asyncio.wait_for(self._future, timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def wait_sync(self, timeout: Optional[float]) -> None:
+        self._event.wait(timeout)
+
+
+class AdmissionController:
+    """Límite AIMD de llamadas simultáneas al LLM con cola por prioridad."""
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        max_queue: int = 100,
+        queue_timeout: float = 10.0,
+        target_latency: float = 0.0,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        window: int = 256,
+    ) -> None:
+        self._min_limit = max(min_limit, 1)
+        self._max_limit = max(max_limit, self._min_limit)
+        self._max_queue = max(max_queue, 0)
+        self._queue_timeout = queue_timeout if queue_timeout > 0 else None
+        self._target_latency = target_latency
+        self._tolerance = tolerance
+        self._backoff = backoff
+        self._lock = threading.Lock()
+        self._limit = float(min(max(initial_limit, self._min_limit), self._max_limit))
+        self._in_flight = 0
+        self._queue: List[_Waiter] = []
+        self._queued = 0
+        self._seq = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._pending_samples = 0
+        self._baseline: Optional[float] = None
+        self._recent: Optional[float] = None
+        self._last_decrease = 0.0
+        self._waits: Deque[float] = deque(maxlen=2048)
+        self.admitted = 0
+        self.waited = 0
+        self.increases = 0
+        self.decreases = 0
+        self.rejected = {"queue_full": 0, "evicted": 0, "timeout": 0}
+        metrics.ADMISSION_LIMIT.inc(self._limit)
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """Crea el controlador si ADMISSION_ENABLED es true."""
+        if os.getenv("ADMISSION_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            initial_limit=int(os.getenv("ADMISSION_INITIAL_LIMIT", "16")),
+            min_limit=int(os.getenv("ADMISSION_MIN_LIMIT", "1")),
+            max_limit=int(os.getenv("ADMISSION_MAX_LIMIT", "64")),
+            max_queue=int(os.getenv("ADMISSION_QUEUE_SIZE", "100")),
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10")),
+            target_latency=float(os.getenv("ADMISSION_TARGET_LATENCY_MS", "0"))
+            / 1000,
+            tolerance=float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0")),
+            backoff=float(os.getenv("ADMISSION_BACKOFF_RATIO", "0.9")),
+        )
+
+    @property
+    def limit(self) -> int:
+        return max(int(self._limit), self._min_limit)
+
+    async def acquire(self, priority: TicketPriority) -> None:
+        """Espera un lugar para llamar al LLM desde el event loop.
+
+        Raises:
+            AdmissionRejectedError: Cola llena, desplazada por una llamada más
+                urgente o espera mayor que ADMISSION_QUEUE_TIMEOUT_SECONDS.
+        """
+        waiter = self._enter(priority, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await waiter.wait(self._queue_timeout)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._settle(waiter)
+
+    def acquire_sync(self, priority: TicketPriority) -> None:
+        """Versión bloqueante de acquire para el camino síncrono."""
+        waiter = self._enter(priority, None)
+        if waiter is None:
+            return
+        waiter.wait_sync(self._queue_timeout)
+        self._settle(waiter)
+
+    def release(self, seconds: Optional[float], failed: bool = False) -> None:
+        """Libera el lugar y ajusta el límite con la latencia de la llamada.
+
+        ``seconds=None`` libera sin muestra (llamada cancelada).
+        """
+        with self._lock:
+            in_flight = self._in_flight
+            self._in_flight -= 1
+            if seconds is not None:
+                self._adjust(seconds, failed, in_flight)
+            self._grant()
+
+    def _enter(
+        self, priority: TicketPriority, loop: Optional[asyncio.AbstractEventLoop]
+    ) -> Optional[_Waiter]:
+        """Toma un lugar libre (None) o encola la llamada."""
+        rank = PRIORITY_RANK[priority]
+        with self._lock:
+            if self._in_flight < self.limit and not self._queued:
+                self._in_flight += 1
+                self.admitted += 1
+                return None
+            if self._queued >= self._max_queue:
+                victim = self._least_urgent()
+                if victim is None or victim.rank <= rank:
+                    self._reject("queue_full")
+                    raise AdmissionRejectedError(
+                        "Cola de admisión llena.", "queue_full", self._retry_after()
+                    )
+                victim.state = REJECTED
+                self._dequeued()
+                self._reject("evicted")
+                victim.notify()
+            self._seq += 1
+            waiter = _Waiter(rank, self._seq, loop)
+            heapq.heappush(self._queue, waiter)
+            self._queued += 1
+            metrics.ADMISSION_QUEUE_DEPTH.inc()
+            if len(self._queue) > 2 * self._max_queue + 16:
+                # Quita del heap las entradas desplazadas o vencidas.
+                self._queue = [w for w in self._queue if w.state == WAITING]
+                heapq.heapify(self._queue)
+            return waiter
+
+    def _settle(self, waiter: _Waiter) -> None:
+        """Resultado de la espera: admitida o AdmissionRejectedError."""
+        with self._lock:
+            if waiter.state == GRANTED:
+                wait = time.monotonic() - waiter.enqueued_at
+                self._waits.append(wait)
+                self.waited += 1
+                metrics.ADMISSION_WAIT_SECONDS.observe(wait)
+                return
+            retry_after = self._retry_after()
+            if waiter.state == WAITING:
+                waiter.state = ABANDONED
+                self._dequeued()
+                self._reject("timeout")
+                reason, message = "timeout", "Tiempo de espera de admisión agotado."
+            else:
+                reason = "evicted"
+                message = "Desplazada de la cola por tickets más urgentes."
+        raise AdmissionRejectedError(message, reason, retry_after)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """La tarea se canceló mientras esperaba (cliente desconectado)."""
+        with self._lock:
+            if waiter.state == GRANTED:
+                self._in_flight -= 1
+                self._grant()
+            elif waiter.state == WAITING:
+                waiter.state = ABANDONED
+                self._dequeued()
+
+    def _grant(self) -> None:
+        # Se llama con self._lock tomado.
+        while self._in_flight < self.limit and self._queue:
+            waiter = heapq.heappop(self._queue)
+            if waiter.state != WAITING:
+                continue
+            waiter.state = GRANTED
+            self._dequeued()
+            self._in_flight += 1
+            self.admitted += 1
+            waiter.notify()
+
+    def _adjust(self, seconds: float, failed: bool, in_flight: int) -> None:
+        # Se llama con self._lock tomado.
+        now = time.monotonic()
+        if not failed:
+            self._record_latency(seconds)
+        target = self._target()
+        recent = self._recent if self._recent is not None else seconds
+        if failed or (target is not None and recent > target):
+            # Una sola reducción por ventana de latencia.
+            if now - self._last_decrease >= recent:
+                self._set_limit(max(self._limit * self._backoff, self._min_limit))
+                self._last_decrease = now
+                self.decreases += 1
+        elif in_flight >= self._limit / 2 and self._limit < self._max_limit:
+            # Solo crece si el límite se está usando.
+            self._set_limit(min(self._limit + 1 / self._limit, float(self._max_limit)))
+            self.increases += 1
+
+    def _record_latency(self, seconds: float) -> None:
+        self._recent = (
+            seconds
+            if self._recent is None
+            else self._recent + RECENT_WEIGHT * (seconds - self._recent)
+        )
+        self._latencies.append(seconds)
+        self._pending_samples += 1
+        # Ordenar la ventana en cada llamada sería caro; basta con recalcular
+        # la latencia base cada 32 muestras.
+        if len(self._latencies) >= 20 and (
+            self._baseline is None or self._pending_samples >= 32
+        ):
+            samples = sorted(self._latencies)
+            self._baseline = samples[int((len(samples) - 1) * BASELINE_QUANTILE)]
+            self._pending_samples = 0
+
+    def _target(self) -> Optional[float]:
+        if self._target_latency > 0:
+            return self._target_latency
+        if self._baseline is None:
+            return None
+        return self._baseline * self._tolerance
+
+    def _set_limit(self, value: float) -> None:
+        metrics.ADMISSION_LIMIT.inc(value - self._limit)
+        self._limit = value
+
+    def _least_urgent(self) -> Optional[_Waiter]:
+        waiting = [w for w in self._queue if w.state == WAITING]
+        return max(waiting, key=lambda w: (w.rank, w.seq)) if waiting else None
+
+    def _dequeued(self) -> None:
+        self._queued -= 1
+        metrics.ADMISSION_QUEUE_DEPTH.dec()
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] += 1
+        metrics.ADMISSION_REJECTIONS.labels(reason).inc()
+
+    def _retry_after(self) -> int:
+        """Segundos estimados hasta que se vacíe la cola actual."""
+        if self._recent is None:
+            seconds = self._queue_timeout or 1.0
+        else:
+            seconds = self._recent * (self._queued + 1) / self.limit
+        return min(max(math.ceil(seconds), 1), 60)
+
+    def stats(self) -> Dict[str, Any]:
+        """Límite, ocupación, cola, esperas y rechazos."""
+        with self._lock:
+            waits = sorted(self._waits)
+            target = self._target()
+            snapshot = {
+                "limit": self.limit,
+                "limit_exact": round(self._limit, 2),
+                "min_limit": self._min_limit,
+                "max_limit": self._max_limit,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "queue_size": self._max_queue,
+                "baseline_latency_ms": _ms(self._baseline),
+                "recent_latency_ms": _ms(self._recent),
+                "target_latency_ms": _ms(target),
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "rejected": dict(self.rejected),
+            }
+        snapshot["wait_p50_ms"] = _ms(waits[len(waits) // 2]) if waits else None
+        snapshot["wait_p99_ms"] = (
+            _ms(waits[int((len(waits) - 1) * 0.99)]) if waits else None
+        )
+        return snapshot
+
+
+class AdmissionLLMService:
+    """Pasa cada llamada al LLM por el control de admisión."""
+
+    def __init__(
+        self, inner: TicketClassifier, controller: AdmissionController
+    ) -> None:
+        self._inner = inner
+        self._controller = controller
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+
+    def _release(self, t0: float, exc: Optional[BaseException] = None) -> None:
+        elapsed = time.perf_counter() - t0
+        if exc is None or isinstance(exc, LLMInvalidError):
+            # Una respuesta inválida no indica sobrecarga.
+            self._controller.release(elapsed)
+        elif isinstance(exc, LLMServiceError):
+            self._controller.release(elapsed, failed=True)
+        else:
+            self._controller.release(None)
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Espera un lugar y clasifica con el servicio interno."""
+        self._controller.acquire_sync(current_priority())
+        t0 = time.perf_counter()
+        try:
+            result = self._inner.classify_ticket(ticket_text)
+        except BaseException as exc:
+            self._release(t0, exc)
+            raise
+        self._release(t0)
+        return result
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        await self._controller.acquire(current_priority())
+        t0 = time.perf_counter()
+        try:
+            result = await self._inner.aclassify_ticket(ticket_text)
+        except BaseException as exc:
+            self._release(t0, exc)
+            raise
+        self._release(t0)
+        return result
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def _wake(future: "asyncio.Future[None]") -> None:
+    if not future.done():
+        future.set_result(None)
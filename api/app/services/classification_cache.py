@@ -0,0 +1,257 @@
+"""Caché de clasificaciones direccionada por contenido.
+
+La clave es un hash de la descripción normalizada más el modelo y la versión
+del prompt, así que un cambio de modelo o de prompt invalida la caché sola.
+En el camino asíncrono, las lecturas del nivel en disco corren en un hilo y
+las escrituras en un hilo escritor propio, fuera del event loop.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.models import TicketProcessResponse
+from app.services import metrics
+from app.services.llm_service import TicketClassifier
+from app.services.output_protocol import protocol_prompt_version
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_description(text: str) -> str:
+    """Normaliza un ticket: Unicode NFKC, minúsculas y espacios colapsados."""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def cache_key(text: str, model_id: str, prompt_version: str) -> str:
+    """Hash SHA-256 de la descripción normalizada, el modelo y el prompt."""
+    material = "\x00".join((model_id, prompt_version, normalize_description(text)))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """Nivel persistente en SQLite que sobrevive reinicios del worker."""
+
+    def __init__(self, path: str, ttl_seconds: float) -> None:
+        self._lock = threading.Lock()
+        self._ttl = ttl_seconds
+        # Un solo hilo escritor: los commits no bloquean el event loop y se
+        # aplican en orden.
+        self._writer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cache-writer"
+        )
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "DELETE FROM classifications WHERE created_at < ?",
+            (time.time() - ttl_seconds,),
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[TicketProcessResponse, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM classifications WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or row[1] < time.time() - self._ttl:
+            return None
+        return TicketProcessResponse.model_validate(json.loads(row[0])), row[1]
+
+    def put(self, key: str, value: TicketProcessResponse, created_at: float) -> None:
+        """Encola la escritura en el hilo escritor; no bloquea."""
+        payload = json.dumps(value.model_dump(mode="json"), ensure_ascii=False)
+        self._writer.submit(self._write, key, payload, created_at)
+
+    def _write(self, key: str, payload: str, created_at: float) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?)",
+                    (key, payload, created_at),
+                )
+                self._conn.commit()
+        except sqlite3.Error:
+            logger.exception("Classification cache disk write failed")
+
+    def close(self) -> None:
+        """Espera las escrituras encoladas y cierra la base."""
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+class ClassificationCache:
+    """LRU en memoria con TTL y límite de tamaño, con nivel opcional en disco."""
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600.0,
+        disk_path: Optional[str] = None,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[TicketProcessResponse, float]]" = (
+            OrderedDict()
+        )
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._disk = _DiskTier(disk_path, ttl_seconds) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ClassificationCache"]:
+        """Crea la caché según CLASSIFICATION_CACHE_*; None si está desactivada."""
+        if os.getenv("CLASSIFICATION_CACHE_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            max_entries=int(os.getenv("CLASSIFICATION_CACHE_MAX_ENTRIES", "10000")),
+            ttl_seconds=float(os.getenv("CLASSIFICATION_CACHE_TTL_SECONDS", "3600")),
+            disk_path=os.getenv("CLASSIFICATION_CACHE_PATH") or None,
+        )
+
+    def get(self, key: str) -> Optional[TicketProcessResponse]:
+        """Devuelve la clasificación cacheada o None (cuenta hit/miss)."""
+        cached = self._get_memory(key)
+        if cached is not None:
+            return cached
+        stored = self._disk.get(key) if self._disk is not None else None
+        return self._from_disk(key, stored)
+
+    async def aget(self, key: str) -> Optional[TicketProcessResponse]:
+        """Como ``get``, con la lectura de disco en un hilo."""
+        cached = self._get_memory(key)
+        if cached is not None:
+            return cached
+        stored = None
+        if self._disk is not None:
+            stored = await asyncio.to_thread(self._disk.get, key)
+        return self._from_disk(key, stored)
+
+    def _get_memory(self, key: str) -> Optional[TicketProcessResponse]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] >= now - self._ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            self.expirations += 1
+        return None
+
+    def _from_disk(
+        self, key: str, stored: Optional[Tuple[TicketProcessResponse, float]]
+    ) -> Optional[TicketProcessResponse]:
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self._insert(key, stored)
+            self.hits += 1
+            self.disk_hits += 1
+        return stored[0]
+
+    def put(self, key: str, value: TicketProcessResponse) -> None:
+        """Guarda una clasificación en memoria y, si existe, en disco (sin esperar)."""
+        entry = (value, time.time())
+        with self._lock:
+            self._insert(key, entry)
+        if self._disk is not None:
+            self._disk.put(key, value, entry[1])
+
+    def _insert(self, key: str, entry: Tuple[TicketProcessResponse, float]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de hits, misses y evicciones."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def close(self) -> None:
+        """Cierra el nivel en disco."""
+        if self._disk is not None:
+            self._disk.close()
+
+
+class CachedLLMService:
+    """Envuelve un servicio LLM y evita llamarlo si el ticket ya está en caché.
+
+    Las clasificaciones con confianza 0 (respaldo mientras el LLM no responde)
+    no se guardan.
+    """
+
+    def __init__(self, inner: TicketClassifier, cache: ClassificationCache) -> None:
+        self._inner = inner
+        self._cache = cache
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+
+    def _key(self, ticket_text: str) -> str:
+        return cache_key(
+            ticket_text, self.model_id, protocol_prompt_version(self.prompt_version)
+        )
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Clasificación cacheada; solo llama al LLM en caso de miss."""
+        t0 = time.perf_counter()
+        key = self._key(ticket_text)
+        cached = self._cache.get(key)
+        metrics.CACHE_SECONDS.observe(time.perf_counter() - t0)
+        if cached is not None:
+            return cached
+        result = self._inner.classify_ticket(ticket_text)
+        if result.confidence_score > 0:
+            self._cache.put(key, result)
+        return result
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        t0 = time.perf_counter()
+        key = self._key(ticket_text)
+        cached = await self._cache.aget(key)
+        metrics.CACHE_SECONDS.observe(time.perf_counter() - t0)
+        if cached is not None:
+            return cached
+        result = await self._inner.aclassify_ticket(ticket_text)
+        if result.confidence_score > 0:
+            self._cache.put(key, result)
+        return result
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
@@ -0,0 +1,264 @@
+"""Pools HTTP keep-alive compartidos con límites configurables y estadísticas.
+
+Los servicios (Supabase, Hugging Face) reutilizan estos pools durante toda la
+vida del worker en lugar de abrir conexiones TLS nuevas en cada request.
+"""
+
+import os
+import threading
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+@dataclass(frozen=True)
+class PoolLimits:
+    """Límites de un pool de conexiones HTTP."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 30.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, prefix: str = "HTTP_POOL") -> "PoolLimits":
+        """Construye los límites desde variables de entorno.
+
+        Args:
+            prefix: Prefijo de las variables (p. ej. HTTP_POOL_MAX_CONNECTIONS).
+        """
+        defaults = cls()
+        return cls(
+            max_connections=int(
+                os.getenv(f"{prefix}_MAX_CONNECTIONS", defaults.max_connections)
+            ),
+            max_keepalive_connections=int(
+                os.getenv(
+                    f"{prefix}_MAX_KEEPALIVE",
+                    defaults.max_keepalive_connections,
+                )
+            ),
+            keepalive_expiry=float(
+                os.getenv(f"{prefix}_KEEPALIVE_EXPIRY", defaults.keepalive_expiry)
+            ),
+            timeout=float(os.getenv(f"{prefix}_TIMEOUT", defaults.timeout)),
+            http2=os.getenv(f"{prefix}_HTTP2", "false").lower() == "true",
+        )
+
+    def to_httpx(self) -> httpx.Limits:
+        """Convierte los límites al formato de httpx."""
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+class PoolStats:
+    """Contadores de uso de un pool: requests, conexiones nuevas y en vuelo."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.in_flight = 0
+        self._transports: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+    def track(self, transport: Any) -> None:
+        """Registra un transporte cuyo estado de pool se reporta en snapshot."""
+        self._transports.add(transport)
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def request_finished(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def connection_opened(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        """Devuelve conexiones abiertas, reutilizadas y requests en espera."""
+        open_connections = 0
+        idle = 0
+        waiting = 0
+        new_connections = self.new_connections
+        for transport in list(self._transports):
+            state = transport.pool_state()
+            open_connections += state["open"]
+            idle += state["idle"]
+            waiting += state["waiting"]
+            new_connections += state.get("new_connections", 0)
+        with self._lock:
+            requests_total = self.requests
+            in_flight = self.in_flight
+        return {
+            "open": open_connections,
+            "idle": idle,
+            "waiting": waiting,
+            "in_flight": in_flight,
+            "requests": requests_total,
+            "new_connections": new_connections,
+            "reused": max(requests_total - new_connections, 0),
+        }
+
+
+def _httpcore_pool_state(pool: Any) -> Dict[str, int]:
+    connections = list(getattr(pool, "connections", []))
+    queued = [r for r in getattr(pool, "_requests", []) if r.is_queued()]
+    return {
+        "open": len(connections),
+        "idle": sum(1 for c in connections if c.is_idle()),
+        "waiting": len(queued),
+    }
+
+
+class InstrumentedTransport(httpx.HTTPTransport):
+    """Transporte httpx síncrono que cuenta conexiones nuevas y reutilizadas."""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._stats = stats
+        stats.track(self)
+
+    def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name.endswith("connect_tcp.complete"):
+            self._stats.connection_opened()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions = {**request.extensions, "trace": self._trace}
+        self._stats.request_started()
+        try:
+            return super().handle_request(request)
+        finally:
+            self._stats.request_finished()
+
+    def pool_state(self) -> Dict[str, int]:
+        return _httpcore_pool_state(self._pool)
+
+
+class InstrumentedAsyncTransport(httpx.AsyncHTTPTransport):
+    """Transporte httpx asíncrono que cuenta conexiones nuevas y reutilizadas."""
+
+    def __init__(self, stats: PoolStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._stats = stats
+        stats.track(self)
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name.endswith("connect_tcp.complete"):
+            self._stats.connection_opened()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions = {**request.extensions, "trace": self._trace}
+        self._stats.request_started()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self._stats.request_finished()
+
+    def pool_state(self) -> Dict[str, int]:
+        return _httpcore_pool_state(self._pool)
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """Adapter de requests con pool acotado, usado por huggingface_hub."""
+
+    def __init__(self, stats: PoolStats, limits: PoolLimits) -> None:
+        super().__init__(
+            pool_connections=4,
+            pool_maxsize=limits.max_keepalive_connections,
+        )
+        self._stats = stats
+        self._active = 0
+        stats.track(self)
+
+    def send(
+        self, request: requests.PreparedRequest, **kwargs: Any
+    ) -> requests.Response:
+        # Cada hilo tiene su propia sesión (huggingface_hub), así que el
+        # contador local no necesita lock.
+        self._active += 1
+        self._stats.request_started()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            self._active -= 1
+            self._stats.request_finished()
+
+    def pool_state(self) -> Dict[str, int]:
+        pools = self.poolmanager.pools
+        with pools.lock:
+            host_pools = list(pools._container.values())
+        idle = 0
+        new_connections = 0
+        for host_pool in host_pools:
+            if host_pool.pool is not None:
+                idle += sum(1 for conn in list(host_pool.pool.queue) if conn)
+            new_connections += host_pool.num_connections
+        return {
+            "open": idle + self._active,
+            "idle": idle,
+            "waiting": 0,
+            "new_connections": new_connections,
+        }
+
+
+def build_httpx_client(
+    limits: PoolLimits,
+    stats: PoolStats,
+    base_url: str = "",
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.Client:
+    """Crea un cliente httpx síncrono con pool keep-alive instrumentado."""
+    transport = InstrumentedTransport(
+        stats,
+        limits=limits.to_httpx(),
+        http2=limits.http2,
+    )
+    return httpx.Client(
+        base_url=base_url,
+        headers=headers,
+        timeout=limits.timeout,
+        transport=transport,
+        follow_redirects=True,
+    )
+
+
+def build_async_httpx_client(
+    limits: PoolLimits,
+    stats: PoolStats,
+    base_url: str = "",
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.AsyncClient:
+    """Crea un cliente httpx asíncrono con pool keep-alive instrumentado."""
+    transport = InstrumentedAsyncTransport(
+        stats,
+        limits=limits.to_httpx(),
+        http2=limits.http2,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=limits.timeout,
+        transport=transport,
+        follow_redirects=True,
+    )
+
+
+def build_requests_session(limits: PoolLimits, stats: PoolStats) -> requests.Session:
+    """Crea una sesión de requests con pool acotado e instrumentado."""
+    session = requests.Session()
+    adapter = InstrumentedAdapter(stats, limits)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,309 @@
+"""Idempotencia de ``POST /process-ticket`` por ``ticket_id``.
+
+Los reintentos de n8n y los webhooks duplicados vuelven a enviar tickets que
+ya se clasificaron o que se están clasificando. ``IdempotencyStore`` recuerda
+por ticket_id los tickets terminados (con su clasificación) y los que están
+en curso: una repetición devuelve la clasificación guardada o espera a la
+request en curso, sin llamar al LLM. Los terminados vencen tras un TTL y,
+con IDEMPOTENCY_PATH, también se guardan en SQLite y sobreviven reinicios;
+las lecturas de SQLite corren en un hilo y las escrituras en un hilo escritor
+propio, fuera del event loop.
+
+``force`` en la request salta el registro y vuelve a procesar el ticket.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from app.models import TicketProcessResponse
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Claim:
+    """Resultado de ``IdempotencyStore.claim``.
+
+    ``stored`` es la clasificación ya guardada, si la hay. ``token`` identifica
+    la reserva de esta request: solo quien la tiene despierta o libera a las
+    repeticiones en espera. Es None si la request no reservó el ticket (ya
+    estaba guardado o se agotó la espera).
+    """
+
+    stored: Optional[TicketProcessResponse] = None
+    token: Optional["concurrent.futures.Future[Any]"] = None
+
+
+class _DiskTier:
+    """Tickets terminados en SQLite, para no reprocesarlos tras un reinicio."""
+
+    def __init__(self, path: str, ttl_seconds: float) -> None:
+        self._lock = threading.Lock()
+        self._ttl = ttl_seconds
+        # Un solo hilo escritor: los commits no bloquean el event loop y se
+        # aplican en orden.
+        self._writer = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="idempotency-writer"
+        )
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_tickets ("
+            "ticket_id TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+            "completed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "DELETE FROM processed_tickets WHERE completed_at < ?",
+            (time.time() - ttl_seconds,),
+        )
+        self._conn.commit()
+
+    def get(self, ticket_id: str) -> Optional[Tuple[TicketProcessResponse, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, completed_at FROM processed_tickets "
+                "WHERE ticket_id = ?",
+                (ticket_id,),
+            ).fetchone()
+        if row is None or row[1] < time.time() - self._ttl:
+            return None
+        return TicketProcessResponse.model_validate(json.loads(row[0])), row[1]
+
+    def put(
+        self, ticket_id: str, value: TicketProcessResponse, completed_at: float
+    ) -> None:
+        """Encola la escritura en el hilo escritor; no bloquea."""
+        payload = json.dumps(value.model_dump(mode="json"), ensure_ascii=False)
+        self._writer.submit(self._write, ticket_id, payload, completed_at)
+
+    def _write(self, ticket_id: str, payload: str, completed_at: float) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO processed_tickets VALUES (?, ?, ?)",
+                    (ticket_id, payload, completed_at),
+                )
+                self._conn.commit()
+        except sqlite3.Error:
+            logger.exception("Idempotency disk write failed")
+
+    def close(self) -> None:
+        """Espera las escrituras encoladas y cierra la base."""
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+class IdempotencyStore:
+    """Tickets terminados (LRU con TTL) y en curso de este worker."""
+
+    def __init__(
+        self,
+        max_entries: int = 100000,
+        ttl_seconds: float = 86400.0,
+        disk_path: Optional[str] = None,
+        wait_seconds: float = 30.0,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._done: "OrderedDict[str, Tuple[TicketProcessResponse, float]]" = (
+            OrderedDict()
+        )
+        self._in_flight: Dict[str, "concurrent.futures.Future[Any]"] = {}
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._wait_seconds = wait_seconds
+        self._disk = _DiskTier(disk_path, ttl_seconds) if disk_path else None
+        self.claims = 0
+        self.forced = 0
+        self.wait_timeouts = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.duplicates: Dict[str, int] = {
+            "memory": 0,
+            "disk": 0,
+            "in_flight": 0,
+            "supabase": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> Optional["IdempotencyStore"]:
+        """Crea el registro según IDEMPOTENCY_*; None si está desactivado."""
+        if os.getenv("IDEMPOTENCY_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000")),
+            ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+            disk_path=os.getenv("IDEMPOTENCY_PATH") or None,
+            wait_seconds=float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30")),
+        )
+
+    async def claim(self, ticket_id: str, force: bool = False) -> Claim:
+        """Reserva el ticket para la request en curso.
+
+        Si otra request lo está procesando, espera su resultado; si esa
+        request falla, vuelve a intentar la reserva. Si la espera supera
+        ``wait_seconds``, deja de esperar y esta request procesa el ticket
+        sin reservarlo: la reserva sigue siendo de la otra request.
+
+        Returns:
+            La clasificación ya guardada en ``stored``, o la reserva en
+            ``token`` (en curso hasta ``complete`` o ``release`` con ella).
+        """
+        while True:
+            if not force:
+                stored = await self._lookup(ticket_id)
+                if stored is not None:
+                    return Claim(stored=stored)
+            with self._lock:
+                future = self._in_flight.get(ticket_id)
+                if future is None:
+                    token: "concurrent.futures.Future[Any]" = (
+                        concurrent.futures.Future()
+                    )
+                    self._in_flight[ticket_id] = token
+                    self.claims += 1
+                    self.forced += force
+                    return Claim(token=token)
+            if not force:
+                self._count("in_flight")
+            # shield: si este cliente se desconecta o se agota la espera, la
+            # reserva sigue intacta.
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)), self._wait_seconds
+                )
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.wait_timeouts += 1
+                logger.warning(
+                    "Ticket %s still in flight after %gs, processing again",
+                    ticket_id,
+                    self._wait_seconds,
+                )
+                return Claim()
+            if result is not None and not force:
+                return Claim(stored=result)
+
+    async def _lookup(self, ticket_id: str) -> Optional[TicketProcessResponse]:
+        now = time.time()
+        with self._lock:
+            entry = self._done.get(ticket_id)
+            if entry is not None and entry[1] < now - self._ttl:
+                del self._done[ticket_id]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._done.move_to_end(ticket_id)
+                self.duplicates["memory"] += 1
+        if entry is not None:
+            metrics.IDEMPOTENT_DUPLICATES.labels("memory").inc()
+            return entry[0]
+        if self._disk is None:
+            return None
+        try:
+            stored = await asyncio.to_thread(self._disk.get, ticket_id)
+        except sqlite3.Error:
+            logger.exception("Idempotency disk read failed")
+            return None
+        if stored is None:
+            return None
+        with self._lock:
+            self._insert(ticket_id, stored)
+        self._count("disk")
+        return stored[0]
+
+    def complete(
+        self,
+        ticket_id: str,
+        result: TicketProcessResponse,
+        claim: Optional[Claim] = None,
+    ) -> None:
+        """Guarda la clasificación del ticket.
+
+        Con la reserva de ``claim``, la cierra y despierta a las repeticiones
+        en espera; sin ella no toca la reserva de otra request.
+        """
+        entry = (result, time.time())
+        with self._lock:
+            self._insert(ticket_id, entry)
+            future = self._pop_owned(ticket_id, claim)
+        if future is not None:
+            future.set_result(result)
+        if self._disk is not None:
+            self._disk.put(ticket_id, result, entry[1])
+
+    def complete_stored(
+        self,
+        ticket_id: str,
+        result: TicketProcessResponse,
+        claim: Optional[Claim] = None,
+    ) -> None:
+        """Como ``complete``, para un ticket que Supabase ya tenía procesado."""
+        self._count("supabase")
+        self.complete(ticket_id, result, claim)
+
+    def release(self, ticket_id: str, claim: Claim) -> None:
+        """Libera la reserva de un ticket que no se pudo procesar.
+
+        Sin efecto si ``claim`` no tiene la reserva o ya se completó.
+        """
+        with self._lock:
+            future = self._pop_owned(ticket_id, claim)
+        if future is not None:
+            future.set_result(None)
+
+    def _pop_owned(
+        self, ticket_id: str, claim: Optional[Claim]
+    ) -> Optional["concurrent.futures.Future[Any]"]:
+        if claim is None or claim.token is None:
+            return None
+        if self._in_flight.get(ticket_id) is not claim.token:
+            return None
+        return self._in_flight.pop(ticket_id)
+
+    def _insert(
+        self, ticket_id: str, entry: Tuple[TicketProcessResponse, float]
+    ) -> None:
+        self._done[ticket_id] = entry
+        self._done.move_to_end(ticket_id)
+        while len(self._done) > self._max_entries:
+            self._done.popitem(last=False)
+            self.evictions += 1
+
+    def _count(self, source: str) -> None:
+        with self._lock:
+            self.duplicates[source] += 1
+        metrics.IDEMPOTENT_DUPLICATES.labels(source).inc()
+
+    def stats(self) -> Dict[str, Any]:
+        """Tickets recordados y en curso, repeticiones suprimidas por origen."""
+        with self._lock:
+            return {
+                "entries": len(self._done),
+                "max_entries": self._max_entries,
+                "ttl_seconds": self._ttl,
+                "in_flight": len(self._in_flight),
+                "claims": self.claims,
+                "forced": self.forced,
+                "wait_timeouts": self.wait_timeouts,
+                "duplicates": dict(self.duplicates),
+                "suppressed": sum(self.duplicates.values()),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def close(self) -> None:
+        """Espera las escrituras pendientes y cierra el nivel en disco."""
+        if self._disk is not None:
+            self._disk.close()
@@ -0,0 +1,567 @@
+"""Backends de generación de texto para LLMService.
+
+``LLMService`` arma el prompt y valida la salida; el backend solo envía el
+prompt y devuelve el texto generado. Se elige con LLM_BACKEND:
+
+- ``huggingface`` (por defecto): Inference API de Hugging Face vía LangChain
+  en el camino síncrono y httpx en el asíncrono.
+- ``openai``: endpoint ``/completions`` compatible con OpenAI (vLLM,
+  llama.cpp server, LM Studio…).
+- ``tgi``: ``/generate`` y ``/generate_stream`` de Text Generation Inference.
+
+Los backends HTTP usan los pools keep-alive de ``http_pool`` con su propio
+timeout (LLM_BACKEND_TIMEOUT_SECONDS) y un límite de llamadas simultáneas
+(LLM_BACKEND_MAX_CONCURRENCY) para no saturar un servidor propio.
+
+LangChain y ``huggingface_hub`` se importan al construir el backend de
+Hugging Face, no al importar el módulo: con MOCK_LLM=true o con los backends
+``openai``/``tgi`` no se cargan nunca.
+"""
+
+import abc
+import asyncio
+import contextlib
+import dataclasses
+import json
+import logging
+import os
+import threading
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+)
+
+import httpx
+import requests
+
+from app.services.http_pool import (
+    PoolLimits,
+    PoolStats,
+    build_async_httpx_client,
+    build_httpx_client,
+    build_requests_session,
+)
+
+HF_INFERENCE_URL = "https://api-inference.huggingface.co/models"
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackendError(Exception):
+    """Error del servidor de inferencia o de su configuración."""
+
+
+class JsonObjectScanner:
+    """Detecta de forma incremental el primer objeto JSON completo de un texto.
+
+    Tiene en cuenta strings y escapes, así que una llave dentro de
+    ``reasoning`` no cierra el objeto antes de tiempo. Con ``opener="["``
+    detecta el primer arreglo.
+    """
+
+    def __init__(self, opener: str = "{") -> None:
+        self._opener = opener
+        self._closer = "]" if opener == "[" else "}"
+        self._parts: List[str] = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.result: Optional[str] = None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Consume un fragmento; devuelve el objeto en cuanto se cierra."""
+        if self.result is not None:
+            return self.result
+        start = 0
+        if not self._started:
+            start = chunk.find(self._opener)
+            if start == -1:
+                return None
+            self._started = True
+        for i in range(start, len(chunk)):
+            ch = chunk[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == self._opener:
+                self._depth += 1
+            elif ch == self._closer:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[start : i + 1])
+                    self.result = "".join(self._parts)
+                    return self.result
+        self._parts.append(chunk[start:])
+        return None
+
+
+def _tgi_stream_token(line: str) -> Optional[str]:
+    """Texto del token de una línea SSE de text-generation (TGI)."""
+    if not line.startswith("data:"):
+        return None
+    event = json.loads(line[5:])
+    if "error" in event:
+        raise LLMBackendError(str(event["error"]))
+    token = event.get("token") or {}
+    if token.get("special"):
+        return None
+    return token.get("text") or ""
+
+
+def _openai_stream_token(line: str) -> Optional[str]:
+    """Texto de una línea SSE de ``/completions`` con ``stream: true``."""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return None
+    event = json.loads(data)
+    if "error" in event:
+        raise LLMBackendError(str(event["error"]))
+    choices = event.get("choices") or [{}]
+    return choices[0].get("text") or ""
+
+
+def _collect(tokens: Iterable[Optional[str]], opener: str) -> str:
+    """Junta tokens hasta que se cierra el JSON (o se acaba el stream)."""
+    scanner = JsonObjectScanner(opener)
+    parts: List[str] = []
+    for token in tokens:
+        if token is None:
+            continue
+        parts.append(token)
+        found = scanner.feed(token)
+        if found is not None:
+            return found
+    return "".join(parts)
+
+
+async def _acollect(tokens: AsyncIterator[Optional[str]], opener: str) -> str:
+    """Versión asíncrona de _collect."""
+    scanner = JsonObjectScanner(opener)
+    parts: List[str] = []
+    async for token in tokens:
+        if token is None:
+            continue
+        parts.append(token)
+        found = scanner.feed(token)
+        if found is not None:
+            return found
+    return "".join(parts)
+
+
+class LLMBackend(Protocol):
+    """Servidor de inferencia que genera texto a partir de un prompt.
+
+    ``params`` usa los nombres de la API de text-generation de Hugging Face
+    (``max_new_tokens``, ``temperature``, ``do_sample``); cada backend los
+    traduce. Con streaming, ``opener`` indica si la respuesta esperada es un
+    objeto o un arreglo JSON para cortar la generación en cuanto se cierra.
+    """
+
+    name: str
+    streaming: bool
+
+    def generate(
+        self, prompt: str, params: Dict[str, Any], opener: str = "{"
+    ) -> str: ...
+
+    async def agenerate(
+        self, prompt: str, params: Dict[str, Any], opener: str = "{"
+    ) -> str: ...
+
+    def close(self) -> None: ...
+
+    async def aclose(self) -> None: ...
+
+    async def aprime(self) -> None: ...
+
+
+class HuggingFaceBackend:
+    """Inference API de Hugging Face (o un endpoint propio con la misma API)."""
+
+    name = "huggingface"
+
+    def __init__(
+        self,
+        model: str,
+        token: str,
+        pool_limits: PoolLimits,
+        pool_stats: PoolStats,
+        streaming: bool = False,
+    ) -> None:
+        from huggingface_hub import InferenceClient, configure_http_backend
+        from langchain_community.llms import HuggingFaceHub
+        from langchain_community.llms.huggingface_hub import VALID_TASKS_DICT
+
+        self._token = token
+        self._pool_limits = pool_limits
+        self._pool_stats = pool_stats
+        self.streaming = streaming
+        # huggingface_hub crea una sesión de requests por hilo usando esta
+        # fábrica; todas comparten límites y contadores del pool.
+        self._sessions: List[requests.Session] = []
+        configure_http_backend(backend_factory=self._build_session)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._inference_url = (
+            os.getenv("HF_INFERENCE_URL", HF_INFERENCE_URL).rstrip("/") + "/" + model
+        )
+
+        self._llm = HuggingFaceHub(
+            repo_id=model,
+            huggingfacehub_api_token=token,
+            # Con HF_TASK definido se evita consultar model_info al arrancar.
+            task=os.getenv("HF_TASK") or None,
+        )
+        if os.getenv("HF_INFERENCE_URL"):
+            # Endpoint propio (o servidor local de pruebas) también en modo síncrono.
+            self._llm.client = InferenceClient(model=self._inference_url, token=token)
+        if self.streaming and self._llm.task != "text-generation":
+            logger.warning("LLM streaming needs task text-generation, disabled")
+            self.streaming = False
+        self._response_key = VALID_TASKS_DICT.get(
+            self._llm.task or "", "generated_text"
+        )
+
+    def _build_session(self) -> requests.Session:
+        session = build_requests_session(self._pool_limits, self._pool_stats)
+        self._sessions.append(session)
+        return session
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Cliente HTTP asíncrono hacia la Inference API (se crea en el primer uso)."""
+        if self._async_client is None:
+            self._async_client = build_async_httpx_client(
+                self._pool_limits,
+                self._pool_stats,
+                headers={"Authorization": f"Bearer {self._token}"},
+            )
+        return self._async_client
+
+    def generate(self, prompt: str, params: Dict[str, Any], opener: str = "{") -> str:
+        if not self.streaming:
+            return self._llm.invoke(prompt, **params)
+        tokens = self._llm.client.text_generation(prompt, stream=True, **params)
+        try:
+            return _collect(tokens, opener)
+        finally:
+            # Cerrar el generador descarta la respuesta y corta la generación.
+            tokens.close()
+
+    async def agenerate(
+        self, prompt: str, params: Dict[str, Any], opener: str = "{"
+    ) -> str:
+        if self.streaming:
+            return await self._astream(prompt, params, opener)
+        response = await self.async_client.post(
+            self._inference_url, json={"inputs": prompt, "parameters": params}
+        )
+        body: Any = response.json()
+        if isinstance(body, dict) and "error" in body:
+            raise LLMBackendError(str(body["error"]))
+        response.raise_for_status()
+
+        if isinstance(body, list):
+            return body[0][self._response_key]
+        return body[self._response_key]
+
+    async def _astream(self, prompt: str, params: Dict[str, Any], opener: str) -> str:
+        async with self.async_client.stream(
+            "POST",
+            self._inference_url,
+            json={"inputs": prompt, "parameters": params, "stream": True},
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise LLMBackendError(response.text[:200])
+            # Salir del bloque cierra la conexión y el servidor deja de
+            # generar tokens que no se van a usar.
+            return await _acollect(_alines(response, _tgi_stream_token), opener)
+
+    def close(self) -> None:
+        """Cierra las sesiones HTTP creadas para Hugging Face."""
+        for session in self._sessions:
+            session.close()
+        self._sessions.clear()
+
+    async def aclose(self) -> None:
+        """Cierra las sesiones síncronas y el cliente asíncrono."""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    async def aprime(self) -> None:
+        """Abre una conexión keep-alive del pool asíncrono hacia la Inference API."""
+        await self.async_client.head(self._inference_url)
+
+
+def _lines(
+    response: httpx.Response, parse: Callable[[str], Optional[str]]
+) -> Iterator[Optional[str]]:
+    for line in response.iter_lines():
+        yield parse(line)
+
+
+async def _alines(
+    response: httpx.Response, parse: Callable[[str], Optional[str]]
+) -> AsyncIterator[Optional[str]]:
+    async for line in response.aiter_lines():
+        yield parse(line)
+
+
+class _HTTPBackend(abc.ABC):
+    """Base de los backends HTTP propios: pools, timeout y concurrencia.
+
+    El límite de concurrencia se aplica por camino: las llamadas síncronas
+    comparten un semáforo de hilos y las asíncronas uno del event loop. Cada
+    subclase define el cuerpo de la request y cómo leer la respuesta.
+    """
+
+    name = ""
+    path = ""
+    stream_path = ""
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        pool_limits: PoolLimits,
+        pool_stats: PoolStats,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 0,
+        streaming: bool = False,
+    ) -> None:
+        self.model = model
+        self.streaming = streaming
+        self._base_url = base_url.rstrip("/")
+        self._pool_limits = pool_limits
+        self._pool_stats = pool_stats
+        self._headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._max_concurrency = max_concurrency
+        self._limit = (
+            threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        )
+        self._alimit: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = build_httpx_client(
+                self._pool_limits, self._pool_stats, self._base_url, self._headers
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = build_async_httpx_client(
+                self._pool_limits, self._pool_stats, self._base_url, self._headers
+            )
+        return self._async_client
+
+    @abc.abstractmethod
+    def _payload(
+        self, prompt: str, params: Dict[str, Any], stream: bool
+    ) -> Dict[str, Any]:
+        """Cuerpo JSON de la request."""
+
+    @abc.abstractmethod
+    def _text(self, body: Any) -> str:
+        """Texto generado de una respuesta completa."""
+
+    @abc.abstractmethod
+    def _stream_token(self, line: str) -> Optional[str]:
+        """Token de una línea del stream, o None si no trae texto."""
+
+    def _slot(self) -> Any:
+        return self._limit if self._limit is not None else contextlib.nullcontext()
+
+    def _aslot(self) -> Any:
+        if self._max_concurrency <= 0:
+            return contextlib.nullcontext()
+        if self._alimit is None:
+            self._alimit = asyncio.Semaphore(self._max_concurrency)
+        return self._alimit
+
+    def generate(self, prompt: str, params: Dict[str, Any], opener: str = "{") -> str:
+        with self._slot():
+            if not self.streaming:
+                response = self.client.post(
+                    self.path, json=self._payload(prompt, params, False)
+                )
+                return self._text(_json_body(response))
+            with self.client.stream(
+                "POST", self.stream_path, json=self._payload(prompt, params, True)
+            ) as response:
+                if response.status_code >= 400:
+                    response.read()
+                    raise LLMBackendError(response.text[:200])
+                return _collect(_lines(response, self._stream_token), opener)
+
+    async def agenerate(
+        self, prompt: str, params: Dict[str, Any], opener: str = "{"
+    ) -> str:
+        async with self._aslot():
+            if not self.streaming:
+                response = await self.async_client.post(
+                    self.path, json=self._payload(prompt, params, False)
+                )
+                return self._text(_json_body(response))
+            async with self.async_client.stream(
+                "POST", self.stream_path, json=self._payload(prompt, params, True)
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise LLMBackendError(response.text[:200])
+                return await _acollect(_alines(response, self._stream_token), opener)
+
+    def close(self) -> None:
+        """Cierra el pool síncrono."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """Cierra los pools síncrono y asíncrono."""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    async def aprime(self) -> None:
+        """Abre una conexión keep-alive del pool asíncrono hacia el servidor."""
+        await self.async_client.head(self.path)
+
+
+def _json_body(response: httpx.Response) -> Any:
+    try:
+        body: Any = response.json()
+    except ValueError:
+        body = None
+    if isinstance(body, dict) and "error" in body:
+        raise LLMBackendError(str(body["error"]))
+    response.raise_for_status()
+    return body
+
+
+class OpenAICompatibleBackend(_HTTPBackend):
+    """Endpoint ``/completions`` compatible con OpenAI (vLLM, llama.cpp…).
+
+    ``base_url`` incluye el prefijo de la API, p. ej. ``http://vllm:8000/v1``.
+    """
+
+    name = "openai"
+    path = "/completions"
+    stream_path = "/completions"
+
+    def _payload(
+        self, prompt: str, params: Dict[str, Any], stream: bool
+    ) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": params.get("max_new_tokens"),
+            "temperature": params.get("temperature", 0.0),
+            "stream": stream,
+        }
+
+    def _text(self, body: Any) -> str:
+        try:
+            return body["choices"][0]["text"]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise LLMBackendError("Unexpected /completions response") from exc
+
+    def _stream_token(self, line: str) -> Optional[str]:
+        return _openai_stream_token(line)
+
+
+class TGIBackend(_HTTPBackend):
+    """Servidor Text Generation Inference propio (``/generate``)."""
+
+    name = "tgi"
+    path = "/generate"
+    stream_path = "/generate_stream"
+
+    def _payload(
+        self, prompt: str, params: Dict[str, Any], stream: bool
+    ) -> Dict[str, Any]:
+        # TGI rechaza temperature=0; la generación greedy es do_sample=false.
+        parameters = {
+            key: value
+            for key, value in params.items()
+            if not (key == "temperature" and not value)
+        }
+        return {"inputs": prompt, "parameters": parameters}
+
+    def _text(self, body: Any) -> str:
+        if isinstance(body, list) and body:
+            body = body[0]
+        try:
+            return body["generated_text"]
+        except (KeyError, TypeError) as exc:
+            raise LLMBackendError("Unexpected /generate response") from exc
+
+    def _stream_token(self, line: str) -> Optional[str]:
+        return _tgi_stream_token(line)
+
+
+def build_backend(
+    model: str,
+    huggingface_api_token: Optional[str] = None,
+    pool_limits: Optional[PoolLimits] = None,
+    pool_stats: Optional[PoolStats] = None,
+) -> LLMBackend:
+    """Construye el backend elegido con LLM_BACKEND.
+
+    Raises:
+        LLMBackendError: Si el backend no existe o falta su configuración.
+    """
+    kind = os.getenv("LLM_BACKEND", "huggingface").lower()
+    limits = pool_limits or PoolLimits.from_env()
+    stats = pool_stats or PoolStats()
+    streaming = os.getenv("LLM_STREAMING", "false").lower() == "true"
+
+    if kind == "huggingface":
+        token = huggingface_api_token or os.getenv("HUGGINGFACEHUB_API_TOKEN")
+        if not token:
+            raise LLMBackendError(
+                "Falta la variable HUGGINGFACEHUB_API_TOKEN en el entorno."
+            )
+        return HuggingFaceBackend(model, token, limits, stats, streaming)
+
+    backends = {"openai": OpenAICompatibleBackend, "tgi": TGIBackend}
+    if kind not in backends:
+        raise LLMBackendError(f"LLM_BACKEND desconocido: {kind}")
+    base_url = os.getenv("LLM_BACKEND_URL")
+    if not base_url:
+        raise LLMBackendError(f"LLM_BACKEND={kind} requiere LLM_BACKEND_URL.")
+    timeout = os.getenv("LLM_BACKEND_TIMEOUT_SECONDS")
+    if timeout:
+        limits = dataclasses.replace(limits, timeout=float(timeout))
+    return backends[kind](
+        base_url,
+        model,
+        limits,
+        stats,
+        api_key=os.getenv("LLM_BACKEND_API_KEY") or None,
+        max_concurrency=int(os.getenv("LLM_BACKEND_MAX_CONCURRENCY", "16")),
+        streaming=streaming,
+    )
@@ -1,13 +1,24 @@
 import json
 import logging
 import os
-from typing import Optional
+import time
+from typing import Any, List, Optional, Protocol
 
-from langchain_community.llms import HuggingFaceHub
-from langchain_core.prompts import PromptTemplate
 from pydantic import ValidationError
 
 from app.models import TicketCategory, SentimentType, TicketProcessResponse
+from app.services import metrics
+from app.services.http_pool import PoolLimits, PoolStats
+from app.services.llm_backends import (
+    JsonObjectScanner,
+    LLMBackend,
+    LLMBackendError,
+    build_backend,
+)
+from app.services.output_protocol import ResponseProtocol, current_protocol
+
+# Cambiarla al modificar el prompt invalida las clasificaciones cacheadas.
+PROMPT_VERSION = "1"
 
 logger = logging.getLogger(__name__)
 
@@ -16,12 +27,34 @@ class LLMServiceError(Exception):
     """Error de servicio para procesamiento con LLM."""
 
 
+class LLMInvalidError(LLMServiceError):
+    """Entrada vacía o salida del modelo inválida: reintentar no lo resuelve."""
+
+
+class TicketClassifier(Protocol):
+    """Interfaz común del LLM y de las capas que lo envuelven (caché, etc.)."""
+
+    model_id: str
+    prompt_version: str
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse: ...
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse: ...
+
+    def close(self) -> None: ...
+
+    async def aclose(self) -> None: ...
+
+
 class MockLLMService:
     """Mock del servicio LLM: devuelve clasificación fija sin llamar a Hugging Face.
 
     Se usa cuando MOCK_LLM=true para probar el flujo end-to-end sin IA.
     """
 
+    model_id = "mock"
+    prompt_version = PROMPT_VERSION
+
     def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
         """Devuelve una clasificación fija compatible con TicketProcessResponse."""
         return TicketProcessResponse(
@@ -31,53 +64,81 @@ class MockLLMService:
             reasoning="Clasificación mock (MOCK_LLM=true). Sin llamada a IA.",
         )
 
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        return self.classify_ticket(ticket_text)
+
+    def close(self) -> None:
+        """No mantiene conexiones abiertas."""
+
+    async def aclose(self) -> None:
+        """No mantiene conexiones abiertas."""
+
 
 class LLMService:
-    """Servicio de clasificación de tickets usando Hugging Face LLM."""
+    """Servicio de clasificación de tickets con un LLM.
+
+    Arma el prompt y valida la salida; la llamada al modelo la hace el
+    backend elegido con LLM_BACKEND (Hugging Face por defecto).
+    """
 
     def __init__(
         self,
         repo_id: Optional[str] = None,
         huggingface_api_token: Optional[str] = None,
+        pool_limits: Optional[PoolLimits] = None,
+        pool_stats: Optional[PoolStats] = None,
+        backend: Optional[LLMBackend] = None,
     ) -> None:
-        token = huggingface_api_token or os.getenv("HUGGINGFACEHUB_API_TOKEN")
-        if not token:
-            raise LLMServiceError(
-                "Falta la variable HUGGINGFACEHUB_API_TOKEN en el entorno."
-            )
-
         model_repo = (
             repo_id
             or os.getenv("HF_MODEL_ID")
             or "HuggingFaceH4/zephyr-7b-beta"
         )
-        model_kwargs = {
+        self.model_id = model_repo
+        self.prompt_version = PROMPT_VERSION
+        self._model_kwargs = {
             "temperature": 0.0,
             "max_new_tokens": 256,
             "do_sample": False,
         }
+        if backend is None:
+            try:
+                backend = build_backend(
+                    model_repo, huggingface_api_token, pool_limits, pool_stats
+                )
+            except LLMBackendError as exc:
+                raise LLMServiceError(str(exc)) from exc
+        self.backend = backend
 
-        self.mock = os.getenv("MOCK_LLM", "false").lower() == "true"
+    def close(self) -> None:
+        """Cierra las conexiones síncronas del backend."""
+        self.backend.close()
 
-        self._llm = HuggingFaceHub(
-            repo_id=model_repo,
-            huggingfacehub_api_token=token,
-            model_kwargs=model_kwargs,
-        )
-        self._prompt = PromptTemplate(
-            input_variables=["ticket_text"],
-            template=(
-                "Clasifica el siguiente ticket de soporte y responde ÚNICAMENTE con un "
-                "JSON válido, sin texto adicional antes ni después.\n\n"
-                "Categorías (usa exactamente una): Técnico, Facturación, Comercial, Otro\n"
-                "Sentimientos (usa exactamente uno): Positivo, Neutral, Negativo\n\n"
-                "Esquema JSON requerido:\n"
-                '{{"category": "<categoría>", "sentiment": "<sentimiento>", '
-                '"confidence_score": <0.0-1.0>, "reasoning": "<explicación breve>"}}\n\n'
-                "Ticket:\n{ticket_text}\n\n"
-                "Responde solo con el JSON:"
-            ),
+    async def aclose(self) -> None:
+        """Cierra todas las conexiones del backend."""
+        await self.backend.aclose()
+
+    def _build_prompt(self, ticket_text: str, protocol: ResponseProtocol) -> str:
+        if not ticket_text or not ticket_text.strip():
+            raise LLMInvalidError("El texto del ticket no puede estar vacío.")
+
+        prompt_text = protocol.prompt.format(ticket_text=ticket_text.strip())
+        logger.info("Classifying ticket (%d chars)", len(ticket_text.strip()))
+        return prompt_text
+
+    def _build_batch_prompt(
+        self, ticket_texts: List[str], protocol: ResponseProtocol
+    ) -> str:
+        if not ticket_texts or any(not t or not t.strip() for t in ticket_texts):
+            raise LLMInvalidError("El texto del ticket no puede estar vacío.")
+        # Un ticket por línea para que los índices no sean ambiguos.
+        tickets = "\n".join(
+            f"[{index}] {' '.join(text.split())}"
+            for index, text in enumerate(ticket_texts)
         )
+        logger.info("Classifying %d tickets in one prompt", len(ticket_texts))
+        return protocol.batch_prompt.format(tickets=tickets, count=len(ticket_texts))
 
     def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
         """Clasifica un ticket y devuelve la salida estructurada.
@@ -91,29 +152,115 @@ class LLMService:
         Raises:
             LLMServiceError: Si falla el procesamiento o la validación.
         """
-        if not ticket_text or not ticket_text.strip():
-            raise LLMServiceError("El texto del ticket no puede estar vacío.")
+        protocol = current_protocol()
+        prompt_text = self._build_prompt(ticket_text, protocol)
+        raw_output = self._call(prompt_text, max_new_tokens=protocol.max_new_tokens)
+        return self._parse_output(raw_output, protocol)
 
-        prompt_text = self._prompt.format(ticket_text=ticket_text.strip())
-        logger.info("Classifying ticket (%d chars)", len(ticket_text.strip()))
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Clasifica un ticket sin bloquear el event loop.
+
+        Usa el cliente HTTP asíncrono del backend, con los mismos parámetros
+        que el camino síncrono. Con LLM_STREAMING=true consume los tokens a
+        medida que llegan y corta la generación al cerrarse el JSON.
 
+        Raises:
+            LLMServiceError: Si falla el procesamiento o la validación.
+        """
+        protocol = current_protocol()
+        prompt_text = self._build_prompt(ticket_text, protocol)
+        raw_output = await self._acall(
+            prompt_text, max_new_tokens=protocol.max_new_tokens
+        )
+        return self._parse_output(raw_output, protocol)
+
+    def classify_many(
+        self, ticket_texts: List[str]
+    ) -> List[Optional[TicketProcessResponse]]:
+        """Clasifica varios tickets con un solo prompt.
+
+        Returns:
+            Una clasificación por ticket, en el mismo orden; None para los
+            tickets cuyo elemento falta o no es válido en la respuesta.
+
+        Raises:
+            LLMServiceError: Si falla la llamada al LLM.
+        """
+        protocol = current_protocol()
+        prompt_text = self._build_batch_prompt(ticket_texts, protocol)
+        raw_output = self._call(
+            prompt_text,
+            opener="[",
+            max_new_tokens=protocol.batch_tokens_per_ticket * len(ticket_texts),
+        )
+        return self._parse_many(raw_output, len(ticket_texts), protocol)
+
+    async def aclassify_many(
+        self, ticket_texts: List[str]
+    ) -> List[Optional[TicketProcessResponse]]:
+        """Versión asíncrona de classify_many."""
+        protocol = current_protocol()
+        prompt_text = self._build_batch_prompt(ticket_texts, protocol)
+        raw_output = await self._acall(
+            prompt_text,
+            opener="[",
+            max_new_tokens=protocol.batch_tokens_per_ticket * len(ticket_texts),
+        )
+        return self._parse_many(raw_output, len(ticket_texts), protocol)
+
+    def _call(self, prompt_text: str, opener: str = "{", **overrides: Any) -> str:
+        metrics.LLM_IN_FLIGHT.inc()
+        t_llm = time.perf_counter()
         try:
-            raw_output = self._llm.invoke(prompt_text)
+            return self.backend.generate(
+                prompt_text, {**self._model_kwargs, **overrides}, opener
+            )
+        except LLMServiceError:
+            raise
+        except Exception as exc:
+            logger.error("LLM invoke failed: %s", exc)
+            raise LLMServiceError(
+                "Error al procesar el ticket con el LLM."
+            ) from exc
+        finally:
+            metrics.LLM_IN_FLIGHT.dec()
+            metrics.LLM_SECONDS.observe(time.perf_counter() - t_llm)
+
+    async def _acall(
+        self, prompt_text: str, opener: str = "{", **overrides: Any
+    ) -> str:
+        metrics.LLM_IN_FLIGHT.inc()
+        t_llm = time.perf_counter()
+        try:
+            return await self.backend.agenerate(
+                prompt_text, {**self._model_kwargs, **overrides}, opener
+            )
+        except LLMServiceError:
+            raise
         except Exception as exc:
             logger.error("LLM invoke failed: %s", exc)
             raise LLMServiceError(
                 "Error al procesar el ticket con el LLM."
             ) from exc
+        finally:
+            metrics.LLM_IN_FLIGHT.dec()
+            metrics.LLM_SECONDS.observe(time.perf_counter() - t_llm)
 
+    def _parse_output(
+        self, raw_output: str, protocol: ResponseProtocol
+    ) -> TicketProcessResponse:
+        t0 = time.perf_counter()
         cleaned = self._extract_json(raw_output)
         try:
             payload = json.loads(cleaned)
         except json.JSONDecodeError as exc:
             logger.error("LLM returned invalid JSON: %s", exc)
-            raise LLMServiceError(
+            raise LLMInvalidError(
                 "El LLM no devolvió un JSON válido."
             ) from exc
 
+        if isinstance(payload, dict):
+            payload = protocol.decode(payload)
         try:
             if hasattr(TicketProcessResponse, "model_validate"):
                 result = TicketProcessResponse.model_validate(payload)
@@ -121,9 +268,10 @@ class LLMService:
                 result = TicketProcessResponse.parse_obj(payload)
         except ValidationError as exc:
             logger.error("LLM output validation failed: %s", exc.errors())
-            raise LLMServiceError(
+            raise LLMInvalidError(
                 "El JSON del LLM no cumple el esquema esperado."
             ) from exc
+        metrics.JSON_SECONDS.observe(time.perf_counter() - t0)
 
         logger.info(
             "Classified: %s / %s (confidence %.2f)",
@@ -133,20 +281,44 @@ class LLMService:
         )
         return result
 
+    def _parse_many(
+        self, raw_output: str, count: int, protocol: ResponseProtocol
+    ) -> List[Optional[TicketProcessResponse]]:
+        """Valida cada elemento del arreglo; los inválidos quedan en None."""
+        t0 = time.perf_counter()
+        results: List[Optional[TicketProcessResponse]] = [None] * count
+        found = JsonObjectScanner("[").feed(raw_output or "")
+        try:
+            payload = json.loads(found) if found is not None else None
+        except json.JSONDecodeError as exc:
+            logger.warning("LLM returned invalid JSON array: %s", exc)
+            payload = None
+        if not isinstance(payload, list):
+            logger.warning("LLM batch output is not a JSON array")
+            return results
+        for position, item in enumerate(payload):
+            if not isinstance(item, dict):
+                continue
+            item = protocol.decode(item)
+            index = item.pop("index", position)
+            if not isinstance(index, int) or not 0 <= index < count:
+                continue
+            if results[index] is not None:
+                continue
+            try:
+                results[index] = TicketProcessResponse.model_validate(item)
+            except ValidationError:
+                continue
+        metrics.JSON_SECONDS.observe(time.perf_counter() - t0)
+        missing = results.count(None)
+        if missing:
+            logger.warning("LLM batch output missing %d of %d tickets", missing, count)
+        return results
+
     def _extract_json(self, text: str) -> str:
         """Extrae JSON del texto de salida del LLM."""
         if not text:
             return "{}"
         cleaned = text.strip()
-        start_idx = cleaned.find("{")
-        if start_idx == -1:
-            return cleaned
-        depth = 0
-        for i in range(start_idx, len(cleaned)):
-            if cleaned[i] == "{":
-                depth += 1
-            elif cleaned[i] == "}":
-                depth -= 1
-                if depth == 0:
-                    return cleaned[start_idx : i + 1]
-        return cleaned
+        found = JsonObjectScanner().feed(cleaned)
+        return found if found is not None else cleaned
@@ -0,0 +1,328 @@
+"""Clasificador local TF-IDF + Naive Bayes para responder sin llamar al LLM.
+
+El modelo se entrena offline con tickets ya etiquetados (ver
+``train_classifier.py``) y se guarda como un directorio de arrays ``.npy``
+que se cargan con memory-map, así que varios workers comparten las páginas.
+
+La predicción que ``predict_local`` hace para la prioridad de admisión
+queda en una ContextVar y la cascada la reutiliza para el mismo ticket.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models import SentimentType, TicketCategory, TicketProcessResponse
+from app.services.llm_service import TicketClassifier
+from app.services.near_duplicate import canonicalize
+
+logger = logging.getLogger(__name__)
+
+MODEL_VERSION = "tfidf-nb-1"
+# Inicio del reasoning de las respuestas del modelo local.
+LOCAL_REASONING_PREFIX = "Clasificación local"
+HEADS = ("category", "sentiment")
+
+Prediction = Dict[str, Tuple[str, float]]
+
+# Última predicción local de la request: (modelo, texto, predicción).
+_last_prediction: "contextvars.ContextVar[Optional[Tuple[Any, str, Prediction]]]" = (
+    contextvars.ContextVar("local_prediction", default=None)
+)
+
+
+def featurize(text: str, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Índices y pesos TF (log1p) de palabras y bigramas con hashing trick."""
+    words = canonicalize(text).split()
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not tokens:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    hashed = np.fromiter(
+        (zlib.crc32(token.encode("utf-8")) for token in tokens),
+        dtype=np.int64,
+        count=len(tokens),
+    ) % n_features
+    indices, counts = np.unique(hashed, return_counts=True)
+    return indices, np.log1p(counts).astype(np.float32)
+
+
+class LocalClassifier:
+    """Modelo TF-IDF + Naive Bayes multinomial para categoría y sentimiento."""
+
+    def __init__(
+        self,
+        idf: np.ndarray,
+        coefs: Dict[str, np.ndarray],
+        biases: Dict[str, np.ndarray],
+        labels: Dict[str, List[str]],
+    ) -> None:
+        self._idf = idf
+        self._coefs = coefs
+        self._biases = biases
+        self._labels = labels
+        self.n_features = int(idf.shape[0])
+
+    @classmethod
+    def load(cls, path: str) -> "LocalClassifier":
+        """Carga un artefacto con memory-map (solo lectura)."""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        if meta.get("version") != MODEL_VERSION:
+            raise ValueError(f"Versión de modelo no soportada: {meta.get('version')}.")
+
+        def array(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        return cls(
+            idf=array("idf"),
+            coefs={head: array(f"{head}_coef") for head in HEADS},
+            biases={head: array(f"{head}_bias") for head in HEADS},
+            labels=meta["labels"],
+        )
+
+    def save(self, path: str, extra_meta: Optional[Dict[str, Any]] = None) -> None:
+        """Guarda el modelo como arrays .npy más un meta.json."""
+        os.makedirs(path, exist_ok=True)
+        np.save(
+            os.path.join(path, "idf.npy"), np.asarray(self._idf, dtype=np.float32)
+        )
+        for head in HEADS:
+            np.save(
+                os.path.join(path, f"{head}_coef.npy"),
+                np.asarray(self._coefs[head], dtype=np.float32),
+            )
+            np.save(
+                os.path.join(path, f"{head}_bias.npy"),
+                np.asarray(self._biases[head], dtype=np.float32),
+            )
+        meta = {"version": MODEL_VERSION, "labels": self._labels, **(extra_meta or {})}
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def train(
+        cls,
+        texts: Sequence[str],
+        categories: Sequence[str],
+        sentiments: Sequence[str],
+        n_features: int = 1 << 18,
+        alpha: float = 0.1,
+    ) -> "LocalClassifier":
+        """Entrena ambos clasificadores con NumPy (sin dependencias extra)."""
+        features = [featurize(text, n_features) for text in texts]
+        doc_freq = np.zeros(n_features, dtype=np.float64)
+        for indices, _ in features:
+            doc_freq[indices] += 1
+        idf = (np.log((1 + len(texts)) / (1 + doc_freq)) + 1).astype(np.float32)
+        weighted = [
+            (indices, _l2(values * idf[indices])) for indices, values in features
+        ]
+
+        coefs: Dict[str, np.ndarray] = {}
+        biases: Dict[str, np.ndarray] = {}
+        labels: Dict[str, List[str]] = {
+            "category": [c.value for c in TicketCategory],
+            "sentiment": [s.value for s in SentimentType],
+        }
+        targets = {"category": categories, "sentiment": sentiments}
+        for head in HEADS:
+            head_labels = labels[head]
+            counts = np.zeros((n_features, len(head_labels)), dtype=np.float64)
+            priors = np.zeros(len(head_labels), dtype=np.float64)
+            for (indices, values), label in zip(weighted, targets[head]):
+                column = head_labels.index(label)
+                np.add.at(counts[:, column], indices, values)
+                priors[column] += 1
+            smoothed = counts + alpha
+            coefs[head] = np.log(smoothed / smoothed.sum(axis=0)).astype(np.float32)
+            priors = (priors + 1) / (priors.sum() + len(priors))
+            biases[head] = np.log(priors).astype(np.float32)
+        return cls(idf=idf, coefs=coefs, biases=biases, labels=labels)
+
+    def predict(self, text: str) -> Dict[str, Tuple[str, float]]:
+        """Etiqueta y probabilidad más alta para cada cabeza."""
+        indices, values = featurize(text, self.n_features)
+        weights = _l2(values * self._idf[indices])
+        predictions: Dict[str, Tuple[str, float]] = {}
+        for head in HEADS:
+            scores = weights @ self._coefs[head][indices] + self._biases[head]
+            probs = np.exp(scores - scores.max())
+            probs /= probs.sum()
+            best = int(probs.argmax())
+            predictions[head] = (self._labels[head][best], float(probs[best]))
+        return predictions
+
+
+def _l2(values: np.ndarray) -> np.ndarray:
+    norm = float(np.sqrt(np.dot(values, values)))
+    return values / norm if norm else values
+
+
+class _PathStats:
+    """Conteo y percentiles de latencia de un camino de la cascada."""
+
+    def __init__(self, window: int = 2048) -> None:
+        self.count = 0
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self._samples.append(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "p50_ms": None, "p99_ms": None}
+        return {
+            "count": self.count,
+            "p50_ms": round(samples[len(samples) // 2], 3),
+            "p99_ms": round(samples[int((len(samples) - 1) * 0.99)], 3),
+        }
+
+
+class CascadeLLMService:
+    """Responde con el clasificador local si es confiable; si no, escala al LLM."""
+
+    def __init__(
+        self,
+        inner: TicketClassifier,
+        local: LocalClassifier,
+        threshold: float = 0.9,
+    ) -> None:
+        self._inner = inner
+        self._local = local
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._paths = {"local": _PathStats(), "llm": _PathStats()}
+        self.reused_predictions = 0
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+
+    @classmethod
+    def from_env(cls, inner: TicketClassifier) -> TicketClassifier:
+        """Envuelve ``inner`` si LOCAL_CLASSIFIER_PATH apunta a un modelo válido."""
+        path = os.getenv("LOCAL_CLASSIFIER_PATH")
+        if not path:
+            return inner
+        try:
+            local = LocalClassifier.load(path)
+        except (OSError, ValueError, KeyError):
+            logger.exception("Local classifier not loaded from %s", path)
+            return inner
+        threshold = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+        return cls(inner, local, threshold)
+
+    def predict_local(self, ticket_text: str) -> Prediction:
+        """Predicción del clasificador local, sin escalar al LLM.
+
+        Queda en el contexto de la request para que la cascada no la repita.
+        """
+        predictions = self._local.predict(ticket_text)
+        _last_prediction.set((self._local, ticket_text, predictions))
+        return predictions
+
+    def _predict(self, ticket_text: str) -> Prediction:
+        last = _last_prediction.get()
+        if last is not None and last[0] is self._local and last[1] == ticket_text:
+            with self._lock:
+                self.reused_predictions += 1
+            return last[2]
+        return self._local.predict(ticket_text)
+
+    def _try_local(
+        self, ticket_text: str, t0: float
+    ) -> Optional[TicketProcessResponse]:
+        predictions = self._predict(ticket_text)
+        category, category_conf = predictions["category"]
+        sentiment, sentiment_conf = predictions["sentiment"]
+        confidence = min(category_conf, sentiment_conf)
+        if confidence < self._threshold:
+            return None
+        result = TicketProcessResponse(
+            category=category,
+            sentiment=sentiment,
+            confidence_score=round(confidence, 4),
+            reasoning=(
+                f"{LOCAL_REASONING_PREFIX} ({MODEL_VERSION}), sin llamada al LLM."
+            ),
+        )
+        self._record("local", t0)
+        return result
+
+    def _record(self, path: str, t0: float) -> None:
+        with self._lock:
+            self._paths[path].record((time.perf_counter() - t0) * 1000)
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Clasificación local o, si no supera el umbral, del LLM."""
+        t0 = time.perf_counter()
+        result = self._try_local(ticket_text, t0)
+        if result is not None:
+            return result
+        result = self._inner.classify_ticket(ticket_text)
+        self._record("llm", t0)
+        return result
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        t0 = time.perf_counter()
+        result = self._try_local(ticket_text, t0)
+        if result is not None:
+            return result
+        result = await self._inner.aclassify_ticket(ticket_text)
+        self._record("llm", t0)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Tasa de escalado al LLM y latencias p50/p99 de cada camino."""
+        with self._lock:
+            local = self._paths["local"].snapshot()
+            llm = self._paths["llm"].snapshot()
+        total = local["count"] + llm["count"]
+        return {
+            "threshold": self._threshold,
+            "escalation_rate": round(llm["count"] / total, 4) if total else None,
+            "reused_predictions": self.reused_predictions,
+            "local": local,
+            "llm": llm,
+        }
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def load_training_rows(
+    rows: Iterable[Dict[str, Any]],
+) -> Tuple[List[str], List[str], List[str]]:
+    """Filtra filas de ``tickets`` etiquetadas y devuelve textos y etiquetas.
+
+    Descarta los respaldos (confianza 0) y las clasificaciones del propio
+    modelo local: entrenar con ellas reforzaría sus errores.
+    """
+    categories = {c.value for c in TicketCategory}
+    sentiments = {s.value for s in SentimentType}
+    texts: List[str] = []
+    cats: List[str] = []
+    sents: List[str] = []
+    for row in rows:
+        confidence = row.get("confidence_score")
+        if confidence is not None and float(confidence) == 0:
+            continue
+        if str(row.get("reasoning") or "").startswith(LOCAL_REASONING_PREFIX):
+            continue
+        if row.get("category") in categories and row.get("sentiment") in sentiments:
+            texts.append(row["description"])
+            cats.append(row["category"])
+            sents.append(row["sentiment"])
+    return texts, cats, sents
@@ -0,0 +1,98 @@
+"""Logging fuera del hilo de la request.
+
+Los handlers del root logger se reemplazan por un ``QueueHandler`` que solo
+encola el registro; un ``QueueListener`` en un hilo propio le da formato
+(JSON o texto) y lo escribe en stdout. Así una escritura lenta a stdout no
+frena el event loop ni el threadpool.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Any, Dict, Optional
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro.
+
+    Los campos de ``extra={"fields": {...}}`` se agregan al objeto.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self._timestamp(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if isinstance(fields, dict):
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _timestamp(created: float) -> str:
+        seconds = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(created))
+        return f"{seconds}.{int(created % 1 * 1000):03d}Z"
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler que deja el formato al hilo del listener.
+
+    ``QueueHandler.prepare`` formatea el registro completo en el hilo que
+    loguea; aquí solo se resuelve el mensaje (los argumentos podrían cambiar
+    después) y el resto se formatea al escribir.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(
+    level: int, stream: Optional[IO[str]] = None
+) -> Optional[QueueListener]:
+    """Configura el root logger según LOG_FORMAT, LOG_QUEUE_ENABLED y LOG_LEVEL.
+
+    Los registros se escriben en ``stream`` (stdout por defecto).
+
+    Returns:
+        El listener en marcha, o None si los logs se escriben en el hilo que
+        los emite (LOG_QUEUE_ENABLED=false).
+    """
+    level_name = os.getenv("LOG_LEVEL")
+    if level_name:
+        level = logging.getLevelName(level_name.upper())
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.setLevel(level)
+
+    if os.getenv("LOG_QUEUE_ENABLED", "true").lower() != "true":
+        root.addHandler(handler)
+        return None
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    # Vacía la cola al salir para no perder los últimos registros.
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,307 @@
+"""Métricas en proceso (histogramas, contadores y gauges) en formato Prometheus.
+
+Cada hilo escribe en su propio shard sin tomar locks; solo ``render()``
+recorre los shards para sumarlos, así que registrar una muestra cuesta unos
+pocos microsegundos en el camino de la request.
+"""
+
+import bisect
+import os
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+class _Sharded:
+    """Vector de valores con un shard por hilo."""
+
+    def __init__(self, size: int) -> None:
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[List[float]] = []
+
+    def shard(self) -> List[float]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = [0.0] * self._size
+            with self._lock:
+                self._shards.append(values)
+            self._local.values = values
+            return values
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0.0] * self._size
+        for values in shards:
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+
+class Counter:
+    """Contador monótono."""
+
+    def __init__(self) -> None:
+        self._values = _Sharded(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._values.shard()[0] += amount
+
+    def value(self) -> float:
+        return self._values.totals()[0]
+
+
+class Gauge:
+    """Valor que sube y baja (p. ej. operaciones en curso)."""
+
+    def __init__(self) -> None:
+        self._values = _Sharded(1)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._values.shard()[0] += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._values.shard()[0] -= amount
+
+    def value(self) -> float:
+        return self._values.totals()[0]
+
+
+class Histogram:
+    """Histograma de buckets fijos con suma y conteo."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # Un contador por bucket, uno para +Inf y la suma de observaciones.
+        self._values = _Sharded(len(self.buckets) + 2)
+
+    def observe(self, value: float) -> None:
+        values = self._values.shard()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """Conteos acumulados por bucket (incluido +Inf), suma y total."""
+        totals = self._values.totals()
+        cumulative: List[float] = []
+        running = 0.0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1], running
+
+
+Metric = TypeVar("Metric", bound=Union[Counter, Gauge, Histogram])
+
+
+class _Family(Generic[Metric]):
+    """Métrica con nombre, ayuda y etiquetas; un hijo por combinación."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        labelnames: Sequence[str],
+        factory: Callable[[], Metric],
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], Metric] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> Metric:
+        """Hijo para los valores de etiqueta dados (se crea una sola vez)."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in sorted(children, key=lambda item: item[0]):
+            labels = _format_labels(self.labelnames, values)
+            if isinstance(child, Histogram):
+                cumulative, total, count = child.snapshot()
+                bounds = [_format_value(b) for b in child.buckets] + ["+Inf"]
+                for bound, value in zip(bounds, cumulative):
+                    bucket_labels = _format_labels(
+                        self.labelnames + ("le",), values + (bound,)
+                    )
+                    yield f"{self.name}_bucket{bucket_labels} {_format_value(value)}"
+                yield f"{self.name}_sum{labels} {_format_value(total)}"
+                yield f"{self.name}_count{labels} {_format_value(count)}"
+            else:
+                yield f"{self.name}{labels} {_format_value(child.value())}"
+
+
+class MetricsRegistry:
+    """Conjunto de métricas del proceso."""
+
+    def __init__(self, prefix: str = "support_copilot_") -> None:
+        self._prefix = prefix
+        self._families: List[_Family] = []
+
+    def counter(
+        self, name: str, help_text: str, labelnames: Sequence[str] = ()
+    ) -> _Family[Counter]:
+        family = _Family(self._prefix + name, help_text, "counter", labelnames, Counter)
+        self._families.append(family)
+        return family
+
+    def gauge(
+        self, name: str, help_text: str, labelnames: Sequence[str] = ()
+    ) -> _Family[Gauge]:
+        family = _Family(self._prefix + name, help_text, "gauge", labelnames, Gauge)
+        self._families.append(family)
+        return family
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> _Family[Histogram]:
+        family = _Family(
+            self._prefix + name,
+            help_text,
+            "histogram",
+            labelnames,
+            lambda: Histogram(buckets),
+        )
+        self._families.append(family)
+        return family
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus."""
+        lines: List[str] = []
+        for family in self._families:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(family.samples())
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_duration_seconds",
+    "Duración de cada etapa del procesamiento de un ticket.",
+    ["stage"],
+)
+CLASSIFICATIONS = REGISTRY.counter(
+    "classifications_total",
+    "Tickets clasificados por categoría y sentimiento.",
+    ["category", "sentiment"],
+)
+ERRORS = REGISTRY.counter("errors_total", "Errores por tipo.", ["type"])
+IN_FLIGHT = REGISTRY.gauge("in_flight", "Operaciones en curso por etapa.", ["stage"])
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total",
+    "Requests HTTP por método, ruta y código de estado.",
+    ["method", "route", "status"],
+)
+LLM_RESILIENCE_EVENTS = REGISTRY.counter(
+    "llm_resilience_events_total",
+    "Reintentos, hedges, deadlines y respaldos alrededor del LLM.",
+    ["event"],
+)
+LLM_CIRCUIT_OPEN = REGISTRY.gauge(
+    "llm_circuit_open", "1 mientras el circuit breaker del LLM está abierto."
+).labels()
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "admission_queue_depth", "Llamadas al LLM esperando en la cola de admisión."
+).labels()
+ADMISSION_LIMIT = REGISTRY.gauge(
+    "admission_limit", "Límite adaptativo de llamadas simultáneas al LLM."
+).labels()
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "admission_wait_seconds",
+    "Espera en la cola de admisión de las llamadas admitidas.",
+).labels()
+ADMISSION_REJECTIONS = REGISTRY.counter(
+    "admission_rejections_total",
+    "Llamadas rechazadas por la admisión (queue_full, evicted, timeout).",
+    ["reason"],
+)
+IDEMPOTENT_DUPLICATES = REGISTRY.counter(
+    "idempotent_duplicates_total",
+    "Repeticiones de /process-ticket respondidas sin llamar al LLM, por origen "
+    "(memory, disk, in_flight, supabase).",
+    ["source"],
+)
+WORKER_INFO = REGISTRY.gauge(
+    "worker_info", "Proceso que atiende este scrape (uno por worker).", ["pid"]
+)
+WORKER_INFO.labels(str(os.getpid())).inc()
+
+# Hijos resueltos de antemano para no buscar etiquetas en el camino caliente.
+VALIDATION_SECONDS = STAGE_SECONDS.labels("validation")
+CACHE_SECONDS = STAGE_SECONDS.labels("cache")
+LLM_SECONDS = STAGE_SECONDS.labels("llm")
+JSON_SECONDS = STAGE_SECONDS.labels("json_extraction")
+SUPABASE_SECONDS = STAGE_SECONDS.labels("supabase")
+TOTAL_SECONDS = STAGE_SECONDS.labels("total")
+REQUESTS_IN_FLIGHT = IN_FLIGHT.labels("request")
+LLM_IN_FLIGHT = IN_FLIGHT.labels("llm")
+SUPABASE_IN_FLIGHT = IN_FLIGHT.labels("supabase")
+
+
+def record_error(error_type: str) -> None:
+    """Suma un error del tipo dado (validation, llm, supabase, unexpected)."""
+    ERRORS.labels(error_type).inc()
@@ -0,0 +1,199 @@
+"""Micro-batching: varios tickets por llamada al LLM.
+
+Cada llamada a Hugging Face paga un costo fijo (prompt, cola del servidor,
+primer token) aunque el ticket sea corto. ``MicroBatchingLLMService`` junta
+los tickets que llegan dentro de una ventana corta (o los de un mismo lote de
+``/process-tickets``, que se clasifican en paralelo) y los envía en un solo
+prompt que pide un arreglo JSON. Los tickets cuyo elemento falta o no es
+válido se clasifican de nuevo con una llamada individual.
+
+Solo se agrupan los tickets que usan el protocolo de salida del despliegue;
+los que piden otro por request van en llamadas individuales.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.models import TicketProcessResponse
+from app.services.llm_service import LLMService, TicketClassifier
+from app.services.output_protocol import current_protocol, default_protocol
+
+# Resultado de un ticket del lote: None significa "clasificar individualmente".
+_Slot = Optional[TicketProcessResponse]
+
+
+class MicroBatchingLLMService:
+    """Agrupa clasificaciones concurrentes en prompts de varios tickets."""
+
+    def __init__(
+        self, inner: LLMService, window_ms: float = 20.0, max_tickets: int = 8
+    ) -> None:
+        self._inner = inner
+        self._window = window_ms / 1000
+        self._max_tickets = max(max_tickets, 1)
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+        # Camino síncrono: el primer hilo de cada lote espera la ventana y
+        # hace la llamada; los demás esperan su Future.
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[str, "concurrent.futures.Future[_Slot]"]] = []
+        self._generation = 0
+        # Camino asíncrono: un timer del event loop dispara el lote.
+        self._apending: List[Tuple[str, "asyncio.Future[_Slot]"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._stats_lock = threading.Lock()
+        self._counts = {
+            "batches": 0,
+            "batched_tickets": 0,
+            "single_fallbacks": 0,
+            "failed_batches": 0,
+        }
+
+    @classmethod
+    def from_env(cls, inner: TicketClassifier) -> TicketClassifier:
+        """Envuelve ``inner`` si LLM_BATCH_ENABLED=true y es el LLM real."""
+        if os.getenv("LLM_BATCH_ENABLED", "false").lower() != "true":
+            return inner
+        if not isinstance(inner, LLMService):
+            return inner
+        return cls(
+            inner,
+            window_ms=float(os.getenv("LLM_BATCH_WINDOW_MS", "20")),
+            max_tickets=int(os.getenv("LLM_BATCH_MAX_TICKETS", "8")),
+        )
+
+    @staticmethod
+    def _batchable(ticket_text: str) -> bool:
+        if not ticket_text or not ticket_text.strip():
+            return False
+        return current_protocol() is default_protocol()
+
+    def _record(self, size: int, missing: int, failed: bool = False) -> None:
+        with self._stats_lock:
+            self._counts["batches"] += 1
+            self._counts["batched_tickets"] += size
+            self._counts["single_fallbacks"] += missing
+            self._counts["failed_batches"] += failed
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Clasifica el ticket dentro del próximo lote."""
+        if not self._batchable(ticket_text):
+            return self._inner.classify_ticket(ticket_text)
+        future: "concurrent.futures.Future[_Slot]" = concurrent.futures.Future()
+        batch: List[Tuple[str, "concurrent.futures.Future[_Slot]"]] = []
+        with self._cond:
+            self._pending.append((ticket_text, future))
+            generation = self._generation
+            if len(self._pending) >= self._max_tickets:
+                batch = self._take()
+            elif len(self._pending) == 1:
+                self._cond.wait_for(
+                    lambda: self._generation != generation, timeout=self._window
+                )
+                if self._generation == generation:
+                    batch = self._take()
+        if batch:
+            self._run(batch)
+        result = future.result()
+        if result is None:
+            return self._inner.classify_ticket(ticket_text)
+        return result
+
+    def _take(self) -> List[Tuple[str, "concurrent.futures.Future[_Slot]"]]:
+        # Se llama con self._cond tomado.
+        batch, self._pending = self._pending, []
+        self._generation += 1
+        self._cond.notify_all()
+        return batch
+
+    def _run(
+        self, batch: List[Tuple[str, "concurrent.futures.Future[_Slot]"]]
+    ) -> None:
+        if len(batch) == 1:
+            batch[0][1].set_result(None)
+            return
+        try:
+            results = self._inner.classify_many([text for text, _ in batch])
+        except Exception as exc:
+            self._record(len(batch), 0, failed=True)
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        self._record(len(batch), results.count(None))
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        if not self._batchable(ticket_text):
+            return await self._inner.aclassify_ticket(ticket_text)
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[_Slot]" = loop.create_future()
+        self._apending.append((ticket_text, future))
+        if len(self._apending) >= self._max_tickets:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        result = await future
+        if result is None:
+            return await self._inner.aclassify_ticket(ticket_text)
+        return result
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Los tickets cuyo cliente ya se fue no entran en el prompt.
+        batch = [(text, f) for text, f in self._apending if not f.done()]
+        self._apending = []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._arun(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _arun(self, batch: List[Tuple[str, "asyncio.Future[_Slot]"]]) -> None:
+        if len(batch) == 1:
+            _set(batch[0][1], None)
+            return
+        try:
+            results = await self._inner.aclassify_many([text for text, _ in batch])
+        except Exception as exc:
+            self._record(len(batch), 0, failed=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self._record(len(batch), results.count(None))
+        for (_, future), result in zip(batch, results):
+            _set(future, result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lotes enviados, tamaño medio y tickets reenviados de forma individual."""
+        with self._stats_lock:
+            counts = dict(self._counts)
+        return {
+            **counts,
+            "avg_batch_size": (
+                round(counts["batched_tickets"] / counts["batches"], 2)
+                if counts["batches"]
+                else None
+            ),
+            "window_ms": self._window * 1000,
+            "max_tickets": self._max_tickets,
+        }
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def _set(future: "asyncio.Future[Any]", value: Any) -> None:
+    if not future.done():
+        future.set_result(value)
@@ -0,0 +1,313 @@
+"""Índice en memoria de tickets casi duplicados (MinHash + LSH).
+
+Detecta tickets que solo difieren en nombres, números de factura o
+puntuación y reutiliza la clasificación de uno procesado recientemente en
+lugar de llamar al LLM. Cada entrada pertenece a un alcance (modelo y versión
+del prompt): un cambio de modelo o de prompt no reutiliza clasificaciones
+anteriores. El reasoning reutilizado no es el del otro ticket, sino una nota
+que indica la reutilización y la similitud.
+
+El índice se carga al arrancar con los tickets ya procesados y se actualiza
+tras cada escritura en Supabase (listener de SupabaseService). Las filas con
+una clasificación reutilizada no se indexan: ya está indexado el original.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from pydantic import ValidationError
+
+from app.models import TicketProcessResponse
+from app.services.classification_cache import normalize_description
+from app.services.llm_service import TicketClassifier
+from app.services.output_protocol import protocol_prompt_version
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_NUMBER_RE = re.compile(r"\d+")
+_PUNCT_RE = re.compile(r"[^\w\s]")
+REUSED_REASONING = "Clasificación reutilizada de un ticket casi idéntico"
+
+
+def canonicalize(text: str) -> str:
+    """Normaliza, quita tildes y sustituye números y puntuación."""
+    text = unicodedata.normalize("NFKD", normalize_description(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _NUMBER_RE.sub("0", text)
+    return " ".join(_PUNCT_RE.sub(" ", text).split())
+
+
+def near_duplicate_scope(model_id: str, prompt_version: str) -> str:
+    """Alcance de las entradas: modelo y versión del prompt (y del protocolo)."""
+    return f"{model_id}\x00{protocol_prompt_version(prompt_version)}"
+
+
+def reused_result(
+    result: TicketProcessResponse, similarity: float
+) -> TicketProcessResponse:
+    """Clasificación reutilizada, con un reasoning propio en lugar del original."""
+    return result.model_copy(
+        update={
+            "reasoning": (
+                f"{REUSED_REASONING} (similitud {similarity:.2f}), sin llamada al LLM."
+            )
+        }
+    )
+
+
+def shingles(text: str, k: int) -> Set[str]:
+    """Conjunto de k-gramas de caracteres del texto canónico."""
+    canonical = canonicalize(text)
+    if len(canonical) <= k:
+        return {canonical}
+    return {canonical[i : i + k] for i in range(len(canonical) - k + 1)}
+
+
+class _Entry:
+    __slots__ = ("signature", "result", "inserted_at", "band_keys")
+
+    def __init__(
+        self,
+        signature: np.ndarray,
+        result: TicketProcessResponse,
+        inserted_at: float,
+        band_keys: List[bytes],
+    ) -> None:
+        self.signature = signature
+        self.result = result
+        self.inserted_at = inserted_at
+        self.band_keys = band_keys
+
+
+class NearDuplicateIndex:
+    """Índice MinHash/LSH con tamaño máximo y TTL.
+
+    Con ``bands`` bandas de ``num_perm / bands`` filas, dos tickets son
+    candidatos si coinciden en alguna banda; después se exige que la
+    similitud de Jaccard estimada supere ``threshold``.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        max_entries: int = 50000,
+        ttl_seconds: float = 7 * 24 * 3600.0,
+        max_candidates: int = 100,
+        seed: int = 1,
+    ) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm debe ser múltiplo de bands.")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self._rows = num_perm // bands
+        self._shingle_size = shingle_size
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._max_candidates = max_candidates
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self.lookups = 0
+        self.hits = 0
+        self.candidates_checked = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["NearDuplicateIndex"]:
+        """Crea el índice según NEAR_DUP_*; None si está desactivado."""
+        if os.getenv("NEAR_DUP_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            threshold=float(os.getenv("NEAR_DUP_THRESHOLD", "0.8")),
+            num_perm=int(os.getenv("NEAR_DUP_NUM_PERM", "64")),
+            bands=int(os.getenv("NEAR_DUP_BANDS", "16")),
+            max_entries=int(os.getenv("NEAR_DUP_MAX_ENTRIES", "50000")),
+            ttl_seconds=float(os.getenv("NEAR_DUP_TTL_SECONDS", "604800")),
+            max_candidates=int(os.getenv("NEAR_DUP_MAX_CANDIDATES", "100")),
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """Firma MinHash (uint32) de un texto."""
+        grams = shingles(text, self._shingle_size)
+        hashes = np.fromiter(
+            (zlib.crc32(gram.encode("utf-8")) for gram in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        ) % _MERSENNE_PRIME
+        permuted = np.outer(self._a, hashes) + self._b[:, None]
+        permuted %= _MERSENNE_PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray, scope: str) -> List[bytes]:
+        # El alcance forma parte de la clave: otro alcance nunca es candidato.
+        prefix = scope.encode("utf-8") + b"\x00"
+        return [
+            prefix + signature[i * self._rows : (i + 1) * self._rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+    def add(
+        self, key: str, text: str, result: TicketProcessResponse, scope: str = ""
+    ) -> None:
+        """Indexa (o reemplaza) la clasificación de un ticket en ``scope``."""
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature, scope)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(signature, result, time.time(), band_keys)
+            for band, band_key in zip(self._buckets, band_keys):
+                band.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band, band_key in zip(self._buckets, entry.band_keys):
+            members = band.get(band_key)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del band[band_key]
+
+    def lookup(self, text: str, scope: str = "") -> Optional[TicketProcessResponse]:
+        """Clasificación de un ticket de ``scope`` que supere el umbral de similitud.
+
+        Devuelve el primer candidato suficientemente parecido, con el
+        reasoning de ``reused_result``; como mucho se comparan
+        ``max_candidates`` firmas para acotar la latencia durante tormentas de
+        tickets repetidos.
+        """
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature, scope)
+        cutoff = time.time() - self._ttl
+        min_matches = self.threshold * self.num_perm
+        seen: Set[str] = set()
+        with self._lock:
+            self.lookups += 1
+            for band, band_key in zip(self._buckets, band_keys):
+                for key in band.get(band_key, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    entry = self._entries[key]
+                    matches = np.count_nonzero(entry.signature == signature)
+                    if entry.inserted_at >= cutoff and matches >= min_matches:
+                        self.candidates_checked += len(seen)
+                        self.hits += 1
+                        return reused_result(entry.result, matches / self.num_perm)
+                    if len(seen) >= self._max_candidates:
+                        self.candidates_checked += len(seen)
+                        return None
+            self.candidates_checked += len(seen)
+        return None
+
+    def add_row(self, row: Dict[str, Any], scope: str = "") -> None:
+        """Indexa una fila de ``tickets`` en ``scope``.
+
+        También es el listener de SupabaseService: indexa cada ticket guardado.
+        """
+        description = row.get("description")
+        if not description or not row.get("category"):
+            return
+        if (row.get("reasoning") or "").startswith(REUSED_REASONING):
+            return
+        try:
+            result = TicketProcessResponse(
+                category=row["category"],
+                sentiment=row["sentiment"],
+                confidence_score=float(row["confidence_score"]),
+                reasoning=row.get("reasoning") or "",
+            )
+        except (KeyError, TypeError, ValueError, ValidationError):
+            return
+        if result.confidence_score <= 0:
+            # Clasificación de respaldo: no se reutiliza para otros tickets.
+            return
+        self.add(str(row["id"]), description, result, scope)
+
+    def seed(self, rows: Iterable[Dict[str, Any]], scope: str = "") -> int:
+        """Construye el índice con filas ya procesadas (más antiguas primero).
+
+        ``tickets`` no guarda qué modelo ni qué prompt clasificó cada fila:
+        se asume que fueron los de ``scope``.
+        """
+        count = 0
+        for row in rows:
+            self.add_row(row, scope)
+            count += 1
+        logger.info("Near-duplicate index seeded with %d tickets", count)
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño, memoria estimada y contadores del índice."""
+        with self._lock:
+            entries = len(self._entries)
+            bucket_keys = sum(len(band) for band in self._buckets)
+            return {
+                "entries": entries,
+                "max_entries": self._max_entries,
+                "threshold": self.threshold,
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "signature_bytes": entries * self.num_perm * 4,
+                "bucket_keys": bucket_keys,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "candidates_checked": self.candidates_checked,
+                "evictions": self.evictions,
+            }
+
+
+class NearDuplicateLLMService:
+    """Envuelve un servicio LLM y reutiliza clasificaciones de casi duplicados.
+
+    Solo busca en el alcance de su modelo y prompt; las respuestas se indexan
+    al guardarse en Supabase.
+    """
+
+    def __init__(self, inner: TicketClassifier, index: NearDuplicateIndex) -> None:
+        self._inner = inner
+        self._index = index
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Devuelve la clasificación de un casi duplicado o llama al LLM."""
+        scope = near_duplicate_scope(self.model_id, self.prompt_version)
+        match = self._index.lookup(ticket_text, scope)
+        if match is not None:
+            return match
+        return self._inner.classify_ticket(ticket_text)
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        scope = near_duplicate_scope(self.model_id, self.prompt_version)
+        match = self._index.lookup(ticket_text, scope)
+        if match is not None:
+            return match
+        return await self._inner.aclassify_ticket(ticket_text)
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
@@ -0,0 +1,214 @@
+"""Protocolos de respuesta del LLM: completo y compacto.
+
+El protocolo ``full`` pide las categorías y sentimientos con sus nombres en
+español y un ``reasoning`` libre. El ``compact`` pide códigos de una letra,
+la confianza como entero 0-100 y un motivo de pocas palabras, lo que reduce
+los tokens generados (y la latencia) por clasificación. Ambos se decodifican
+al mismo ``TicketProcessResponse``.
+
+El protocolo se elige por despliegue (LLM_OUTPUT_PROTOCOL) o por request
+(campo ``output_protocol``), que se propaga con una ContextVar hasta el
+LLMService.
+
+Los prompts se analizan una sola vez al importar el módulo (``Prompt``), sin
+LangChain: formatear un prompt es concatenar sus partes fijas con el texto.
+"""
+
+import contextlib
+import contextvars
+import os
+import string
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from app.models import OutputProtocol, SentimentType, TicketCategory
+
+REASONING_MAX_CHARS = 300
+
+CATEGORY_CODES = {
+    "T": TicketCategory.TECNICO.value,
+    "F": TicketCategory.FACTURACION.value,
+    "C": TicketCategory.COMERCIAL.value,
+    "O": TicketCategory.OTRO.value,
+}
+SENTIMENT_CODES = {
+    "+": SentimentType.POSITIVO.value,
+    "0": SentimentType.NEUTRAL.value,
+    "-": SentimentType.NEGATIVO.value,
+}
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """Plantilla de prompt precompilada (sintaxis de ``str.format``).
+
+    Las llaves dobles son literales. Solo admite campos simples, sin
+    conversiones ni formatos, y exige todas las variables al formatear.
+    """
+
+    template: str
+    _parts: Tuple[Tuple[str, Optional[str]], ...] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        parts = []
+        for literal, name, spec, conversion in string.Formatter().parse(
+            self.template
+        ):
+            if spec or conversion or (name is not None and not name.isidentifier()):
+                raise ValueError(f"Campo no soportado en el prompt: {name!r}")
+            parts.append((literal, name))
+        object.__setattr__(self, "_parts", tuple(parts))
+
+    def format(self, **values: Any) -> str:
+        return "".join(
+            literal if name is None else literal + str(values[name])
+            for literal, name in self._parts
+        )
+
+
+@dataclass(frozen=True)
+class ResponseProtocol:
+    """Prompts, presupuesto de tokens y decodificación de un protocolo."""
+
+    name: OutputProtocol
+    prompt: Prompt
+    batch_prompt: Prompt
+    max_new_tokens: int
+    batch_tokens_per_ticket: int
+    decode: Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+def _decode_full(item: Dict[str, Any]) -> Dict[str, Any]:
+    return item
+
+
+def _decode_compact(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Traduce ``{"c","s","p","r"}`` a los campos de TicketProcessResponse.
+
+    Los códigos desconocidos se dejan tal cual para que la validación del
+    esquema los rechace.
+    """
+    category = str(item.get("c", "")).strip()
+    sentiment = str(item.get("s", "")).strip()
+    decoded: Dict[str, Any] = {
+        "category": CATEGORY_CODES.get(category.upper(), category),
+        "sentiment": SENTIMENT_CODES.get(sentiment, sentiment),
+        "confidence_score": _decode_confidence(item.get("p")),
+        "reasoning": str(item.get("r") or "")[:REASONING_MAX_CHARS],
+    }
+    if "i" in item:
+        decoded["index"] = item["i"]
+    return decoded
+
+
+def _decode_confidence(value: Any) -> Any:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    # El modelo a veces responde 0.9 en lugar de 90.
+    score = float(value) / 100 if value > 1 else float(value)
+    return min(max(score, 0.0), 1.0)
+
+
+FULL = ResponseProtocol(
+    name=OutputProtocol.FULL,
+    prompt=Prompt(
+        "Clasifica el siguiente ticket de soporte y responde ÚNICAMENTE con un "
+        "JSON válido, sin texto adicional antes ni después.\n\n"
+        "Categorías (usa exactamente una): Técnico, Facturación, Comercial, Otro\n"
+        "Sentimientos (usa exactamente uno): Positivo, Neutral, Negativo\n\n"
+        "Esquema JSON requerido:\n"
+        '{{"category": "<categoría>", "sentiment": "<sentimiento>", '
+        '"confidence_score": <0.0-1.0>, "reasoning": "<explicación breve>"}}\n\n'
+        "Ticket:\n{ticket_text}\n\n"
+        "Responde solo con el JSON:"
+    ),
+    batch_prompt=Prompt(
+        "Clasifica cada uno de los siguientes {count} tickets de soporte y "
+        "responde ÚNICAMENTE con un arreglo JSON válido con un objeto por "
+        "ticket, sin texto adicional antes ni después.\n\n"
+        "Categorías (usa exactamente una): Técnico, Facturación, Comercial, Otro\n"
+        "Sentimientos (usa exactamente uno): Positivo, Neutral, Negativo\n\n"
+        "Esquema de cada elemento (index es el número entre corchetes):\n"
+        '{{"index": <número>, "category": "<categoría>", '
+        '"sentiment": "<sentimiento>", "confidence_score": <0.0-1.0>, '
+        '"reasoning": "<explicación breve>"}}\n\n'
+        "Tickets:\n{tickets}\n\n"
+        "Responde solo con el arreglo JSON:"
+    ),
+    max_new_tokens=256,
+    batch_tokens_per_ticket=96,
+    decode=_decode_full,
+)
+
+COMPACT = ResponseProtocol(
+    name=OutputProtocol.COMPACT,
+    prompt=Prompt(
+        "Clasifica el ticket de soporte. Responde ÚNICAMENTE con este JSON "
+        "compacto, sin texto adicional:\n"
+        '{{"c": "<categoría>", "s": "<sentimiento>", "p": <confianza 0-100>, '
+        '"r": "<motivo, máximo 8 palabras>"}}\n'
+        "c: T=Técnico, F=Facturación, C=Comercial, O=Otro\n"
+        "s: +=Positivo, 0=Neutral, -=Negativo\n\n"
+        "Ticket:\n{ticket_text}\n\n"
+        "JSON:"
+    ),
+    batch_prompt=Prompt(
+        "Clasifica cada uno de los {count} tickets de soporte. Responde "
+        "ÚNICAMENTE con un arreglo JSON compacto, un objeto por ticket, sin "
+        "texto adicional:\n"
+        '[{{"i": <número entre corchetes>, "c": "<categoría>", '
+        '"s": "<sentimiento>", "p": <confianza 0-100>, '
+        '"r": "<motivo, máximo 8 palabras>"}}]\n'
+        "c: T=Técnico, F=Facturación, C=Comercial, O=Otro\n"
+        "s: +=Positivo, 0=Neutral, -=Negativo\n\n"
+        "Tickets:\n{tickets}\n\n"
+        "JSON:"
+    ),
+    max_new_tokens=48,
+    batch_tokens_per_ticket=40,
+    decode=_decode_compact,
+)
+
+PROTOCOLS = {FULL.name: FULL, COMPACT.name: COMPACT}
+
+_requested: contextvars.ContextVar[Optional[OutputProtocol]] = contextvars.ContextVar(
+    "output_protocol", default=None
+)
+
+
+def default_protocol() -> ResponseProtocol:
+    """Protocolo del despliegue (LLM_OUTPUT_PROTOCOL, por defecto ``full``)."""
+    name = os.getenv("LLM_OUTPUT_PROTOCOL", OutputProtocol.FULL.value).lower()
+    try:
+        return PROTOCOLS[OutputProtocol(name)]
+    except ValueError:
+        return FULL
+
+
+def current_protocol() -> ResponseProtocol:
+    """Protocolo pedido por la request en curso o, si no pidió, el del despliegue."""
+    requested = _requested.get()
+    return PROTOCOLS[requested] if requested is not None else default_protocol()
+
+
+def protocol_prompt_version(prompt_version: str) -> str:
+    """Versión del prompt para claves de caché; ``full`` conserva las existentes."""
+    protocol = current_protocol()
+    if protocol is FULL:
+        return prompt_version
+    return f"{prompt_version}+{protocol.name.value}"
+
+
+@contextlib.contextmanager
+def use_protocol(name: Optional[OutputProtocol]) -> Iterator[None]:
+    """Fija el protocolo para el código (y las tareas) dentro del bloque."""
+    if name is None:
+        yield
+        return
+    token = _requested.set(name)
+    try:
+        yield
+    finally:
+        _requested.reset(token)
@@ -0,0 +1,203 @@
+"""Pasos compartidos de clasificación y persistencia de tickets.
+
+Los usan los endpoints y el worker de cola. Con ASYNC_PIPELINE=false los
+servicios síncronos se ejecutan en el threadpool.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.models import (
+    OutputProtocol,
+    TicketPriority,
+    TicketProcessRequest,
+    TicketProcessResponse,
+)
+from app.services import metrics
+from app.services.admission import AdmissionRejectedError, use_priority
+from app.services.llm_service import LLMServiceError, TicketClassifier
+from app.services.output_protocol import use_protocol
+from app.services.supabase_service import (
+    BulkUpdateResult,
+    SupabaseService,
+    SupabaseServiceError,
+    TicketAlreadyProcessedError,
+    build_ticket_row,
+)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_PIPELINE = os.getenv("ASYNC_PIPELINE", "true").lower() == "true"
+
+
+@dataclass
+class BatchOutcome:
+    """Resultado de un ticket dentro de un lote."""
+
+    request: TicketProcessRequest
+    result: Optional[TicketProcessResponse] = None
+    processing_time_ms: int = 0
+    error: Optional[str] = None
+    # El ticket ya estaba procesado: ``result`` es la clasificación guardada.
+    already_processed: bool = False
+
+
+async def classify(
+    llm_service: TicketClassifier,
+    description: str,
+    protocol: Optional[OutputProtocol] = None,
+    priority: Optional[TicketPriority] = None,
+) -> TicketProcessResponse:
+    """Clasifica un ticket con el camino asíncrono o el síncrono.
+
+    ``protocol`` fuerza el protocolo de respuesta del LLM para esta llamada y
+    ``priority`` su lugar en la cola de admisión.
+    """
+    try:
+        with use_protocol(protocol), use_priority(priority):
+            if ASYNC_PIPELINE:
+                result = await llm_service.aclassify_ticket(description)
+            else:
+                result = await run_in_threadpool(
+                    llm_service.classify_ticket, description
+                )
+    except AdmissionRejectedError:
+        raise
+    except LLMServiceError:
+        metrics.record_error("llm")
+        raise
+    metrics.CLASSIFICATIONS.labels(result.category.value, result.sentiment.value).inc()
+    return result
+
+
+async def update_ticket(
+    supabase_service: SupabaseService,
+    request_data: TicketProcessRequest,
+    result: TicketProcessResponse,
+    processing_time_ms: int,
+) -> None:
+    """Persiste la clasificación de un ticket.
+
+    Salvo con ``force``, no sobrescribe un ticket ya procesado (lanza
+    TicketAlreadyProcessedError).
+    """
+    kwargs = dict(
+        ticket_id=request_data.ticket_id,
+        category=result.category,
+        sentiment=result.sentiment,
+        confidence_score=result.confidence_score,
+        reasoning=result.reasoning,
+        processing_time_ms=processing_time_ms,
+        description=request_data.description,
+        only_unprocessed=not request_data.force,
+    )
+    metrics.SUPABASE_IN_FLIGHT.inc()
+    t0 = time.perf_counter()
+    try:
+        if ASYNC_PIPELINE:
+            await supabase_service.aupdate_ticket_by_id(**kwargs)
+        else:
+            await run_in_threadpool(supabase_service.update_ticket_by_id, **kwargs)
+    except TicketAlreadyProcessedError:
+        raise
+    except SupabaseServiceError:
+        metrics.record_error("supabase")
+        raise
+    finally:
+        metrics.SUPABASE_IN_FLIGHT.dec()
+        metrics.SUPABASE_SECONDS.observe(time.perf_counter() - t0)
+
+
+async def bulk_update(
+    supabase_service: SupabaseService, rows: List[Dict[str, Any]]
+) -> BulkUpdateResult:
+    """Persiste varias clasificaciones con una sola llamada (solo actualiza)."""
+    metrics.SUPABASE_IN_FLIGHT.inc()
+    t0 = time.perf_counter()
+    try:
+        if ASYNC_PIPELINE:
+            return await supabase_service.abulk_update_tickets(rows)
+        return await run_in_threadpool(supabase_service.bulk_update_tickets, rows)
+    except SupabaseServiceError:
+        metrics.record_error("supabase")
+        raise
+    finally:
+        metrics.SUPABASE_IN_FLIGHT.dec()
+        metrics.SUPABASE_SECONDS.observe(time.perf_counter() - t0)
+
+
+async def process_batch(
+    llm_service: TicketClassifier,
+    supabase_service: SupabaseService,
+    requests: Sequence[TicketProcessRequest],
+    concurrency: int,
+) -> List[BatchOutcome]:
+    """Clasifica con concurrencia acotada y guarda los aciertos en una llamada.
+
+    Los tickets que no existen en Supabase quedan con error y los ya
+    procesados (salvo con ``force``) no se sobrescriben: devuelven la
+    clasificación guardada. Si la llamada falla, todos los tickets
+    clasificados se marcan con error.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def classify_one(request_data: TicketProcessRequest) -> BatchOutcome:
+        async with semaphore:
+            t_llm = time.perf_counter()
+            try:
+                result = await classify(
+                    llm_service,
+                    request_data.description,
+                    request_data.output_protocol,
+                    request_data.priority,
+                )
+            except LLMServiceError as exc:
+                logger.error(
+                    "LLM error for ticket %s: %s", request_data.ticket_id, exc
+                )
+                return BatchOutcome(request_data, error=str(exc))
+            llm_ms = int((time.perf_counter() - t_llm) * 1000)
+            return BatchOutcome(request_data, result, llm_ms)
+
+    outcomes = await asyncio.gather(*(classify_one(r) for r in requests))
+    succeeded = [o for o in outcomes if o.result is not None]
+    rows = [
+        build_ticket_row(
+            ticket_id=o.request.ticket_id,
+            description=o.request.description,
+            category=o.result.category,
+            sentiment=o.result.sentiment,
+            confidence_score=o.result.confidence_score,
+            reasoning=o.result.reasoning,
+            processing_time_ms=o.processing_time_ms,
+            force=o.request.force,
+        )
+        for o in succeeded
+        if o.result is not None
+    ]
+    try:
+        written = await bulk_update(supabase_service, rows)
+    except SupabaseServiceError as exc:
+        logger.error("Supabase bulk update failed for %d tickets: %s", len(rows), exc)
+        for outcome in succeeded:
+            outcome.result = None
+            outcome.error = str(exc)
+        return list(outcomes)
+    not_found = set(written.not_found)
+    for outcome in succeeded:
+        ticket_id = str(outcome.request.ticket_id)
+        if ticket_id in not_found:
+            outcome.result = None
+            outcome.error = "No se encontró el ticket para actualizar."
+        elif ticket_id in written.already_processed:
+            outcome.already_processed = True
+            outcome.result = written.already_processed[ticket_id]
+            if outcome.result is None:
+                outcome.error = "El ticket ya estaba procesado."
+    return list(outcomes)
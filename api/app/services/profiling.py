@@ -0,0 +1,366 @@
+"""Profiling bajo demanda de ``POST /process-ticket``.
+
+Con PROFILING_ENABLED=true y PROFILING_ADMIN_TOKEN, el middleware perfila
+una de cada PROFILING_SAMPLE_EVERY requests y las que traen el token en el
+header ``X-Profile-Token``. Mientras dura la request, un hilo muestrea su
+tarea cada PROFILING_INTERVAL_MS:
+
+- si la tarea está ejecutando, toma la pila del event loop (muestra de CPU);
+- si está suspendida, recorre su cadena de ``await`` hasta lo que espera
+  (muestra de reloj, con una hoja ``<await ...>``).
+
+Cada muestra pesa el tiempo real transcurrido desde la anterior. Se muestrea
+la tarea y no el hilo porque, en el event loop, un profiler determinista
+como cProfile mezclaría las corrutinas de todas las requests concurrentes.
+
+Se conservan en memoria los PROFILING_KEEP perfiles más lentos, con los
+tiempos por etapa de ``process_ticket``, y se exportan en formato speedscope
+o pstats (``/debug/profiles``). Sin PROFILING_ENABLED no hay muestreo ni
+hilos: el middleware solo compara la ruta.
+"""
+
+import heapq
+import hmac
+import itertools
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from types import FrameType
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rutas que se pueden perfilar.
+PROFILED_PATHS = frozenset({"/process-ticket"})
+PROFILE_HEADER = b"x-profile-token"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# (archivo, primera línea, nombre calificado), como las claves de pstats.
+Frame = Tuple[str, int, str]
+Stack = Tuple[Frame, ...]
+
+
+@dataclass
+class RequestProfile:
+    """Muestras de una request perfilada y su resultado."""
+
+    id: int
+    path: str
+    reason: str
+    started_at: float
+    # (pila de la raíz a la hoja, peso en segundos, ¿estaba en CPU?)
+    samples: List[Tuple[Stack, float, bool]] = field(default_factory=list)
+    status: int = 0
+    duration_ms: float = 0.0
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, Any]:
+        cpu = sum(weight for _, weight, running in self.samples if running)
+        return {
+            "id": self.id,
+            "path": self.path,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3),
+            "cpu_ms": round(cpu * 1000, 3),
+            "samples": len(self.samples),
+            "stages": self.stages,
+        }
+
+
+class _Sampler(threading.Thread):
+    """Hilo que muestrea la tarea de una request hasta ``stop``."""
+
+    def __init__(
+        self,
+        profile: RequestProfile,
+        task: Any,
+        root: FrameType,
+        interval: float,
+    ) -> None:
+        super().__init__(name=f"profiler-{profile.id}", daemon=True)
+        self._profile = profile
+        self._task = task
+        self._root = root
+        self._thread_id = threading.get_ident()
+        self._interval = interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        last = time.perf_counter()
+        while not self._stopped.wait(self._interval):
+            now = time.perf_counter()
+            try:
+                sample = _task_stack(self._task, self._root, self._thread_id)
+            except Exception:
+                # La pila cambió mientras se recorría.
+                sample = None
+            if sample is not None:
+                self._profile.samples.append((sample[0], now - last, sample[1]))
+            last = now
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def _frame_key(frame: FrameType) -> Frame:
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_qualname
+
+
+def _task_stack(
+    task: Any, root: FrameType, thread_id: int
+) -> Optional[Tuple[Stack, bool]]:
+    """Pila de la tarea desde ``root`` y si estaba ejecutando."""
+    frame = sys._current_frames().get(thread_id)
+    running: List[FrameType] = []
+    while frame is not None:
+        running.append(frame)
+        if frame is root:
+            return tuple(_frame_key(f) for f in reversed(running)), True
+        frame = frame.f_back
+    # La tarea no está en el hilo: se sigue su cadena de awaits.
+    chain: List[FrameType] = []
+    awaited = task.get_coro()
+    while hasattr(awaited, "cr_frame"):
+        if awaited.cr_frame is None:
+            return None
+        chain.append(awaited.cr_frame)
+        awaited = awaited.cr_await
+    if root not in chain:
+        return None
+    chain = chain[chain.index(root):]
+    kind = type(awaited).__name__
+    leaf = ("~", 0, f"<await {'Future' if kind == 'FutureIter' else kind}>")
+    return tuple(_frame_key(f) for f in chain) + (leaf,), False
+
+
+class ProfileSession:
+    """Perfil en curso de una request."""
+
+    def __init__(self, profile: RequestProfile, sampler: _Sampler) -> None:
+        self.profile = profile
+        self._sampler = sampler
+
+
+class RequestProfiler:
+    """Decide qué requests perfilar y guarda las más lentas."""
+
+    def __init__(
+        self,
+        admin_token: str,
+        sample_every: int = 0,
+        keep: int = 20,
+        interval: float = 0.001,
+        max_active: int = 4,
+    ) -> None:
+        self._admin_token = admin_token.encode()
+        self._sample_every = sample_every
+        self._keep = keep
+        self._interval = interval
+        self._max_active = max_active
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._seen = 0
+        self._active = 0
+        # Min-heap por duración: la raíz es el perfil más rápido que se guarda.
+        self._slowest: List[Tuple[float, int, RequestProfile]] = []
+        self.profiled = 0
+        self.skipped = 0
+        self.discarded = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["RequestProfiler"]:
+        """Crea el profiler según PROFILING_*; None si está desactivado."""
+        if os.getenv("PROFILING_ENABLED", "false").lower() != "true":
+            return None
+        token = os.getenv("PROFILING_ADMIN_TOKEN", "")
+        if not token:
+            logger.warning("PROFILING_ENABLED without PROFILING_ADMIN_TOKEN, disabled")
+            return None
+        return cls(
+            token,
+            sample_every=int(os.getenv("PROFILING_SAMPLE_EVERY", "0")),
+            keep=int(os.getenv("PROFILING_KEEP", "20")),
+            interval=float(os.getenv("PROFILING_INTERVAL_MS", "1")) / 1000,
+        )
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """True si ``token`` es el token de administración."""
+        if not token:
+            return False
+        return hmac.compare_digest(token.encode(), self._admin_token)
+
+    def _reason(self, headers: Iterable[Tuple[bytes, bytes]]) -> Optional[str]:
+        for name, value in headers:
+            if name == PROFILE_HEADER:
+                if hmac.compare_digest(value, self._admin_token):
+                    return "header"
+                break
+        with self._lock:
+            self._seen += 1
+            if self._sample_every > 0 and self._seen % self._sample_every == 0:
+                return "sampled"
+        return None
+
+    def start(
+        self,
+        path: str,
+        headers: Iterable[Tuple[bytes, bytes]],
+        task: Any,
+        root: FrameType,
+    ) -> Optional[ProfileSession]:
+        """Empieza a perfilar la request si corresponde.
+
+        Args:
+            task: Tarea asyncio que atiende la request.
+            root: Frame desde el que se toman las pilas (el del middleware).
+        """
+        reason = self._reason(headers)
+        if reason is None:
+            return None
+        with self._lock:
+            if self._active >= self._max_active:
+                self.skipped += 1
+                return None
+            self._active += 1
+        profile = RequestProfile(next(self._ids), path, reason, time.time())
+        sampler = _Sampler(profile, task, root, self._interval)
+        sampler.start()
+        return ProfileSession(profile, sampler)
+
+    def finish(
+        self,
+        session: ProfileSession,
+        status_code: int,
+        duration_ms: float,
+        stages: Optional[Dict[str, float]],
+    ) -> None:
+        """Detiene el muestreo y guarda el perfil si está entre los más lentos."""
+        session._sampler.stop()
+        profile = session.profile
+        profile.status = status_code
+        profile.duration_ms = duration_ms
+        profile.stages = stages or {}
+        with self._lock:
+            self._active -= 1
+            self.profiled += 1
+            entry = (duration_ms, profile.id, profile)
+            if len(self._slowest) < self._keep:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+                self.discarded += 1
+
+    def profiles(self) -> List[RequestProfile]:
+        """Perfiles guardados, del más lento al más rápido."""
+        with self._lock:
+            return [p for _, _, p in sorted(self._slowest, reverse=True)]
+
+    def get(self, profile_id: int) -> Optional[RequestProfile]:
+        return next((p for p in self.profiles() if p.id == profile_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests perfiladas, en curso, omitidas y perfiles guardados."""
+        with self._lock:
+            return {
+                "sample_every": self._sample_every,
+                "interval_ms": self._interval * 1000,
+                "keep": self._keep,
+                "kept": len(self._slowest),
+                "active": self._active,
+                "profiled": self.profiled,
+                "skipped": self.skipped,
+                "discarded": self.discarded,
+            }
+
+
+def _selected(
+    profile: RequestProfile, cpu_only: bool
+) -> List[Tuple[Stack, float, bool]]:
+    return [s for s in profile.samples if s[2] or not cpu_only]
+
+
+def to_speedscope(
+    profiles: Sequence[RequestProfile], cpu_only: bool = False
+) -> Dict[str, Any]:
+    """Un perfil ``sampled`` de speedscope por request, en milisegundos."""
+    frames: Dict[Frame, int] = {}
+    exported = []
+    for profile in profiles:
+        samples = _selected(profile, cpu_only)
+        exported.append(
+            {
+                "type": "sampled",
+                "name": (
+                    f"#{profile.id} {profile.path} {profile.status} "
+                    f"{profile.duration_ms:.1f}ms"
+                ),
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weight for _, weight, _ in samples) * 1000,
+                "samples": [
+                    [frames.setdefault(frame, len(frames)) for frame in stack]
+                    for stack, _, _ in samples
+                ],
+                "weights": [weight * 1000 for _, weight, _ in samples],
+            }
+        )
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": "support-copilot " + ("cpu" if cpu_only else "wall"),
+        "exporter": "support-copilot",
+        "shared": {
+            "frames": [
+                {"name": name, "file": filename, "line": line}
+                for filename, line, name in frames
+            ]
+        },
+        "profiles": exported,
+    }
+
+
+def to_pstats(profiles: Sequence[RequestProfile], cpu_only: bool = False) -> bytes:
+    """Muestras de todas las requests en el formato de ``pstats.Stats``.
+
+    Los tiempos salen de las muestras; los conteos de llamadas son muestras
+    en las que aparece la función, no llamadas reales.
+    """
+    stats: Dict[Frame, List[Any]] = {}
+    for profile in profiles:
+        for stack, weight, _ in _selected(profile, cpu_only):
+            seen = set()
+            for depth, frame in enumerate(stack):
+                entry = stats.setdefault(frame, [0, 0, 0.0, 0.0, {}])
+                leaf = depth == len(stack) - 1
+                if frame not in seen:
+                    seen.add(frame)
+                    entry[0] += 1
+                    entry[1] += 1
+                    entry[3] += weight
+                if leaf:
+                    entry[2] += weight
+                if depth:
+                    caller = entry[4].setdefault(stack[depth - 1], [0, 0, 0.0, 0.0])
+                    caller[0] += 1
+                    caller[1] += 1
+                    caller[2] += weight if leaf else 0.0
+                    caller[3] += weight
+    return marshal.dumps(
+        {
+            frame: (
+                cc,
+                nc,
+                tt,
+                ct,
+                {caller: tuple(edge) for caller, edge in callers.items()},
+            )
+            for frame, (cc, nc, tt, ct, callers) in stats.items()
+        }
+    )
@@ -0,0 +1,215 @@
+"""Worker de cola que procesa los tickets pendientes de Supabase.
+
+Cada ciclo reserva un lote con ``claim_pending_tickets`` (lease con SKIP
+LOCKED, ver ``supabase/setup.sql``), lo clasifica con concurrencia acotada y
+lo guarda con una sola llamada. Sin trabajo, espera con backoff exponencial
+hasta el intervalo máximo o hasta que ``wake()`` indique tickets nuevos
+(``POST /queue/wake`` con el token QUEUE_WAKE_TOKEN). Los tickets que no pasan
+la validación salen de la cola con ``reject_queued_tickets``.
+"""
+
+import asyncio
+import hmac
+import logging
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from app.models import TicketPriority, TicketProcessRequest
+from app.services.admission import use_priority
+from app.services.pipeline import ASYNC_PIPELINE, process_batch
+from app.services.supabase_service import SupabaseService, SupabaseServiceError
+
+logger = logging.getLogger(__name__)
+
+
+class TicketQueueWorker:
+    """Pool de tareas asyncio que drenan la cola de tickets sin procesar."""
+
+    def __init__(
+        self,
+        registry: Any,
+        workers: int = 1,
+        batch_size: int = 20,
+        concurrency: int = 8,
+        poll_interval: float = 1.0,
+        max_backoff: float = 30.0,
+        lease_seconds: int = 300,
+        worker_id: Optional[str] = None,
+        wake_token: str = "",
+    ) -> None:
+        self._registry = registry
+        self._wake_token = wake_token.encode()
+        self._workers = workers
+        self._batch_size = batch_size
+        self._concurrency = concurrency
+        self._poll_interval = poll_interval
+        self._max_backoff = max_backoff
+        self._lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._wakes: List[asyncio.Event] = []
+        self._tasks: List["asyncio.Task[None]"] = []
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.claimed = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.wakes = 0
+
+    @classmethod
+    def from_env(cls, registry: Any) -> Optional["TicketQueueWorker"]:
+        """Crea el worker según QUEUE_*; None si QUEUE_WORKER_ENABLED no es true."""
+        if os.getenv("QUEUE_WORKER_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            registry,
+            workers=int(os.getenv("QUEUE_WORKERS", "1")),
+            batch_size=int(os.getenv("QUEUE_BATCH_SIZE", "20")),
+            concurrency=int(os.getenv("QUEUE_CONCURRENCY", "8")),
+            poll_interval=float(os.getenv("QUEUE_POLL_INTERVAL_SECONDS", "1")),
+            max_backoff=float(os.getenv("QUEUE_MAX_BACKOFF_SECONDS", "30")),
+            lease_seconds=int(os.getenv("QUEUE_LEASE_SECONDS", "300")),
+            wake_token=os.getenv("QUEUE_WAKE_TOKEN", ""),
+        )
+
+    def start(self) -> None:
+        """Lanza las tareas del pool en el event loop actual."""
+        self._wakes = [asyncio.Event() for _ in range(self._workers)]
+        self._tasks = [
+            asyncio.create_task(self._run(wake, slot))
+            for slot, wake in enumerate(self._wakes)
+        ]
+        logger.info(
+            "Queue worker %s started with %d tasks", self.worker_id, self._workers
+        )
+
+    async def stop(self) -> None:
+        """Cancela las tareas; los tickets reservados vuelven a la cola al expirar."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakes = []
+
+    def authorized(self, token: Optional[str]) -> bool:
+        """True si ``token`` es QUEUE_WAKE_TOKEN; sin token configurado, nunca."""
+        if not token or not self._wake_token:
+            return False
+        return hmac.compare_digest(token.encode(), self._wake_token)
+
+    def wake(self) -> None:
+        """Indica que hay tickets nuevos para no esperar al siguiente sondeo."""
+        with self._lock:
+            self.wakes += 1
+        # Un evento por tarea: si compartieran uno, la primera en limpiarlo se
+        # quedaría con el aviso y las demás seguirían esperando.
+        for event in self._wakes:
+            event.set()
+
+    async def _run(self, wake: asyncio.Event, slot: int) -> None:
+        delay = self._poll_interval
+        while True:
+            # Se limpia antes de reservar para no perder un wake() concurrente.
+            wake.clear()
+            try:
+                claimed = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(
+                    "Queue worker %s/%d batch failed", self.worker_id, slot
+                )
+                with self._lock:
+                    self.errors += 1
+                claimed = 0
+            if claimed:
+                delay = self._poll_interval
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=delay)
+                delay = self._poll_interval
+            except asyncio.TimeoutError:
+                delay = min(delay * 2, self._max_backoff)
+
+    async def run_once(self) -> int:
+        """Reserva y procesa un lote; devuelve cuántos tickets se reservaron."""
+        supabase: SupabaseService = await self._registry.aget("supabase")
+        rows = await self._claim(supabase)
+        if not rows:
+            return 0
+        llm = await self._registry.aget("llm")
+
+        requests: List[TicketProcessRequest] = []
+        invalid: List[Any] = []
+        for row in rows:
+            try:
+                requests.append(
+                    TicketProcessRequest(
+                        ticket_id=row["id"], description=row["description"]
+                    )
+                )
+            except (KeyError, ValidationError):
+                logger.warning("Queued ticket %s is not valid", row.get("id"))
+                invalid.append(row.get("id"))
+        rejected = await self._reject(supabase, [i for i in invalid if i])
+
+        # La cola de fondo cede el LLM a las requests en línea.
+        with use_priority(TicketPriority.LOW):
+            outcomes = await process_batch(llm, supabase, requests, self._concurrency)
+        failed = len(invalid) + sum(1 for o in outcomes if o.result is None)
+        with self._lock:
+            self.batches += 1
+            self.claimed += len(rows)
+            self.processed += len(rows) - failed
+            self.failed += failed
+            self.rejected += rejected
+        logger.info(
+            "Queue worker %s processed %d tickets, %d failed",
+            self.worker_id,
+            len(rows),
+            failed,
+        )
+        return len(rows)
+
+    async def _claim(self, supabase: SupabaseService) -> List[Dict[str, Any]]:
+        args = (self.worker_id, self._batch_size, self._lease_seconds)
+        if ASYNC_PIPELINE:
+            return await supabase.aclaim_pending_tickets(*args)
+        return await run_in_threadpool(supabase.claim_pending_tickets, *args)
+
+    async def _reject(self, supabase: SupabaseService, ticket_ids: List[Any]) -> int:
+        """Saca de la cola los tickets inválidos para que no se reserven de nuevo."""
+        if not ticket_ids:
+            return 0
+        args = (self.worker_id, [str(i) for i in ticket_ids], "invalid_ticket")
+        try:
+            if ASYNC_PIPELINE:
+                return await supabase.areject_queued_tickets(*args)
+            return await run_in_threadpool(supabase.reject_queued_tickets, *args)
+        except SupabaseServiceError:
+            # Vuelven a la cola al expirar la reserva; se reintenta entonces.
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Configuración y contadores del worker."""
+        with self._lock:
+            return {
+                "worker_id": self.worker_id,
+                "tasks": len(self._tasks),
+                "batch_size": self._batch_size,
+                "concurrency": self._concurrency,
+                "lease_seconds": self._lease_seconds,
+                "batches": self.batches,
+                "claimed": self.claimed,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "errors": self.errors,
+                "wakes": self.wakes,
+            }
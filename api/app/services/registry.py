@@ -0,0 +1,351 @@
+"""Registro de servicios por worker ligado al ciclo de vida de FastAPI.
+
+Construye LLMService y SupabaseService una sola vez por proceso, los
+reconstruye si cambia la configuración del entorno y los cierra al apagar.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+
+from app.services.admission import AdmissionController, AdmissionLLMService
+from app.services.classification_cache import CachedLLMService, ClassificationCache
+from app.services.http_pool import PoolLimits, PoolStats
+from app.services.idempotency import IdempotencyStore
+from app.services.llm_backends import LLMBackend
+from app.services.llm_service import LLMService, MockLLMService, TicketClassifier
+from app.services.local_classifier import CascadeLLMService
+from app.services.micro_batch import MicroBatchingLLMService
+from app.services.near_duplicate import (
+    NearDuplicateIndex,
+    NearDuplicateLLMService,
+    near_duplicate_scope,
+)
+from app.services.profiling import RequestProfiler
+from app.services.resilience import ResilientLLMService
+from app.services.result_stream import ResultBroadcaster
+from app.services.single_flight import SingleFlight, SingleFlightLLMService
+from app.services.supabase_service import SupabaseService
+from app.services.ticket_stats import TicketStats
+from app.services.traffic_capture import TrafficCapture
+from app.services.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Variables cuyo cambio obliga a reconstruir los servicios.
+CONFIG_KEYS = (
+    "MOCK_LLM",
+    "HF_MODEL_ID",
+    "HF_TASK",
+    "HF_INFERENCE_URL",
+    "LLM_STREAMING",
+    "LLM_BACKEND",
+    "LLM_BACKEND_URL",
+    "LLM_BACKEND_API_KEY",
+    "LLM_BACKEND_TIMEOUT_SECONDS",
+    "LLM_BACKEND_MAX_CONCURRENCY",
+    "LLM_OUTPUT_PROTOCOL",
+    "LLM_RESILIENCE_ENABLED",
+    "LLM_FALLBACK",
+    "LLM_DEADLINE_SECONDS",
+    "LLM_MAX_RETRIES",
+    "LLM_RETRY_BACKOFF_SECONDS",
+    "LLM_RETRY_BUDGET_RATIO",
+    "LLM_BREAKER_FAILURES",
+    "LLM_BREAKER_RESET_SECONDS",
+    "LLM_HEDGE_ENABLED",
+    "LLM_HEDGE_QUANTILE",
+    "LLM_SYNC_WORKERS",
+    "LLM_BATCH_ENABLED",
+    "LLM_BATCH_WINDOW_MS",
+    "LLM_BATCH_MAX_TICKETS",
+    "LOCAL_CLASSIFIER_PATH",
+    "LOCAL_CLASSIFIER_THRESHOLD",
+    "HUGGINGFACEHUB_API_TOKEN",
+    "SUPABASE_URL",
+    "SUPABASE_SERVICE_ROLE_KEY",
+    "HTTP_POOL_MAX_CONNECTIONS",
+    "HTTP_POOL_MAX_KEEPALIVE",
+    "HTTP_POOL_KEEPALIVE_EXPIRY",
+    "HTTP_POOL_TIMEOUT",
+    "HTTP_POOL_HTTP2",
+)
+
+
+def _config_fingerprint() -> Tuple[Optional[str], ...]:
+    return tuple(os.getenv(key) for key in CONFIG_KEYS)
+
+
+class ServiceRegistry:
+    """Contenedor de servicios compartidos por todas las requests del worker."""
+
+    def __init__(self, env_file: str = ".env") -> None:
+        self._lock = threading.Lock()
+        self._env_file = env_file
+        self._env_mtime = self._read_env_mtime()
+        self._fingerprint = _config_fingerprint()
+        self._llm: Optional[TicketClassifier] = None
+        # Backend HTTP del LLMService activo (None con MOCK_LLM=true).
+        self.llm_backend: Optional[LLMBackend] = None
+        self._supabase: Optional[SupabaseService] = None
+        self._retired: List[Tuple[float, Any]] = []
+        self.pool_stats: Dict[str, PoolStats] = {
+            "huggingface": PoolStats(),
+            "supabase": PoolStats(),
+        }
+        # La caché sobrevive a las recargas: su clave incluye modelo y prompt.
+        self.cache = ClassificationCache.from_env()
+        self.near_duplicates = NearDuplicateIndex.from_env()
+        self.single_flight = SingleFlight.from_env()
+        self.idempotency = IdempotencyStore.from_env()
+        self.ticket_stats = TicketStats.from_env()
+        self.result_stream = ResultBroadcaster.from_env()
+        # Sobrevive a las recargas para conservar el límite aprendido.
+        self.admission = AdmissionController.from_env()
+        self.cascade: Optional[CascadeLLMService] = None
+        self.resilience: Optional[ResilientLLMService] = None
+        self.micro_batch: Optional[MicroBatchingLLMService] = None
+        self.write_behind = WriteBehindBuffer.from_env(self)
+        self.traffic_capture = TrafficCapture.from_env()
+        self.profiler = RequestProfiler.from_env()
+
+    @property
+    def llm(self) -> TicketClassifier:
+        """Servicio LLM del worker (se construye en el primer acceso)."""
+        service = self._llm
+        if service is not None:
+            return service
+        with self._lock:
+            if self._llm is None:
+                self._llm = self._build_llm()
+            return self._llm
+
+    @property
+    def supabase(self) -> SupabaseService:
+        """Servicio de Supabase del worker (se construye en el primer acceso)."""
+        service = self._supabase
+        if service is not None:
+            return service
+        with self._lock:
+            if self._supabase is None:
+                self._supabase = self._build_supabase()
+            return self._supabase
+
+    async def aget(self, name: str) -> Any:
+        """Devuelve un servicio sin bloquear el event loop si aún no existe."""
+        service = getattr(self, f"_{name}")
+        if service is not None:
+            return service
+        return await asyncio.to_thread(getattr, self, name)
+
+    def _build_llm(self) -> TicketClassifier:
+        base = self._build_base_llm()
+        self.llm_backend = getattr(base, "backend", None)
+        service: TicketClassifier = MicroBatchingLLMService.from_env(base)
+        self.micro_batch = (
+            service if isinstance(service, MicroBatchingLLMService) else None
+        )
+        service = ResilientLLMService.from_env(service)
+        self.resilience = service if isinstance(service, ResilientLLMService) else None
+        if self.admission is not None:
+            service = AdmissionLLMService(service, self.admission)
+        service = CascadeLLMService.from_env(service)
+        self.cascade = service if isinstance(service, CascadeLLMService) else None
+        if self.near_duplicates is not None:
+            service = NearDuplicateLLMService(service, self.near_duplicates)
+        if self.single_flight is not None:
+            service = SingleFlightLLMService(service, self.single_flight)
+        if self.cache is not None:
+            service = CachedLLMService(service, self.cache)
+        return service
+
+    def _build_base_llm(self) -> Union[LLMService, MockLLMService]:
+        if os.getenv("MOCK_LLM", "").lower() == "true":
+            return MockLLMService()
+        try:
+            return LLMService(
+                pool_limits=PoolLimits.from_env(),
+                pool_stats=self.pool_stats["huggingface"],
+            )
+        except Exception as exc:
+            logger.exception("LLM service init failed: %s", exc)
+            raise
+
+    def _build_supabase(self) -> SupabaseService:
+        try:
+            service = SupabaseService(
+                pool_limits=PoolLimits.from_env(),
+                pool_stats=self.pool_stats["supabase"],
+            )
+        except Exception as exc:
+            logger.exception("Supabase service init failed: %s", exc)
+            raise
+        if self.ticket_stats is not None:
+            service.add_update_listener(self.ticket_stats.add_row)
+        if self.result_stream is not None:
+            service.add_update_listener(self.result_stream.add_row)
+        if self.near_duplicates is not None:
+            service.add_update_listener(self._index_near_duplicate)
+        return service
+
+    def warm_up(self) -> None:
+        """Construye los servicios por adelantado; los fallos se registran."""
+        for name in ("llm", "supabase"):
+            try:
+                getattr(self, name)
+            except Exception:
+                logger.warning("Service %s not ready at startup", name)
+        self._seed_near_duplicates()
+
+    async def awarm_up(self, prime_connections: bool = False) -> None:
+        """``warm_up`` en un hilo y, si se pide, apertura de conexiones.
+
+        Con ``prime_connections`` abre una conexión keep-alive hacia el LLM y
+        hacia PostgREST, así el primer ticket no paga DNS, TCP ni TLS.
+        """
+        await asyncio.to_thread(self.warm_up)
+        if prime_connections:
+            await self.prime_connections()
+
+    async def prime_connections(self) -> None:
+        """Abre las conexiones del LLM y de Supabase; los fallos se registran."""
+        candidates = (("llm", self.llm_backend), ("supabase", self._supabase))
+        targets: List[Tuple[str, Any]] = [
+            (name, target) for name, target in candidates if target is not None
+        ]
+        results = await asyncio.gather(
+            *(target.aprime() for _, target in targets), return_exceptions=True
+        )
+        for (name, _), result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.warning("Connection to %s not primed: %s", name, result)
+
+    def _seed_near_duplicates(self) -> None:
+        llm = self._llm
+        if self.near_duplicates is None or self._supabase is None or llm is None:
+            return
+        limit = int(os.getenv("NEAR_DUP_SEED_LIMIT", "5000"))
+        try:
+            rows = self._supabase.fetch_processed_tickets(limit)
+        except Exception:
+            logger.warning("Near-duplicate index not seeded from Supabase")
+            return
+        self.near_duplicates.seed(
+            rows, near_duplicate_scope(llm.model_id, llm.prompt_version)
+        )
+
+    def _index_near_duplicate(self, row: Dict[str, Any]) -> None:
+        """Listener de SupabaseService: indexa el ticket recién guardado."""
+        llm = self._llm
+        if self.near_duplicates is None or llm is None:
+            return
+        self.near_duplicates.add_row(
+            row, near_duplicate_scope(llm.model_id, llm.prompt_version)
+        )
+
+    def _read_env_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self._env_file)
+        except OSError:
+            return None
+
+    def reload_if_changed(self) -> bool:
+        """Relee el .env y reconstruye los servicios si la configuración cambió.
+
+        Returns:
+            True si los servicios se reemplazaron.
+        """
+        mtime = self._read_env_mtime()
+        if mtime is not None and mtime != self._env_mtime:
+            self._env_mtime = mtime
+            load_dotenv(self._env_file, override=True)
+        fingerprint = _config_fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+        self.reload()
+        return True
+
+    def reload(self) -> None:
+        """Retira los servicios actuales; los nuevos se crean en el próximo acceso.
+
+        Los servicios retirados se cierran tras un periodo de gracia para no
+        cortar requests que aún los estén usando.
+        """
+        with self._lock:
+            retired = [s for s in (self._llm, self._supabase) if s is not None]
+            self._llm = None
+            self.llm_backend = None
+            # Partes de la cadena retirada; se recrean con el nuevo servicio LLM.
+            self.cascade = None
+            self.resilience = None
+            self.micro_batch = None
+            self._supabase = None
+            now = time.monotonic()
+            self._retired.extend((now, service) for service in retired)
+        logger.warning("Service configuration changed, services reloaded")
+
+    async def close_retired(self, grace_seconds: float) -> None:
+        """Cierra los servicios retirados hace más de grace_seconds."""
+        cutoff = time.monotonic() - grace_seconds
+        with self._lock:
+            expired = [s for t, s in self._retired if t <= cutoff]
+            self._retired = [(t, s) for t, s in self._retired if t > cutoff]
+        for service in expired:
+            await _close_quietly(service)
+
+    async def aclose(self) -> None:
+        """Vacía el buffer de escritura y cierra los servicios activos y retirados."""
+        if self.write_behind is not None:
+            await self.write_behind.close()
+        if self.result_stream is not None:
+            await self.result_stream.close()
+        with self._lock:
+            services = [s for s in (self._llm, self._supabase) if s is not None]
+            services.extend(s for _, s in self._retired)
+            self._llm = None
+            self._supabase = None
+            self._retired = []
+        for service in services:
+            await _close_quietly(service)
+        if self.cache is not None:
+            self.cache.close()
+        if self.idempotency is not None:
+            self.idempotency.close()
+        if self.traffic_capture is not None:
+            await asyncio.to_thread(self.traffic_capture.close)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Estadísticas de los pools HTTP por destino."""
+        return {name: stats.snapshot() for name, stats in self.pool_stats.items()}
+
+    async def watch(self, interval: float, grace_seconds: float) -> None:
+        """Tarea de fondo que detecta cambios de configuración."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.reload_if_changed()
+                await self.close_retired(grace_seconds)
+            except Exception:
+                logger.exception("Service registry reload failed")
+
+
+async def _close_quietly(service: Any) -> None:
+    try:
+        await service.aclose()
+    except Exception:
+        logger.exception("Error closing %s", type(service).__name__)
+
+
+def get_registry(app: Any) -> ServiceRegistry:
+    """Devuelve el registro del app, creándolo si el lifespan no corrió."""
+    registry = getattr(app.state, "services", None)
+    if registry is None:
+        registry = ServiceRegistry()
+        app.state.services = registry
+    return registry
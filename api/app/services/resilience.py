@@ -0,0 +1,518 @@
+"""Deadlines, reintentos, hedging y circuit breaker alrededor del LLM.
+
+``ResilientLLMService`` envuelve el cliente de Hugging Face:
+
+- cada clasificación tiene un deadline total que incluye reintentos;
+- los reintentos usan backoff exponencial con jitter y gastan fichas de un
+  presupuesto que se recarga con las llamadas, así nunca multiplican la carga
+  durante una caída;
+- si una llamada supera el p95 observado se lanza una segunda (hedge) y se
+  usa la primera respuesta;
+- tras varios fallos seguidos el circuit breaker se abre y responde al
+  instante con el clasificador de respaldo o con un error.
+
+Las clasificaciones de respaldo llevan ``confidence_score = 0`` para que la
+caché y el índice de casi duplicados no las reutilicen.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+from app.models import TicketProcessResponse
+from app.services import metrics
+from app.services.llm_service import (
+    LLMInvalidError,
+    LLMServiceError,
+    MockLLMService,
+    TicketClassifier,
+)
+from app.services.local_classifier import CascadeLLMService, LocalClassifier
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(LLMServiceError):
+    """El circuito está abierto y no hay clasificador de respaldo."""
+
+
+class CircuitBreaker:
+    """Abre el circuito tras ``failure_threshold`` fallos seguidos.
+
+    Abierto, rechaza llamadas durante ``reset_seconds``; después deja pasar
+    una llamada de prueba (half-open) que lo cierra si responde o lo vuelve a
+    abrir si falla.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0) -> None:
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """True si la llamada puede ir al LLM."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self._probe_started = None
+            # Una prueba cancelada no debe dejar el circuito medio abierto
+            # para siempre: pasado reset_seconds se admite otra.
+            if self.state == HALF_OPEN and (
+                self._probe_started is None
+                or now - self._probe_started >= self.reset_seconds
+            ):
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self.state != CLOSED:
+                logger.warning("LLM circuit closed")
+                metrics.LLM_CIRCUIT_OPEN.dec()
+                self.state = CLOSED
+                self._probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self._failures >= self.failure_threshold
+            ):
+                if self.state == CLOSED:
+                    metrics.LLM_CIRCUIT_OPEN.inc()
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+                self.times_opened += 1
+                logger.warning(
+                    "LLM circuit opened after %d consecutive failures", self._failures
+                )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_seconds": self.reset_seconds,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+class RetryBudget:
+    """Fichas para reintentos y hedges.
+
+    Cada llamada deposita ``ratio`` fichas (hasta ``max_tokens``) y cada
+    reintento o hedge gasta una, de modo que a largo plazo no superan
+    ``ratio`` veces el número de llamadas.
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ratio": self.ratio,
+                "tokens": round(self._tokens, 2),
+                "max_tokens": self.max_tokens,
+                "exhausted": self.exhausted,
+            }
+
+
+class _LatencyWindow:
+    """Cuantil de latencia de las últimas llamadas correctas al LLM."""
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        window: int = 512,
+        min_samples: int = 20,
+        refresh_every: int = 32,
+    ) -> None:
+        self._quantile = quantile
+        self._min_samples = min_samples
+        self._refresh_every = refresh_every
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._value: Optional[float] = None
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._pending += 1
+            # Ordenar la ventana en cada llamada sería caro; basta con
+            # recalcular el cuantil cada ``refresh_every`` muestras.
+            if len(self._samples) < self._min_samples or (
+                self._value is not None and self._pending < self._refresh_every
+            ):
+                return
+            samples = sorted(self._samples)
+            self._value = samples[int((len(samples) - 1) * self._quantile)]
+            self._pending = 0
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+
+def build_fallback(kind: str) -> Optional[TicketClassifier]:
+    """Clasificador de respaldo según LLM_FALLBACK (none, mock o local)."""
+    kind = kind.lower()
+    if kind == "mock":
+        return MockLLMService()
+    if kind == "local":
+        path = os.getenv("LOCAL_CLASSIFIER_PATH")
+        if not path:
+            logger.warning("LLM_FALLBACK=local requires LOCAL_CLASSIFIER_PATH")
+            return None
+        try:
+            local = LocalClassifier.load(path)
+        except (OSError, ValueError, KeyError):
+            logger.exception("Local fallback classifier not loaded from %s", path)
+            return None
+        # Con umbral 0 la cascada siempre responde localmente.
+        return CascadeLLMService(MockLLMService(), local, threshold=0.0)
+    return None
+
+
+class ResilientLLMService:
+    """Envuelve el LLM con deadline, reintentos, hedging y circuit breaker."""
+
+    def __init__(
+        self,
+        inner: TicketClassifier,
+        fallback: Optional[TicketClassifier] = None,
+        deadline_seconds: float = 20.0,
+        max_retries: int = 2,
+        backoff_seconds: float = 0.2,
+        max_backoff_seconds: float = 2.0,
+        budget: Optional[RetryBudget] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: bool = True,
+        hedge_quantile: float = 0.95,
+        hedge_min_samples: int = 20,
+        fallback_name: str = "none",
+    ) -> None:
+        self._inner = inner
+        self._fallback = fallback
+        self._fallback_name = fallback_name if fallback is not None else "none"
+        self._deadline = deadline_seconds
+        self._max_retries = max_retries
+        self._backoff = backoff_seconds
+        self._max_backoff = max_backoff_seconds
+        self.budget = budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self._hedge = hedge
+        self._latency = _LatencyWindow(hedge_quantile, min_samples=hedge_min_samples)
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counts = {
+            "calls": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+            "fallbacks": 0,
+            "failures": 0,
+        }
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+
+    @classmethod
+    def from_env(cls, inner: TicketClassifier) -> TicketClassifier:
+        """Envuelve ``inner`` si LLM_RESILIENCE_ENABLED=true."""
+        if os.getenv("LLM_RESILIENCE_ENABLED", "false").lower() != "true":
+            return inner
+        fallback_name = os.getenv("LLM_FALLBACK", "none")
+        return cls(
+            inner,
+            fallback=build_fallback(fallback_name),
+            deadline_seconds=float(os.getenv("LLM_DEADLINE_SECONDS", "20")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            backoff_seconds=float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.2")),
+            budget=RetryBudget(float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))),
+            breaker=CircuitBreaker(
+                int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            ),
+            hedge=os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true",
+            hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+            fallback_name=fallback_name.lower(),
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+        if name not in ("calls", "failures"):
+            metrics.LLM_RESILIENCE_EVENTS.labels(name).inc()
+
+    def _start(self) -> float:
+        self._count("calls")
+        self.budget.deposit()
+        return time.monotonic() + self._deadline
+
+    def _retry_delay(self, attempt: int, deadline: float) -> Optional[float]:
+        """Espera antes del siguiente intento, o None si no se debe reintentar."""
+        if attempt >= self._max_retries:
+            return None
+        # Full jitter: evita que los reintentos de muchas requests coincidan.
+        delay = random.uniform(0, min(self._max_backoff, self._backoff * 2**attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        if not self.breaker.allow() or not self.budget.withdraw():
+            return None
+        self._count("retries")
+        return delay
+
+    def _hedge_after(self, deadline: float) -> Optional[float]:
+        if not self._hedge:
+            return None
+        threshold = self._latency.value
+        if threshold is None or time.monotonic() + threshold >= deadline:
+            return None
+        return threshold
+
+    def _deadline_error(self) -> LLMServiceError:
+        self._count("deadline_exceeded")
+        return LLMServiceError("El LLM no respondió dentro del deadline.")
+
+    def _degrade(
+        self, ticket_text: str, error: LLMServiceError
+    ) -> TicketProcessResponse:
+        """Clasificación de respaldo o, si no hay, el error original."""
+        if self._fallback is None:
+            self._count("failures")
+            raise error
+        self._count("fallbacks")
+        result = self._fallback.classify_ticket(ticket_text)
+        return TicketProcessResponse(
+            category=result.category,
+            sentiment=result.sentiment,
+            confidence_score=0.0,
+            reasoning=f"Respaldo ({self._fallback_name}): {result.reasoning}"[:300],
+        )
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Clasifica con reintentos y hedging; degrada si el LLM no responde."""
+        if not self.breaker.allow():
+            return self._degrade(
+                ticket_text, CircuitOpenError("El LLM no está disponible.")
+            )
+        deadline = self._start()
+        attempt = 0
+        while True:
+            try:
+                result = self._hedged_sync(ticket_text, deadline)
+            except LLMInvalidError:
+                # Hugging Face respondió; el fallo es del ticket o del modelo.
+                self.breaker.record_success()
+                raise
+            except LLMServiceError as exc:
+                self.breaker.record_failure()
+                delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    return self._degrade(ticket_text, exc)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        if not self.breaker.allow():
+            return self._degrade(
+                ticket_text, CircuitOpenError("El LLM no está disponible.")
+            )
+        deadline = self._start()
+        attempt = 0
+        while True:
+            try:
+                result = await self._hedged(ticket_text, deadline)
+            except LLMInvalidError:
+                self.breaker.record_success()
+                raise
+            except LLMServiceError as exc:
+                self.breaker.record_failure()
+                delay = self._retry_delay(attempt, deadline)
+                if delay is None:
+                    return self._degrade(ticket_text, exc)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _hedged(self, ticket_text: str, deadline: float) -> TicketProcessResponse:
+        """Un intento: llamada principal y, si tarda más del p95, un hedge."""
+        t0 = time.monotonic()
+        primary = asyncio.ensure_future(self._inner.aclassify_ticket(ticket_text))
+        primary.add_done_callback(_consume_exception)
+        pending: Set["asyncio.Future[TicketProcessResponse]"] = {primary}
+        error: Optional[BaseException] = None
+        try:
+            hedge_after = self._hedge_after(deadline)
+            if hedge_after is not None:
+                await asyncio.wait(pending, timeout=hedge_after)
+                if not primary.done() and self.budget.withdraw():
+                    self._count("hedges")
+                    hedge = asyncio.ensure_future(
+                        self._inner.aclassify_ticket(ticket_text)
+                    )
+                    hedge.add_done_callback(_consume_exception)
+                    pending.add(hedge)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        self._latency.record(time.monotonic() - t0)
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            raise self._deadline_error()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedged_sync(self, ticket_text: str, deadline: float) -> TicketProcessResponse:
+        """Como _hedged, con hilos; las llamadas perdedoras terminan solas."""
+        executor = self._get_executor()
+        t0 = time.monotonic()
+        # Cada hilo recibe una copia del contexto (p. ej. el protocolo de salida).
+        primary = executor.submit(
+            contextvars.copy_context().run, self._inner.classify_ticket, ticket_text
+        )
+        pending: Set["concurrent.futures.Future[TicketProcessResponse]"] = {primary}
+        error: Optional[BaseException] = None
+        hedge_after = self._hedge_after(deadline)
+        if hedge_after is not None:
+            concurrent.futures.wait(pending, timeout=hedge_after)
+            if not primary.done() and self.budget.withdraw():
+                self._count("hedges")
+                pending.add(
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        self._inner.classify_ticket,
+                        ticket_text,
+                    )
+                )
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=remaining,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    self._latency.record(time.monotonic() - t0)
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise self._deadline_error()
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=int(os.getenv("LLM_SYNC_WORKERS", "32")),
+                        thread_name_prefix="llm-call",
+                    )
+        return self._executor
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del breaker, presupuesto de reintentos y tasa de éxito de hedges."""
+        with self._lock:
+            counts = dict(self._counts)
+        hedge_after = self._latency.value
+        return {
+            **counts,
+            "hedge_win_rate": (
+                round(counts["hedge_wins"] / counts["hedges"], 4)
+                if counts["hedges"]
+                else None
+            ),
+            "hedge_after_ms": (
+                round(hedge_after * 1000, 1) if hedge_after is not None else None
+            ),
+            "deadline_seconds": self._deadline,
+            "fallback": self._fallback_name,
+            "breaker": self.breaker.stats(),
+            "retry_budget": self.budget.stats(),
+        }
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        await self._inner.aclose()
+
+
+def _consume_exception(task: "asyncio.Future[Any]") -> None:
+    # Evita el aviso "exception was never retrieved" de la llamada perdedora.
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,235 @@
+"""Difusión en vivo de las clasificaciones (Server-Sent Events).
+
+``ResultBroadcaster`` recibe cada fila escrita en ``tickets`` (listener de
+SupabaseService, desde cualquier hilo) y la reparte en el event loop a todos
+los suscriptores de ``GET /stream/results``. Cada evento se serializa una
+sola vez y cada suscriptor tiene un buffer acotado: si un cliente lento lo
+llena, se descartan sus eventos más antiguos y se le avisa con un evento
+``dropped``. Un único timer envía los heartbeats de todos los suscriptores,
+así miles de conexiones inactivas no cuestan más que su buffer vacío.
+
+Al recibir SIGTERM/SIGINT (``close_on_exit_signals``) se cierran los
+streams: uvicorn espera a que terminen las conexiones abiertas antes del
+apagado del lifespan, y un suscriptor conectado lo bloquearía.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import signal
+import threading
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Campos de la fila que se envían a los suscriptores.
+EVENT_FIELDS = ("category", "sentiment", "confidence_score", "processing_time_ms")
+
+HEARTBEAT_FRAME = b": ping\n\n"
+EXIT_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+class StreamFullError(Exception):
+    """Se alcanzó el máximo de suscriptores del worker."""
+
+
+class Subscription:
+    """Buffer acotado de frames SSE de un suscriptor."""
+
+    __slots__ = ("_frames", "_wakeup", "_closed", "_heartbeat", "_lost", "dropped")
+
+    def __init__(self, buffer_size: int) -> None:
+        self._frames: Deque[bytes] = collections.deque(maxlen=buffer_size)
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._heartbeat = False
+        self._lost = 0
+        self.dropped = 0
+
+    def push(self, frame: bytes) -> None:
+        if len(self._frames) == self._frames.maxlen:
+            # El deque descarta el frame más antiguo al agregar.
+            self._lost += 1
+            self.dropped += 1
+        self._frames.append(frame)
+        self._wakeup.set()
+
+    def heartbeat(self) -> None:
+        self._heartbeat = True
+        self._wakeup.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+
+    async def frames(self) -> AsyncIterator[bytes]:
+        """Frames pendientes a medida que llegan, hasta que se cierra."""
+        while not self._closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._lost:
+                lost, self._lost = self._lost, 0
+                yield _frame("dropped", {"dropped": lost})
+            while self._frames:
+                yield self._frames.popleft()
+            if self._heartbeat:
+                self._heartbeat = False
+                yield HEARTBEAT_FRAME
+
+
+class ResultBroadcaster:
+    """Reparte clasificaciones a los suscriptores del worker."""
+
+    def __init__(
+        self,
+        buffer_size: int = 100,
+        max_subscribers: int = 10000,
+        heartbeat_seconds: float = 15.0,
+    ) -> None:
+        self._buffer_size = buffer_size
+        self._max_subscribers = max_subscribers
+        self._heartbeat_seconds = heartbeat_seconds
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._lock = threading.Lock()
+        self._closing = False
+        self._sequence = 0
+        self.published = 0
+        self.rejected = 0
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultBroadcaster"]:
+        """Crea el broadcaster si RESULT_STREAM_ENABLED no es false."""
+        if os.getenv("RESULT_STREAM_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            buffer_size=int(os.getenv("RESULT_STREAM_BUFFER", "100")),
+            max_subscribers=int(os.getenv("RESULT_STREAM_MAX_SUBSCRIBERS", "10000")),
+            heartbeat_seconds=float(
+                os.getenv("RESULT_STREAM_HEARTBEAT_SECONDS", "15")
+            ),
+        )
+
+    def start(self) -> None:
+        """Fija el event loop del worker y lanza el timer de heartbeats."""
+        self._loop = asyncio.get_running_loop()
+        if self._task is None and self._heartbeat_seconds > 0:
+            self._task = asyncio.create_task(self._heartbeats())
+
+    async def close(self) -> None:
+        """Cierra todas las suscripciones y detiene los heartbeats."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.close_streams()
+
+    def close_streams(self) -> None:
+        """Termina los streams abiertos y rechaza suscriptores nuevos."""
+        self._closing = True
+        for subscription in list(self._subscribers):
+            subscription.close()
+        self._subscribers.clear()
+
+    async def _heartbeats(self) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_seconds)
+            for subscription in self._subscribers:
+                subscription.heartbeat()
+
+    def subscribe(self) -> Subscription:
+        """Registra un suscriptor nuevo (desde el event loop).
+
+        Raises:
+            StreamFullError: Si ya hay ``max_subscribers`` conectados o el
+                worker se está apagando.
+        """
+        if self._closing:
+            raise StreamFullError("El servidor se está apagando.")
+        if len(self._subscribers) >= self._max_subscribers:
+            self.rejected += 1
+            raise StreamFullError("Demasiados suscriptores.")
+        subscription = Subscription(self._buffer_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+        self.dropped += subscription.dropped
+
+    def add_row(self, row: Dict[str, Any]) -> None:
+        """Publica una fila escrita en ``tickets`` (listener de SupabaseService).
+
+        Se puede llamar desde cualquier hilo; el reparto ocurre en el loop.
+        """
+        loop = self._loop
+        if loop is None or not row.get("processed") or not self._subscribers:
+            return
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        event = {"ticket_id": str(row.get("id"))}
+        event.update({field: row.get(field) for field in EVENT_FIELDS})
+        frame = _frame("classification", event, sequence)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._fanout(frame)
+            return
+        try:
+            loop.call_soon_threadsafe(self._fanout, frame)
+        except RuntimeError:
+            # El loop ya se cerró (apagado del worker).
+            pass
+
+    def _fanout(self, frame: bytes) -> None:
+        self.published += 1
+        for subscription in self._subscribers:
+            subscription.push(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        """Suscriptores conectados, eventos publicados y descartados."""
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": self._max_subscribers,
+            "buffer_size": self._buffer_size,
+            "heartbeat_seconds": self._heartbeat_seconds,
+            "published": self.published,
+            "rejected": self.rejected,
+            "dropped": self.dropped
+            + sum(subscription.dropped for subscription in self._subscribers),
+        }
+
+
+def close_on_exit_signals(broadcaster: ResultBroadcaster) -> None:
+    """Cierra los streams cuando llega SIGTERM/SIGINT (desde el event loop).
+
+    Encadena el handler que instaló el servidor (uvicorn), que sigue con su
+    apagado normal. Sin handler previo (señal por defecto o ignorada), o
+    fuera del hilo principal, no hace nada.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in EXIT_SIGNALS:
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum: int, frame: Any, previous: Any = previous) -> None:
+            loop.call_soon_threadsafe(broadcaster.close_streams)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+
+def _frame(event: str, data: Dict[str, Any], sequence: Optional[int] = None) -> bytes:
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    prefix = f"id: {sequence}\n" if sequence is not None else ""
+    return f"{prefix}event: {event}\ndata: {payload}\n\n".encode()
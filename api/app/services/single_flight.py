@@ -0,0 +1,149 @@
+"""Coalescencia de llamadas concurrentes al LLM para el mismo ticket.
+
+Durante un incidente llegan decenas de descripciones idénticas en el mismo
+segundo y todas fallan la caché antes de que la primera termine. Con
+``SingleFlight`` solo la primera (líder) llama al LLM; las demás esperan su
+resultado, tanto desde el threadpool como desde el event loop.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from app.models import TicketProcessResponse
+from app.services.classification_cache import cache_key
+from app.services.llm_service import TicketClassifier
+from app.services.output_protocol import protocol_prompt_version
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Agrupa llamadas con la misma clave en una sola ejecución."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "concurrent.futures.Future[Any]"] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SingleFlight"]:
+        """Crea el grupo salvo que SINGLE_FLIGHT_ENABLED=false."""
+        if os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() != "true":
+            return None
+        return cls()
+
+    def _join(self, key: str) -> Tuple["concurrent.futures.Future[Any]", bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _settle(
+        self,
+        key: str,
+        future: "concurrent.futures.Future[Any]",
+        result: Any = None,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """Ejecuta ``fn`` o espera a la ejecución en curso con la misma clave."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            self._settle(key, future, error=exc)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Versión asíncrona de ``do``.
+
+        La llamada del líder corre en su propia tarea: si el cliente del líder
+        se desconecta, los demás siguen recibiendo el resultado.
+        """
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda t: self._settle_task(key, future, t))
+        # shield: cancelar a un solo solicitante no cancela el Future compartido.
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def _settle_task(
+        self,
+        key: str,
+        future: "concurrent.futures.Future[Any]",
+        task: "asyncio.Future[Any]",
+    ) -> None:
+        if task.cancelled():
+            self._settle(key, future, error=asyncio.CancelledError())
+        elif task.exception() is not None:
+            self._settle(key, future, error=task.exception())
+        else:
+            self._settle(key, future, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        """Llamadas ejecutadas, coalescidas y en curso."""
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+                "coalesce_rate": round(self.coalesced / total, 4) if total else None,
+            }
+
+
+class SingleFlightLLMService:
+    """Envuelve un servicio LLM y comparte las llamadas idénticas en curso.
+
+    La clave es la misma que la de la caché: descripción normalizada, modelo
+    y versión del prompt.
+    """
+
+    def __init__(self, inner: TicketClassifier, group: SingleFlight) -> None:
+        self._inner = inner
+        self._group = group
+        self.model_id = inner.model_id
+        self.prompt_version = inner.prompt_version
+
+    def _key(self, ticket_text: str) -> str:
+        return cache_key(
+            ticket_text, self.model_id, protocol_prompt_version(self.prompt_version)
+        )
+
+    def classify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Clasifica o espera la clasificación en curso del mismo ticket."""
+        return self._group.do(
+            self._key(ticket_text), lambda: self._inner.classify_ticket(ticket_text)
+        )
+
+    async def aclassify_ticket(self, ticket_text: str) -> TicketProcessResponse:
+        """Versión asíncrona de classify_ticket."""
+        return await self._group.ado(
+            self._key(ticket_text), lambda: self._inner.aclassify_ticket(ticket_text)
+        )
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
@@ -1,19 +1,93 @@
 import logging
 import os
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
 from uuid import UUID
 
-from supabase import Client, create_client
+from postgrest import AsyncPostgrestClient
+from postgrest.utils import AsyncClient
+from pydantic import ValidationError
 
-from app.models import SentimentType, TicketCategory
+from app.models import SentimentType, TicketCategory, TicketProcessResponse
+from app.services.http_pool import (
+    PoolLimits,
+    PoolStats,
+    build_async_httpx_client,
+    build_httpx_client,
+)
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
+# Filas que una actualización condicional puede escribir: pendientes o con el
+# respaldo de confianza 0 (LLM_FALLBACK) que un reintento puede mejorar.
+UNPROCESSED_FILTER = "processed.eq.false,confidence_score.eq.0"
+# Columnas que se leen si una actualización condicional no escribió nada.
+PROCESSED_COLUMNS = "processed, category, sentiment, confidence_score, reasoning"
+
+# Recibe la fila escrita (id, description y created_at si se conocen y campos
+# de clasificación).
+UpdateListener = Callable[[Dict[str, Any]], None]
+
 
 class SupabaseServiceError(Exception):
     """Error de servicio para operaciones con Supabase."""
 
 
+class TicketAlreadyProcessedError(SupabaseServiceError):
+    """El ticket ya estaba procesado y la actualización no lo sobrescribió.
+
+    ``result`` es la clasificación guardada, o None si la fila no es válida.
+    """
+
+    def __init__(
+        self, ticket_id: UUID, result: Optional[TicketProcessResponse]
+    ) -> None:
+        super().__init__(f"El ticket {ticket_id} ya estaba procesado.")
+        self.result = result
+
+
+@dataclass
+class BulkUpdateResult:
+    """Resultado de bulk_update_tickets por ticket_id."""
+
+    updated: List[str] = field(default_factory=list)
+    not_found: List[str] = field(default_factory=list)
+    # Tickets ya procesados que no se sobrescribieron, con la clasificación
+    # guardada (None si la fila no es válida).
+    already_processed: Dict[str, Optional[TicketProcessResponse]] = field(
+        default_factory=dict
+    )
+
+
+class _PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    """Cliente PostgREST asíncrono sobre el pool keep-alive instrumentado."""
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        limits: PoolLimits,
+        stats: PoolStats,
+    ) -> None:
+        self._limits = limits
+        self._stats = stats
+        super().__init__(base_url, headers=headers, timeout=limits.timeout)
+
+    def create_session(
+        self,
+        base_url: str,
+        headers: Dict[str, str],
+        timeout: Any,
+        verify: bool = True,
+    ) -> AsyncClient:
+        return build_async_httpx_client(
+            self._limits, self._stats, base_url=base_url, headers=headers
+        )
+
+
 class SupabaseService:
     """Servicio de acceso a datos en Supabase (solo updates)."""
 
@@ -21,12 +95,16 @@ class SupabaseService:
         self,
         supabase_url: Optional[str] = None,
         service_role_key: Optional[str] = None,
+        pool_limits: Optional[PoolLimits] = None,
+        pool_stats: Optional[PoolStats] = None,
     ) -> None:
         """Inicializa el cliente de Supabase.
 
         Args:
             supabase_url: URL de Supabase.
             service_role_key: Service role key de Supabase.
+            pool_limits: Límites del pool HTTP keep-alive hacia PostgREST.
+            pool_stats: Contadores compartidos del pool.
         """
         url = supabase_url or os.getenv("SUPABASE_URL")
         key = service_role_key or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -36,7 +114,64 @@ class SupabaseService:
                 "Faltan variables SUPABASE_URL o SUPABASE_SERVICE_ROLE_KEY."
             )
 
-        self._client: Client = create_client(url, key)
+        # supabase (auth, storage, realtime…) se importa recién aquí: el
+        # registro construye el servicio en segundo plano al arrancar.
+        from supabase import create_client
+
+        self._client: "Client" = create_client(url, key)
+
+        # Sustituye la sesión por defecto de PostgREST por un cliente con pool
+        # keep-alive acotado, reutilizado durante toda la vida del servicio.
+        self._limits = pool_limits or PoolLimits.from_env()
+        self.pool_stats = pool_stats or PoolStats()
+        postgrest = self._client.postgrest
+        default_session = postgrest.session
+        self._rest_url = str(default_session.base_url)
+        self._headers = dict(default_session.headers)
+        postgrest.session = build_httpx_client(
+            self._limits,
+            self.pool_stats,
+            base_url=self._rest_url,
+            headers=self._headers,
+        )
+        default_session.close()
+        self._async_postgrest: Optional[AsyncPostgrestClient] = None
+        self._update_listeners: List[UpdateListener] = []
+
+    def add_update_listener(self, listener: UpdateListener) -> None:
+        """Registra una función que se llama tras cada escritura correcta."""
+        self._update_listeners.append(listener)
+
+    def _notify(self, rows: List[Dict[str, Any]]) -> None:
+        for listener in self._update_listeners:
+            for row in rows:
+                try:
+                    listener(row)
+                except Exception:
+                    logger.exception("Ticket update listener failed")
+
+    @property
+    def async_postgrest(self) -> AsyncPostgrestClient:
+        """Cliente PostgREST asíncrono (se crea en el primer uso)."""
+        if self._async_postgrest is None:
+            self._async_postgrest = _PooledAsyncPostgrestClient(
+                self._rest_url, self._headers, self._limits, self.pool_stats
+            )
+        return self._async_postgrest
+
+    def close(self) -> None:
+        """Cierra las conexiones HTTP síncronas del pool."""
+        self._client.postgrest.session.close()
+
+    async def aclose(self) -> None:
+        """Cierra las conexiones HTTP síncronas y asíncronas del pool."""
+        self.close()
+        if self._async_postgrest is not None:
+            await self._async_postgrest.aclose()
+
+    async def aprime(self) -> None:
+        """Abre una conexión keep-alive del pool asíncrono hacia PostgREST."""
+        await self.async_postgrest.session.head("/tickets")
 
     def update_ticket_by_id(
         self,
@@ -46,6 +181,8 @@ class SupabaseService:
         confidence_score: float,
         reasoning: str,
         processing_time_ms: int,
+        description: Optional[str] = None,
+        only_unprocessed: bool = True,
     ) -> None:
         """Actualiza un ticket con resultados de clasificación.
 
@@ -56,45 +193,459 @@ class SupabaseService:
             confidence_score: Score entre 0 y 1.
             reasoning: Razón corta de la clasificación.
             processing_time_ms: Tiempo de procesamiento en ms.
+            description: Texto del ticket, solo para los listeners.
+            only_unprocessed: Solo actualiza si el ticket está pendiente o
+                tiene una clasificación de respaldo (confianza 0).
 
         Raises:
+            TicketAlreadyProcessedError: Si el ticket ya estaba procesado.
             SupabaseServiceError: Si falla la operación.
         """
-        payload = {
-            "category": category.value,
-            "sentiment": sentiment.value,
-            "confidence_score": confidence_score,
-            "reasoning": reasoning,
-            "processed": True,
-            "processing_time_ms": processing_time_ms,
-        }
+        payload = _classification_payload(
+            category, sentiment, confidence_score, reasoning, processing_time_ms
+        )
 
         try:
-            result = (
+            query = (
                 self._client.table("tickets")
                 .update(payload)
                 .eq("id", str(ticket_id))
-                .execute()
             )
+            if only_unprocessed:
+                query = query.or_(UNPROCESSED_FILTER)
+            result = query.execute()
+            current = None
+            if only_unprocessed and not getattr(result, "data", None):
+                current = (
+                    self._client.table("tickets")
+                    .select(PROCESSED_COLUMNS)
+                    .eq("id", str(ticket_id))
+                    .execute()
+                )
         except Exception as exc:  # pragma: no cover - error externo
             logger.exception("Error al actualizar ticket en Supabase.")
             raise SupabaseServiceError(
                 "Error al actualizar ticket en Supabase."
             ) from exc
 
+        if current is not None:
+            _check_not_processed(current, ticket_id)
+        _check_update_result(result, ticket_id)
+        self._notify([_written_row(payload, ticket_id, description, result)])
+
+    async def aupdate_ticket_by_id(
+        self,
+        ticket_id: UUID,
+        category: TicketCategory,
+        sentiment: SentimentType,
+        confidence_score: float,
+        reasoning: str,
+        processing_time_ms: int,
+        description: Optional[str] = None,
+        only_unprocessed: bool = True,
+    ) -> None:
+        """Versión asíncrona de update_ticket_by_id (no bloquea el event loop).
+
+        Raises:
+            TicketAlreadyProcessedError: Si el ticket ya estaba procesado.
+            SupabaseServiceError: Si falla la operación.
+        """
+        payload = _classification_payload(
+            category, sentiment, confidence_score, reasoning, processing_time_ms
+        )
+
+        try:
+            query = (
+                self.async_postgrest.table("tickets")
+                .update(payload)
+                .eq("id", str(ticket_id))
+            )
+            if only_unprocessed:
+                query = query.or_(UNPROCESSED_FILTER)
+            result = await query.execute()
+            current = None
+            if only_unprocessed and not getattr(result, "data", None):
+                current = await (
+                    self.async_postgrest.table("tickets")
+                    .select(PROCESSED_COLUMNS)
+                    .eq("id", str(ticket_id))
+                    .execute()
+                )
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al actualizar ticket en Supabase.")
+            raise SupabaseServiceError(
+                "Error al actualizar ticket en Supabase."
+            ) from exc
+
+        if current is not None:
+            _check_not_processed(current, ticket_id)
+        _check_update_result(result, ticket_id)
+        self._notify([_written_row(payload, ticket_id, description, result)])
+
+    def bulk_update_tickets(self, rows: List[Dict[str, Any]]) -> BulkUpdateResult:
+        """Guarda varias clasificaciones con una sola llamada.
+
+        Usa la función ``update_ticket_classifications`` de
+        ``supabase/setup.sql``: solo actualiza, así que un ticket_id que no
+        existe no se crea y queda en ``not_found``. Como update_ticket_by_id,
+        no sobrescribe un ticket ya procesado (queda en ``already_processed``)
+        salvo que la fila se haya construido con ``force``.
+
+        Args:
+            rows: Filas construidas con build_ticket_row (clave ``id``).
+
+        Returns:
+            Los ticket_ids actualizados, no encontrados y ya procesados.
+
+        Raises:
+            SupabaseServiceError: Si falla la operación.
+        """
+        if not rows:
+            return BulkUpdateResult()
+        try:
+            result = self._client.rpc(
+                "update_ticket_classifications", _bulk_params(rows)
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error en actualización masiva de tickets en Supabase.")
+            raise SupabaseServiceError(
+                "Error al guardar los tickets en Supabase."
+            ) from exc
+        return self._bulk_result(rows, result)
+
+    async def abulk_update_tickets(
+        self, rows: List[Dict[str, Any]]
+    ) -> BulkUpdateResult:
+        """Versión asíncrona de bulk_update_tickets.
+
+        Raises:
+            SupabaseServiceError: Si falla la operación.
+        """
+        if not rows:
+            return BulkUpdateResult()
+        try:
+            result = await self.async_postgrest.rpc(
+                "update_ticket_classifications", _bulk_params(rows)
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error en actualización masiva de tickets en Supabase.")
+            raise SupabaseServiceError(
+                "Error al guardar los tickets en Supabase."
+            ) from exc
+        return self._bulk_result(rows, result)
+
+    def _bulk_result(
+        self, rows: List[Dict[str, Any]], result: Any
+    ) -> BulkUpdateResult:
         error = getattr(result, "error", None)
         if error:
-            logger.error("Supabase error al actualizar ticket: %s", error)
+            logger.error("Supabase error en actualización masiva: %s", error)
             raise SupabaseServiceError(
-                "Supabase devolvió un error al actualizar el ticket."
+                "Supabase devolvió un error al guardar los tickets."
             )
-
-        data = getattr(result, "data", None) or []
-        if not data:
+        outcome = BulkUpdateResult()
+        created: Dict[str, Any] = {}
+        for item in getattr(result, "data", None) or []:
+            ticket_id = str(item.get("id"))
+            status = item.get("status")
+            if status == "updated":
+                outcome.updated.append(ticket_id)
+                created[ticket_id] = item.get("created_at")
+            elif status == "already_processed":
+                outcome.already_processed[ticket_id] = _stored_result(item)
+            else:
+                outcome.not_found.append(ticket_id)
+        if outcome.already_processed:
             logger.warning(
-                "No se encontró el ticket para actualizar: %s",
-                ticket_id,
+                "%d tickets ya procesados, no se sobrescribieron",
+                len(outcome.already_processed),
             )
-            raise SupabaseServiceError(
-                "No se encontró el ticket para actualizar."
+        if outcome.not_found:
+            logger.warning(
+                "No se encontraron %d tickets para actualizar: %s",
+                len(outcome.not_found),
+                ", ".join(outcome.not_found),
             )
+        self._notify(
+            [
+                {**row, "created_at": created[str(row["id"])]}
+                for row in rows
+                if str(row["id"]) in created
+            ]
+        )
+        return outcome
+
+    def fetch_processed_tickets(self, limit: int) -> List[Dict[str, Any]]:
+        """Tickets procesados más recientes, ordenados del más antiguo al más nuevo.
+
+        Args:
+            limit: Número máximo de filas.
+
+        Raises:
+            SupabaseServiceError: Si falla la operación.
+        """
+        try:
+            result = (
+                self._client.table("tickets")
+                .select(
+                    "id, description, category, sentiment, confidence_score, reasoning"
+                )
+                .eq("processed", True)
+                .order("created_at", desc=True)
+                .limit(limit)
+                .execute()
+            )
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al leer tickets procesados de Supabase.")
+            raise SupabaseServiceError(
+                "Error al leer tickets procesados de Supabase."
+            ) from exc
+        return list(reversed(getattr(result, "data", None) or []))
+
+    def claim_pending_tickets(
+        self, worker_id: str, limit: int, lease_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """Reserva tickets pendientes para este worker (``claim_pending_tickets``).
+
+        Args:
+            worker_id: Identificador del worker que reserva.
+            limit: Número máximo de tickets.
+            lease_seconds: Duración de la reserva antes de que otro la retome.
+
+        Returns:
+            Filas con ``id`` y ``description``.
+
+        Raises:
+            SupabaseServiceError: Si falla la operación.
+        """
+        try:
+            result = self._client.rpc(
+                "claim_pending_tickets",
+                _claim_params(worker_id, limit, lease_seconds),
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al reservar tickets pendientes en Supabase.")
+            raise SupabaseServiceError(
+                "Error al reservar tickets pendientes en Supabase."
+            ) from exc
+        return getattr(result, "data", None) or []
+
+    def reject_queued_tickets(
+        self, worker_id: str, ticket_ids: Sequence[str], reason: str
+    ) -> int:
+        """Saca de la cola tickets reservados que no se pueden procesar.
+
+        Args:
+            worker_id: Worker que tiene los tickets reservados.
+            ticket_ids: Tickets a descartar.
+            reason: Motivo que se guarda en ``queue_error``.
+
+        Returns:
+            Número de tickets descartados.
+
+        Raises:
+            SupabaseServiceError: Si falla la operación.
+        """
+        try:
+            result = self._client.rpc(
+                "reject_queued_tickets",
+                _reject_params(worker_id, ticket_ids, reason),
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al descartar tickets de la cola en Supabase.")
+            raise SupabaseServiceError(
+                "Error al descartar tickets de la cola en Supabase."
+            ) from exc
+        return int(getattr(result, "data", None) or 0)
+
+    def fetch_ticket_aggregates(self, bounds: Sequence[int]) -> Dict[str, Any]:
+        """Conteos de ``tickets`` agrupados (función ``get_ticket_aggregates``).
+
+        Args:
+            bounds: Límites de los buckets de ``processing_time_ms``.
+
+        Returns:
+            ``{"snapshot_at": ..., "groups": [...]}`` con un grupo por
+            combinación de processed, category, sentiment y bucket.
+
+        Raises:
+            SupabaseServiceError: Si falla la operación.
+        """
+        try:
+            result = self._client.rpc(
+                "get_ticket_aggregates", {"p_bounds": list(bounds)}
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al leer agregados de tickets de Supabase.")
+            raise SupabaseServiceError(
+                "Error al leer agregados de tickets de Supabase."
+            ) from exc
+        return getattr(result, "data", None) or {}
+
+    async def afetch_ticket_aggregates(self, bounds: Sequence[int]) -> Dict[str, Any]:
+        """Versión asíncrona de fetch_ticket_aggregates.
+
+        No registra el error: el reintento periódico de TicketStats decide
+        cuándo loguearlo.
+        """
+        try:
+            result = await self.async_postgrest.rpc(
+                "get_ticket_aggregates", {"p_bounds": list(bounds)}
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            raise SupabaseServiceError(
+                "Error al leer agregados de tickets de Supabase."
+            ) from exc
+        return getattr(result, "data", None) or {}
+
+    async def aclaim_pending_tickets(
+        self, worker_id: str, limit: int, lease_seconds: int
+    ) -> List[Dict[str, Any]]:
+        """Versión asíncrona de claim_pending_tickets."""
+        try:
+            result = await self.async_postgrest.rpc(
+                "claim_pending_tickets",
+                _claim_params(worker_id, limit, lease_seconds),
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al reservar tickets pendientes en Supabase.")
+            raise SupabaseServiceError(
+                "Error al reservar tickets pendientes en Supabase."
+            ) from exc
+        return getattr(result, "data", None) or []
+
+
+    async def areject_queued_tickets(
+        self, worker_id: str, ticket_ids: Sequence[str], reason: str
+    ) -> int:
+        """Versión asíncrona de reject_queued_tickets."""
+        try:
+            result = await self.async_postgrest.rpc(
+                "reject_queued_tickets",
+                _reject_params(worker_id, ticket_ids, reason),
+            ).execute()
+        except Exception as exc:  # pragma: no cover - error externo
+            logger.exception("Error al descartar tickets de la cola en Supabase.")
+            raise SupabaseServiceError(
+                "Error al descartar tickets de la cola en Supabase."
+            ) from exc
+        return int(getattr(result, "data", None) or 0)
+
+def build_ticket_row(
+    ticket_id: UUID,
+    description: str,
+    category: TicketCategory,
+    sentiment: SentimentType,
+    confidence_score: float,
+    reasoning: str,
+    processing_time_ms: int,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """Fila de ``tickets`` para bulk_update_tickets.
+
+    La descripción no se escribe; llega a los listeners. Con ``force`` la
+    fila sobrescribe el ticket aunque ya esté procesado.
+    """
+    row = _classification_payload(
+        category, sentiment, confidence_score, reasoning, processing_time_ms
+    )
+    row["id"] = str(ticket_id)
+    row["description"] = description
+    if force:
+        row["force"] = True
+    return row
+
+
+def _classification_payload(
+    category: TicketCategory,
+    sentiment: SentimentType,
+    confidence_score: float,
+    reasoning: str,
+    processing_time_ms: int,
+) -> Dict[str, Any]:
+    return {
+        "category": category.value,
+        "sentiment": sentiment.value,
+        "confidence_score": confidence_score,
+        "reasoning": reasoning,
+        "processed": True,
+        "processing_time_ms": processing_time_ms,
+    }
+
+
+def _written_row(
+    payload: Dict[str, Any], ticket_id: UUID, description: Optional[str], result: Any
+) -> Dict[str, Any]:
+    """Fila para los listeners: lo escrito más el created_at que devolvió la base."""
+    data = getattr(result, "data", None) or [{}]
+    return {
+        **payload,
+        "id": str(ticket_id),
+        "description": description,
+        "created_at": data[0].get("created_at"),
+    }
+
+
+def _bulk_params(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "p_rows": [
+            {key: value for key, value in row.items() if key != "description"}
+            for row in rows
+        ]
+    }
+
+
+def _claim_params(worker_id: str, limit: int, lease_seconds: int) -> Dict[str, Any]:
+    return {
+        "p_worker": worker_id,
+        "p_limit": limit,
+        "p_lease_seconds": lease_seconds,
+    }
+
+
+
+def _reject_params(
+    worker_id: str, ticket_ids: Sequence[str], reason: str
+) -> Dict[str, Any]:
+    return {"p_worker": worker_id, "p_ids": list(ticket_ids), "p_reason": reason}
+
+def _check_not_processed(result: Any, ticket_id: UUID) -> None:
+    """Lanza TicketAlreadyProcessedError si la fila leída ya está procesada."""
+    data = getattr(result, "data", None) or []
+    if not data or not data[0].get("processed"):
+        return
+    logger.warning("Ticket %s already processed, not overwritten", ticket_id)
+    raise TicketAlreadyProcessedError(ticket_id, _stored_result(data[0]))
+
+
+def _stored_result(row: Dict[str, Any]) -> Optional[TicketProcessResponse]:
+    """Clasificación guardada en una fila, o None si no es válida."""
+    try:
+        return TicketProcessResponse(
+            category=row["category"],
+            sentiment=row["sentiment"],
+            # DECIMAL: PostgREST puede devolver 1 en lugar de 1.0.
+            confidence_score=float(row["confidence_score"]),
+            reasoning=row.get("reasoning") or "",
+        )
+    except (KeyError, TypeError, ValueError, ValidationError):
+        return None
+
+
+def _check_update_result(result: Any, ticket_id: UUID) -> None:
+    error = getattr(result, "error", None)
+    if error:
+        logger.error("Supabase error al actualizar ticket: %s", error)
+        raise SupabaseServiceError(
+            "Supabase devolvió un error al actualizar el ticket."
+        )
+
+    data = getattr(result, "data", None) or []
+    if not data:
+        logger.warning(
+            "No se encontró el ticket para actualizar: %s",
+            ticket_id,
+        )
+        raise SupabaseServiceError(
+            "No se encontró el ticket para actualizar."
+        )
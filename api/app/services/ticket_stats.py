@@ -0,0 +1,271 @@
+"""Estadísticas de ``tickets`` mantenidas en memoria.
+
+``get_ticket_stats()`` recorre toda la tabla en cada llamada. ``TicketStats``
+se siembra con una sola consulta agrupada (``get_ticket_aggregates``), se
+actualiza con cada escritura correcta de SupabaseService (listener) y se
+reconcilia con la base cada TICKET_STATS_RECONCILE_SECONDS, así ``/stats``
+responde desde memoria sin tocar Supabase.
+
+Entre reconciliaciones los totales son aproximados: la API no ve los
+tickets que se insertan sin procesarse. Un ticket procesado cuenta como
+nuevo si se creó después de la última consulta (``created_at`` frente a
+``snapshot_at``) y como pendiente que pasa a procesado si ya existía. Las
+reclasificaciones de tickets procesados recientemente mueven sus conteos en
+lugar de sumarlos de nuevo; la escritura no informa el estado anterior del
+ticket, así que reprocesar uno que ya no está entre los recientes (``force``
+o un reintento de un respaldo de confianza 0) lo suma otra vez hasta la
+siguiente reconciliación.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.models import SentimentType, TicketCategory
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (exclusivos) de los buckets del histograma de latencia.
+LATENCY_BOUNDS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Espera entre reintentos de la consulta de agregados: se duplica hasta el tope.
+RETRY_SECONDS = 10.0
+MAX_RETRY_SECONDS = 600.0
+# PostgREST: la función no existe (falta aplicar supabase/setup.sql).
+_MISSING_FUNCTION = "PGRST202"
+
+# Lo que un ticket procesado suma a los agregados: categoría, sentimiento, ms.
+_Contribution = Tuple[Optional[str], Optional[str], Optional[int]]
+
+
+class TicketStats:
+    """Agregados de ``tickets`` actualizados de forma incremental."""
+
+    def __init__(
+        self,
+        bounds: Sequence[int] = LATENCY_BOUNDS_MS,
+        tracked_ids: int = 10000,
+    ) -> None:
+        self.bounds = tuple(bounds)
+        self._tracked_ids = tracked_ids
+        self._lock = threading.Lock()
+        self._reset_counts()
+        # Últimos tickets procesados y lo que sumaron, para reclasificaciones.
+        self._recent: "OrderedDict[str, _Contribution]" = OrderedDict()
+        self.snapshot_at: Optional[datetime] = None
+        self._loaded_at: Optional[float] = None
+        self.updates = 0
+        self.reclassified = 0
+        self.reconciliations = 0
+        self.last_drift: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["TicketStats"]:
+        """Crea el agregador si TICKET_STATS_ENABLED no es false."""
+        if os.getenv("TICKET_STATS_ENABLED", "true").lower() != "true":
+            return None
+        return cls(tracked_ids=int(os.getenv("TICKET_STATS_TRACKED_IDS", "10000")))
+
+    @property
+    def seeded(self) -> bool:
+        """True tras la primera consulta correcta a la base."""
+        return self.snapshot_at is not None
+
+    def _reset_counts(self) -> None:
+        self._total = 0
+        self._processed = 0
+        self._by_category: Dict[str, int] = {c.value: 0 for c in TicketCategory}
+        self._by_sentiment: Dict[str, int] = {s.value: 0 for s in SentimentType}
+        self._latency = [0] * (len(self.bounds) + 1)
+        self._latency_sum = 0
+        self._latency_count = 0
+
+    def _apply(self, contribution: _Contribution, sign: int) -> None:
+        category, sentiment, latency_ms = contribution
+        if category is not None:
+            self._by_category[category] = self._by_category.get(category, 0) + sign
+        if sentiment is not None:
+            self._by_sentiment[sentiment] = self._by_sentiment.get(sentiment, 0) + sign
+        if latency_ms is not None:
+            self._latency[bisect.bisect_right(self.bounds, latency_ms)] += sign
+            self._latency_sum += sign * latency_ms
+            self._latency_count += sign
+
+    def add_row(self, row: Dict[str, Any]) -> None:
+        """Suma una fila escrita en ``tickets`` (listener de SupabaseService)."""
+        if not row.get("processed") or row.get("id") is None:
+            return
+        ticket_id = str(row["id"])
+        contribution: _Contribution = (
+            row.get("category"),
+            row.get("sentiment"),
+            _as_int(row.get("processing_time_ms")),
+        )
+        created_at = _parse_timestamp(row.get("created_at"))
+        with self._lock:
+            previous = self._recent.pop(ticket_id, None)
+            if previous is not None:
+                self._apply(previous, -1)
+                self.reclassified += 1
+            else:
+                self._processed += 1
+                if self._is_new(created_at):
+                    self._total += 1
+            self._apply(contribution, 1)
+            self._recent[ticket_id] = contribution
+            if len(self._recent) > self._tracked_ids:
+                self._recent.popitem(last=False)
+            self.updates += 1
+
+    def _is_new(self, created_at: Optional[datetime]) -> bool:
+        # Se llama con self._lock tomado.
+        if created_at is not None and self.snapshot_at is not None:
+            return created_at > self.snapshot_at
+        # Sin created_at: nuevo solo si ya no quedan pendientes por procesar.
+        return self._processed > self._total
+
+    def load(self, aggregates: Dict[str, Any]) -> None:
+        """Reemplaza los agregados con el resultado de ``get_ticket_aggregates``."""
+        snapshot_at = _parse_timestamp(aggregates.get("snapshot_at"))
+        groups: List[Dict[str, Any]] = aggregates.get("groups") or []
+        with self._lock:
+            before = (self._total, self._processed)
+            self._reset_counts()
+            for group in groups:
+                count = int(group.get("tickets") or 0)
+                self._total += count
+                if group.get("processed"):
+                    self._processed += count
+                category = group.get("category")
+                if category is not None:
+                    self._by_category[category] = (
+                        self._by_category.get(category, 0) + count
+                    )
+                sentiment = group.get("sentiment")
+                if sentiment is not None:
+                    self._by_sentiment[sentiment] = (
+                        self._by_sentiment.get(sentiment, 0) + count
+                    )
+                bucket = group.get("latency_bucket")
+                if bucket is not None:
+                    self._latency[min(int(bucket), len(self.bounds))] += count
+                    self._latency_count += count
+                    self._latency_sum += int(group.get("latency_sum_ms") or 0)
+            if self.snapshot_at is not None:
+                self.last_drift = {
+                    "total_tickets": before[0] - self._total,
+                    "processed_tickets": before[1] - self._processed,
+                }
+                self.reconciliations += 1
+            self.snapshot_at = snapshot_at or datetime.now().astimezone()
+            self._loaded_at = time.monotonic()
+            total, processed = self._total, self._processed
+        logger.info("Ticket stats loaded: %d tickets, %d processed", total, processed)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Agregados actuales (mismos campos que ``get_ticket_stats()`` y más)."""
+        with self._lock:
+            total = self._total
+            processed = self._processed
+            by_category = dict(self._by_category)
+            by_sentiment = dict(self._by_sentiment)
+            latency = list(self._latency)
+            latency_sum = self._latency_sum
+            latency_count = self._latency_count
+            updates = self.updates
+        return {
+            "total_tickets": total,
+            "processed_tickets": processed,
+            "pending_tickets": max(total - processed, 0),
+            "avg_processing_time_ms": (
+                round(latency_sum / latency_count, 2) if latency_count else None
+            ),
+            "positivo_count": by_sentiment.get(SentimentType.POSITIVO.value, 0),
+            "neutral_count": by_sentiment.get(SentimentType.NEUTRAL.value, 0),
+            "negativo_count": by_sentiment.get(SentimentType.NEGATIVO.value, 0),
+            "by_category": by_category,
+            "by_sentiment": by_sentiment,
+            "latency_histogram_ms": [
+                {"lt": bound, "count": count}
+                for bound, count in zip(list(self.bounds) + [None], latency)
+            ],
+            "snapshot_at": self.snapshot_at.isoformat() if self.snapshot_at else None,
+            "seconds_since_reconcile": (
+                round(time.monotonic() - self._loaded_at, 1)
+                if self._loaded_at is not None
+                else None
+            ),
+            "updates": updates,
+            "reclassified": self.reclassified,
+            "reconciliations": self.reconciliations,
+            "last_drift": self.last_drift,
+        }
+
+    async def watch(self, registry: Any, interval: float) -> None:
+        """Siembra los agregados y los reconcilia cada ``interval`` segundos.
+
+        Con ``interval <= 0`` solo se siembran. Si la consulta falla se
+        reintenta con espera exponencial (de RETRY_SECONDS a
+        MAX_RETRY_SECONDS); la traza se registra solo en el primer fallo
+        seguido. Si falta la función ``get_ticket_aggregates`` se deja de
+        intentar.
+        """
+        failures = 0
+        while True:
+            try:
+                supabase = await registry.aget("supabase")
+                self.load(await supabase.afetch_ticket_aggregates(self.bounds))
+            except Exception as exc:
+                if _missing_function(exc):
+                    logger.error(
+                        "get_ticket_aggregates not found in Supabase, ticket stats "
+                        "disabled (apply supabase/setup.sql)"
+                    )
+                    return
+                delay = min(RETRY_SECONDS * 2**failures, MAX_RETRY_SECONDS)
+                logger.warning(
+                    "Ticket stats not loaded from Supabase, retrying in %.0fs: %s",
+                    delay,
+                    exc,
+                    exc_info=failures == 0,
+                )
+                failures += 1
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+
+def _missing_function(exc: BaseException) -> bool:
+    """True si PostgREST respondió que la función RPC no existe."""
+    cause: Optional[BaseException] = exc
+    while cause is not None:
+        if getattr(cause, "code", None) == _MISSING_FUNCTION:
+            return True
+        cause = cause.__cause__
+    return False
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.astimezone()
@@ -0,0 +1,200 @@
+"""Captura de tráfico de ``POST /process-ticket`` para reproducirlo después.
+
+Con TRAFFIC_CAPTURE_ENABLED=true el middleware registra cada request con su
+hora de llegada, el cuerpo tal cual llegó, el status, la duración y los
+tiempos por etapa de ``process_ticket``. Los registros se encolan y un hilo
+propio los escribe como JSONL comprimido con gzip en TRAFFIC_CAPTURE_DIR, en
+segmentos que rotan por tamaño; la request nunca espera al disco y, si la
+cola se llena, el registro se descarta y se cuenta.
+
+Cada worker escribe sus propios segmentos (``capture-<inicio>-<pid>.jsonl.gz``)
+y solo borra los suyos: TRAFFIC_CAPTURE_MAX_FILES es por worker.
+``python -m bench.replay`` los mezcla por hora de llegada.
+"""
+
+import glob
+import gzip
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Rutas cuyo tráfico se captura.
+CAPTURE_PATHS = frozenset({"/process-ticket"})
+# Clave del scope ASGI donde ``process_ticket`` deja sus tiempos por etapa.
+STAGES_SCOPE_KEY = "support_copilot.stages"
+
+_STOP = object()
+
+
+class TrafficCapture:
+    """Escritor en segundo plano de los segmentos de captura de un worker."""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        max_files: int = 20,
+        max_queue: int = 10000,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self._directory = directory
+        self._segment_bytes = segment_bytes
+        self._max_files = max_files
+        self._flush_interval = flush_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._file: Optional[gzip.GzipFile] = None
+        self._path: Optional[str] = None
+        self._written = 0
+        self.captured = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.segments = 0
+        self.bytes_written = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(
+            target=self._run, name="traffic-capture", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls) -> Optional["TrafficCapture"]:
+        """Crea la captura según TRAFFIC_CAPTURE_*; None si está desactivada."""
+        if os.getenv("TRAFFIC_CAPTURE_ENABLED", "false").lower() != "true":
+            return None
+        segment_mb = float(os.getenv("TRAFFIC_CAPTURE_SEGMENT_MB", "64"))
+        return cls(
+            directory=os.getenv("TRAFFIC_CAPTURE_DIR", "captures"),
+            segment_bytes=int(segment_mb * 1024 * 1024),
+            max_files=int(os.getenv("TRAFFIC_CAPTURE_MAX_FILES", "20")),
+            max_queue=int(os.getenv("TRAFFIC_CAPTURE_MAX_QUEUE", "10000")),
+        )
+
+    def record(
+        self,
+        arrived_at: float,
+        path: str,
+        body: bytes,
+        status_code: int,
+        duration_ms: float,
+        stages: Optional[Dict[str, float]],
+    ) -> None:
+        """Encola una request terminada; no bloquea."""
+        entry = {
+            "ts": arrived_at,
+            "path": path,
+            "body": body.decode("utf-8", errors="replace"),
+            "status": status_code,
+            "duration_ms": round(duration_ms, 3),
+            "stages": stages or {},
+        }
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            try:
+                entry = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                # Sin tráfico: lo escrito hasta ahora queda legible en disco.
+                self._flush()
+                continue
+            if entry is _STOP:
+                self._close_segment()
+                return
+            try:
+                self._write(orjson.dumps(entry) + b"\n")
+                self.captured += 1
+            except OSError:
+                self.write_errors += 1
+                logger.exception("Traffic capture write failed")
+                self._close_segment()
+
+    def _write(self, line: bytes) -> None:
+        if self._file is None or self._written >= self._segment_bytes:
+            self._close_segment()
+            self._open_segment()
+        assert self._file is not None
+        self._file.write(line)
+        self._written += len(line)
+        self.bytes_written += len(line)
+
+    def _open_segment(self) -> None:
+        started = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        self._path = os.path.join(
+            self._directory, f"capture-{started}-{os.getpid()}.jsonl.gz"
+        )
+        self._file = gzip.open(self._path, "ab")
+        self._written = 0
+        self.segments += 1
+        self._prune()
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            logger.exception("Traffic capture close failed")
+        self._file = None
+
+    def _flush(self) -> None:
+        if self._file is None:
+            return
+        try:
+            self._file.flush()
+        except OSError:
+            logger.exception("Traffic capture flush failed")
+
+    def _prune(self) -> None:
+        """Borra los segmentos más viejos de este worker.
+
+        Los de otros workers pueden estar abiertos; los de un proceso anterior
+        con el mismo pid cuentan como propios.
+        """
+        # Tras la hora de inicio el orden alfabético es el cronológico.
+        pattern = f"capture-*-{os.getpid()}.jsonl.gz"
+        files = sorted(glob.glob(os.path.join(self._directory, pattern)))
+        for path in files[: max(len(files) - self._max_files, 0)]:
+            if path == self._path:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                logger.warning("Traffic capture segment %s not removed", path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests capturadas y descartadas, segmento actual y bytes escritos."""
+        return {
+            "directory": self._directory,
+            "segment": self._path,
+            "segments": self.segments,
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "queued": self._queue.qsize(),
+            "write_errors": self.write_errors,
+            "bytes_written": self.bytes_written,
+        }
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Escribe lo encolado y cierra el segmento actual, hasta ``timeout``."""
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            # El hilo no vacía la cola (disco bloqueado): se abandona; es
+            # daemon y no impide que el proceso termine.
+            logger.warning(
+                "Traffic capture queue full at shutdown, %d entries dropped",
+                self._queue.qsize(),
+            )
+            return
+        self._thread.join(max(deadline - time.monotonic(), 0))
@@ -0,0 +1,318 @@
+"""Escritura diferida (write-behind) de clasificaciones en Supabase.
+
+Los endpoints encolan la fila y responden en cuanto termina la
+clasificación; una tarea de fondo agrupa las filas pendientes (la última
+por ticket gana) y las guarda con una sola llamada cada ``flush_interval``
+segundos o al llegar a ``max_rows`` (y en lotes de ``max_rows`` si se
+acumularon más, p. ej. tras una caída). Si Supabase no responde tras los
+reintentos, el lote se guarda en un archivo JSONL local y se reenvía en el
+siguiente flush, incluso después de reiniciar el proceso.
+
+Sin archivo de spill, las filas de un flush fallido vuelven a memoria. Con
+``max_pending`` filas pendientes el buffer deja de aceptar tickets nuevos y
+el endpoint guarda el ticket de forma síncrona, así una caída larga de
+Supabase no hace crecer la memoria sin límite.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.models import TicketProcessResponse
+from app.services.pipeline import bulk_update
+from app.services.supabase_service import SupabaseServiceError
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Buffer en memoria de filas de ``tickets`` pendientes de guardar."""
+
+    def __init__(
+        self,
+        registry: Any,
+        flush_interval: float = 0.2,
+        max_rows: int = 200,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        spill_path: Optional[str] = None,
+        max_pending: int = 10000,
+    ) -> None:
+        self._registry = registry
+        self._flush_interval = flush_interval
+        self._max_rows = max_rows
+        self._max_pending = max_pending
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._spill_path = spill_path
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._full = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._flush_lock = asyncio.Lock()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.retries = 0
+        self.failed_flushes = 0
+        self.spilled_rows = 0
+        self.not_found = 0
+        self.already_processed = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms: Optional[float] = None
+        self._total_flush_ms = 0.0
+
+    @classmethod
+    def from_env(cls, registry: Any) -> Optional["WriteBehindBuffer"]:
+        """Crea el buffer según WRITE_BEHIND_*; None si está desactivado."""
+        if os.getenv("WRITE_BEHIND_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            registry,
+            flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_MS", "200")) / 1000,
+            max_rows=int(os.getenv("WRITE_BEHIND_MAX_ROWS", "200")),
+            max_retries=int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "3")),
+            spill_path=os.getenv("WRITE_BEHIND_SPILL_PATH") or None,
+            max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000")),
+        )
+
+    def start(self) -> None:
+        """Lanza la tarea de flush periódico en el event loop actual."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """Encola una fila construida con build_ticket_row.
+
+        Returns:
+            False si el buffer está lleno (``max_pending``): la fila no se
+            encoló y quien llama debe guardarla por su cuenta.
+        """
+        with self._lock:
+            if row["id"] in self._pending:
+                self.coalesced += 1
+            elif len(self._pending) >= self._max_pending:
+                self.rejected += 1
+                return False
+            self._pending[row["id"]] = row
+            self.enqueued += 1
+            full = len(self._pending) >= self._max_rows
+        if full:
+            self._full.set()
+        return True
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._full.wait(), timeout=self._flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+    async def flush(self) -> int:
+        """Guarda las filas pendientes (y las del archivo de spill).
+
+        Se envían en llamadas de hasta ``max_rows`` filas. Tras el primer
+        lote que falla, las filas sin guardar van al spill (o vuelven a
+        memoria); si la tarea se cancela a mitad de camino, vuelven a memoria
+        y al spill antes de propagar la cancelación.
+
+        Returns:
+            Número de filas guardadas.
+        """
+        async with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            spilled = await asyncio.to_thread(self._read_spill)
+            if not pending and not spilled:
+                return 0
+            rows = {**spilled, **pending}
+            # Filas todavía sin confirmar por Supabase.
+            unsaved = dict(rows)
+            batch = list(rows.values())
+            try:
+                for start in range(0, len(batch), self._max_rows):
+                    chunk = batch[start : start + self._max_rows]
+                    t0 = time.perf_counter()
+                    if not await self._update_with_retry(chunk):
+                        break
+                    elapsed_ms = (time.perf_counter() - t0) * 1000
+                    for row in chunk:
+                        unsaved.pop(row["id"], None)
+                    with self._lock:
+                        self.flushes += 1
+                        self.rows_flushed += len(chunk)
+                        self.last_flush_ms = round(elapsed_ms, 3)
+                        self.max_flush_ms = max(self.max_flush_ms or 0.0, elapsed_ms)
+                        self._total_flush_ms += elapsed_ms
+            except asyncio.CancelledError:
+                self._keep_on_cancel(unsaved)
+                raise
+            saved = len(rows) - len(unsaved)
+            if not unsaved:
+                if spilled:
+                    await asyncio.to_thread(self._clear_spill)
+                return saved
+
+            with self._lock:
+                self.failed_flushes += 1
+            if self._spill_path:
+                try:
+                    await asyncio.to_thread(self._write_spill, list(unsaved.values()))
+                except OSError:
+                    logger.exception(
+                        "Write-behind spill to %s failed", self._spill_path
+                    )
+                else:
+                    with self._lock:
+                        self.spilled_rows = len(unsaved)
+                    logger.error(
+                        "Write-behind flush failed, %d rows spilled to %s",
+                        len(unsaved),
+                        self._spill_path,
+                    )
+                    return saved
+            # Sin spill disponible se reintentan en el siguiente flush.
+            with self._lock:
+                self._pending = {**unsaved, **self._pending}
+            logger.error(
+                "Write-behind flush failed, %d rows kept in memory", len(unsaved)
+            )
+            return saved
+
+    def _keep_on_cancel(self, unsaved: Dict[str, Dict[str, Any]]) -> None:
+        """Conserva las filas de un flush cancelado: en memoria y en el spill."""
+        with self._lock:
+            self._pending = {**unsaved, **self._pending}
+        if not self._spill_path:
+            return
+        try:
+            self._write_spill(list(unsaved.values()))
+        except OSError:
+            logger.exception("Write-behind spill to %s failed", self._spill_path)
+        else:
+            with self._lock:
+                self.spilled_rows = len(unsaved)
+
+    async def _update_with_retry(self, rows: List[Dict[str, Any]]) -> bool:
+        for attempt in range(self._max_retries + 1):
+            try:
+                supabase = await self._registry.aget("supabase")
+                written = await bulk_update(supabase, rows)
+                # Ya se respondió al cliente: los tickets inexistentes y los
+                # ya procesados solo se registran (bulk_update_tickets los
+                # loguea).
+                with self._lock:
+                    self.not_found += len(written.not_found)
+                    self.already_processed += len(written.already_processed)
+                self._remember_stored(written.already_processed)
+                return True
+            except (SupabaseServiceError, OSError) as exc:
+                if attempt == self._max_retries:
+                    logger.warning("Write-behind update failed: %s", exc)
+                    return False
+                with self._lock:
+                    self.retries += 1
+                await asyncio.sleep(self._retry_backoff * 2**attempt)
+        return False
+
+    def _remember_stored(
+        self, stored: Dict[str, Optional[TicketProcessResponse]]
+    ) -> None:
+        """Corrige el registro de idempotencia con lo que quedó en Supabase."""
+        idempotency = getattr(self._registry, "idempotency", None)
+        if idempotency is None:
+            return
+        for ticket_id, result in stored.items():
+            if result is not None:
+                idempotency.complete_stored(ticket_id, result)
+
+    def _read_spill(self) -> Dict[str, Dict[str, Any]]:
+        if not self._spill_path:
+            return {}
+        rows: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self._spill_path, encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        row = json.loads(line)
+                        rows[row["id"]] = row
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError):
+            logger.exception(
+                "Write-behind spill file %s unreadable", self._spill_path
+            )
+        return rows
+
+    def _write_spill(self, rows: List[Dict[str, Any]]) -> None:
+        tmp_path = f"{self._spill_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps(row, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self._spill_path)
+
+    def _clear_spill(self) -> None:
+        try:
+            os.remove(self._spill_path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.spilled_rows = 0
+
+    async def close(self) -> None:
+        """Detiene la tarea de fondo y hace un último flush.
+
+        La tarea no se cancela: se espera a que termine el flush en curso,
+        que ya sacó sus filas de memoria.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            self._full.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola, latencia de flush y contadores."""
+        with self._lock:
+            return {
+                "depth": len(self._pending),
+                "spilled_rows": self.spilled_rows,
+                "flush_interval_ms": self._flush_interval * 1000,
+                "max_rows": self._max_rows,
+                "max_pending": self._max_pending,
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "flushes": self.flushes,
+                "rows_flushed": self.rows_flushed,
+                "not_found": self.not_found,
+                "already_processed": self.already_processed,
+                "retries": self.retries,
+                "failed_flushes": self.failed_flushes,
+                "last_flush_ms": self.last_flush_ms,
+                "max_flush_ms": (
+                    round(self.max_flush_ms, 3) if self.max_flush_ms else None
+                ),
+                "avg_flush_ms": (
+                    round(self._total_flush_ms / self.flushes, 3)
+                    if self.flushes
+                    else None
+                ),
+            }
@@ -0,0 +1 @@
+"""Benchmarks y herramientas de carga de la API (ejecutar desde ``api/``)."""
@@ -0,0 +1,173 @@
+"""Benchmark del control de admisión: Hugging Face lento y tickets urgentes.
+
+Levanta ``bench.fake_hf`` con capacidad fija (``--slots``) y envía tickets a
+ritmo constante (``--rate`` por segundo, sin esperar respuestas). A mitad de
+la corrida el modelo se vuelve ``--slowdown`` veces más lento. Una fracción
+``--urgent-share`` de los tickets es negativa (prioridad ``high``). Cada
+ticket tiene un deadline de cliente (``--deadline-seconds``), como el timeout
+de n8n o del balanceador.
+
+Compara el LLM sin admisión frente a ``AdmissionLLMService`` y reporta, por
+prioridad, tickets a tiempo, rechazados (429), vencidos y latencias.
+
+Uso:
+    python -m bench.admission --rate 40 --seconds 20 --slots 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from app.models import TicketPriority
+from app.services.admission import (
+    AdmissionController,
+    AdmissionLLMService,
+    AdmissionRejectedError,
+    use_priority,
+)
+from app.services.llm_service import LLMService, TicketClassifier
+from bench.fake_hf import BackgroundServer, FakeModel, create_app
+
+TICKET = "La aplicación se cierra al exportar el reporte mensual."
+URGENT_TICKET = "Es la tercera vez que se cae el sistema, estoy harto y perdí ventas."
+
+
+def _summary(outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    latencies = sorted(o["ms"] for o in outcomes if o["status"] == "ok")
+    return {
+        "tickets": len(outcomes),
+        "ok": len(latencies),
+        "rejected": sum(1 for o in outcomes if o["status"] == "rejected"),
+        "timed_out": sum(1 for o in outcomes if o["status"] == "timeout"),
+        "errors": sum(1 for o in outcomes if o["status"] == "error"),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p99_ms": (
+            round(latencies[int((len(latencies) - 1) * 0.99)], 1) if latencies else None
+        ),
+    }
+
+
+async def _run_mode(
+    model: FakeModel, args: argparse.Namespace, admission: bool
+) -> Dict[str, Any]:
+    service: TicketClassifier = LLMService(
+        repo_id="fake/model", huggingface_api_token="bench"
+    )
+    controller = None
+    if admission:
+        controller = AdmissionController(
+            initial_limit=args.slots * 2,
+            max_queue=args.queue_size,
+            queue_timeout=args.deadline_seconds / 2,
+        )
+        service = AdmissionLLMService(service, controller)
+    rng = random.Random(1)
+    hf_before = model.requests
+    outcomes: List[Dict[str, Any]] = []
+
+    async def one(priority: TicketPriority) -> None:
+        text = URGENT_TICKET if priority is TicketPriority.HIGH else TICKET
+        t0 = time.perf_counter()
+        status = "ok"
+        try:
+            with use_priority(priority):
+                await asyncio.wait_for(
+                    service.aclassify_ticket(text), args.deadline_seconds
+                )
+        except AdmissionRejectedError:
+            status = "rejected"
+        except asyncio.TimeoutError:
+            status = "timeout"
+        except Exception:
+            status = "error"
+        outcomes.append(
+            {
+                "priority": priority.value,
+                "status": status,
+                "ms": (time.perf_counter() - t0) * 1000,
+            }
+        )
+
+    total = int(args.rate * args.seconds)
+    tasks = []
+    t_start = time.perf_counter()
+    for i in range(total):
+        if i == total // 2:
+            model.ttft_ms = args.ttft_ms * args.slowdown
+        urgent = rng.random() < args.urgent_share
+        priority = TicketPriority.HIGH if urgent else TicketPriority.NORMAL
+        tasks.append(asyncio.create_task(one(priority)))
+        await asyncio.sleep(max(t_start + (i + 1) / args.rate - time.perf_counter(), 0))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - t_start
+    await service.aclose()
+
+    result: Dict[str, Any] = {
+        "mode": "admission" if admission else "no_admission",
+        "wall_s": round(wall, 1),
+        # Llamadas que llegaron al modelo, incluidas las de tickets ya vencidos.
+        "hf_calls": model.requests - hf_before,
+        "all": _summary(outcomes),
+    }
+    for priority in (TicketPriority.HIGH, TicketPriority.NORMAL):
+        result[priority.value] = _summary(
+            [o for o in outcomes if o["priority"] == priority.value]
+        )
+    if controller is not None:
+        stats = controller.stats()
+        result["admission"] = {
+            key: stats[key]
+            for key in (
+                "limit",
+                "baseline_latency_ms",
+                "recent_latency_ms",
+                "increases",
+                "decreases",
+                "wait_p50_ms",
+                "wait_p99_ms",
+                "rejected",
+            )
+        }
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=40.0)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--ttft-ms", type=float, default=100.0)
+    parser.add_argument("--token-ms", type=float, default=1.0)
+    parser.add_argument("--slowdown", type=float, default=4.0)
+    parser.add_argument("--urgent-share", type=float, default=0.2)
+    parser.add_argument("--deadline-seconds", type=float, default=10.0)
+    parser.add_argument("--queue-size", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    os.environ["HF_TASK"] = "text-generation"
+    results = []
+    for offset, admission in enumerate((False, True)):
+        # Un servidor nuevo por modo: el anterior sigue procesando las
+        # llamadas de tickets vencidos.
+        model = FakeModel(
+            ttft_ms=args.ttft_ms, token_ms=args.token_ms, slots=args.slots
+        )
+        with BackgroundServer(create_app(model), args.port + offset) as server:
+            os.environ["HF_INFERENCE_URL"] = f"{server.url}/models"
+            result = asyncio.run(_run_mode(model, args, admission))
+        print(json.dumps(result))
+        results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""Servidor falso de la Inference API de Hugging Face para benchmarks.
+
+Simula un modelo de text-generation que tarda ``ttft_ms`` en el primer token
+y ``token_ms`` por token (con ruido uniforme o log-normal), escribe el JSON
+de clasificación y sigue generando texto de relleno hasta
+``max_new_tokens``, como hacen muchos modelos reales.
+Con ``"stream": true`` responde con eventos SSE estilo TGI y deja de generar
+cuando el cliente cierra la conexión. A los prompts de varios tickets
+(líneas ``[i] ...``) responde con un arreglo JSON, omitiendo cada elemento con
+probabilidad ``item_error_rate``. A los prompts del protocolo compacto
+responde con códigos cortos. Además de la ruta de la Inference API
+(``/models/<repo>``) expone las de un servidor TGI (``/generate``,
+``/generate_stream``) y la de uno compatible con OpenAI
+(``/v1/completions``), para probar los backends de ``LLM_BACKEND``. Con
+``slots > 0`` solo genera esa cantidad
+de respuestas a la vez, como un servidor con capacidad fija; el resto espera
+en cola.
+
+Uso:
+    python -m bench.fake_hf --port 8081 --token-ms 15 --distribution lognormal
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+COMPLETION = (
+    '{"category": "Técnico", "sentiment": "Negativo", "confidence_score": 0.91, '
+    '"reasoning": "El cliente reporta un error que le impide usar la aplicación."}'
+)
+ITEM = (
+    '{{"index": {index}, "category": "Técnico", "sentiment": "Negativo", '
+    '"confidence_score": 0.91, "reasoning": "Fallo técnico reportado."}}'
+)
+COMPACT_COMPLETION = '{"c": "T", "s": "-", "p": 91, "r": "Error impide usar la app"}'
+COMPACT_ITEM = '{{"i": {index}, "c": "T", "s": "-", "p": 91, "r": "Fallo técnico"}}'
+COMPACT_MARKER = "JSON compacto"
+TICKET_LINE = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+TRAILER = (
+    "\n\nExplicación: el ticket describe un fallo técnico y el tono del cliente "
+    "es de frustración, por lo que se clasifica como Técnico y Negativo. "
+)
+
+
+def tokenize(text: str, size: int = 4) -> List[str]:
+    """Parte un texto en tokens de ``size`` caracteres."""
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@dataclass
+class FakeModel:
+    """Perfil de latencia y errores del modelo simulado.
+
+    Con ``distribution="uniform"`` cada espera varía ±``jitter``; con
+    ``"lognormal"``, ``jitter`` es la sigma, lo que produce colas largas como
+    las de la Inference API real.
+    """
+
+    ttft_ms: float = 50.0
+    token_ms: float = 10.0
+    jitter: float = 0.2
+    error_rate: float = 0.0
+    distribution: str = "uniform"
+    seed: int = 1
+    item_error_rate: float = 0.0
+    slots: int = 0
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.errors = 0
+        self.tokens_generated = 0
+
+    def _delay(self, base_ms: float) -> float:
+        if base_ms <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribution == "lognormal":
+                value = self._rng.lognormvariate(math.log(base_ms), self.jitter)
+            else:
+                value = base_ms * (1 + self._rng.uniform(-self.jitter, self.jitter))
+        return max(value, 0.0) / 1000
+
+    def _fails(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def tokens(self, max_new_tokens: int, prompt: str = "") -> List[str]:
+        compact = COMPACT_MARKER in prompt
+        count = len(TICKET_LINE.findall(prompt))
+        if count:
+            with self._lock:
+                draws = [self._rng.random() for _ in range(count)]
+            kept = [i for i, draw in enumerate(draws) if draw >= self.item_error_rate]
+            item = COMPACT_ITEM if compact else ITEM
+            completion = "[" + ", ".join(item.format(index=i) for i in kept) + "]"
+        else:
+            completion = COMPACT_COMPLETION if compact else COMPLETION
+        return tokenize(completion + TRAILER * 20)[:max_new_tokens]
+
+    def _slot(self) -> AsyncContextManager[Any]:
+        if self.slots <= 0:
+            return contextlib.nullcontext()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.slots)
+        return self._semaphore
+
+    def _count(self, n: int = 1) -> None:
+        with self._lock:
+            self.tokens_generated += n
+
+    async def generate(self, request: Request) -> Any:
+        """Inference API de Hugging Face: ``{"inputs", "parameters", "stream"}``."""
+        body: Dict[str, Any] = await request.json()
+        parameters = body.get("parameters") or {}
+        return await self._respond(
+            body.get("inputs") or "",
+            int(parameters.get("max_new_tokens", 256)),
+            bool(body.get("stream")),
+            _tgi_event,
+            lambda text: [{"generated_text": text}],
+        )
+
+    async def tgi_generate(self, request: Request) -> Any:
+        """``/generate`` y ``/generate_stream`` de TGI."""
+        body: Dict[str, Any] = await request.json()
+        parameters = body.get("parameters") or {}
+        return await self._respond(
+            body.get("inputs") or "",
+            int(parameters.get("max_new_tokens", 256)),
+            request.url.path.endswith("_stream"),
+            _tgi_event,
+            lambda text: {"generated_text": text},
+        )
+
+    async def completions(self, request: Request) -> Any:
+        """``/v1/completions`` compatible con OpenAI."""
+        body: Dict[str, Any] = await request.json()
+        return await self._respond(
+            body.get("prompt") or "",
+            int(body.get("max_tokens") or 16),
+            bool(body.get("stream")),
+            _openai_event,
+            lambda text: {
+                "object": "text_completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "text": text, "finish_reason": "length"}],
+            },
+            done="data: [DONE]\n\n",
+        )
+
+    async def _respond(
+        self,
+        prompt: str,
+        max_new_tokens: int,
+        stream: bool,
+        event: Callable[[int, str], Dict[str, Any]],
+        render: Callable[[str], Any],
+        done: str = "",
+    ) -> Any:
+        tokens = self.tokens(max_new_tokens, prompt)
+        if self._fails():
+            await asyncio.sleep(self._delay(self.ttft_ms))
+            return JSONResponse({"error": "Model is overloaded"}, status_code=503)
+        if stream:
+            return StreamingResponse(
+                self._stream(tokens, event, done), media_type="text/event-stream"
+            )
+        async with self._slot():
+            await asyncio.sleep(
+                self._delay(self.ttft_ms) + self._delay(self.token_ms) * len(tokens)
+            )
+        self._count(len(tokens))
+        return JSONResponse(render("".join(tokens)))
+
+    async def _stream(
+        self,
+        tokens: List[str],
+        event: Callable[[int, str], Dict[str, Any]],
+        done: str,
+    ) -> Any:
+        async with self._slot():
+            await asyncio.sleep(self._delay(self.ttft_ms))
+            for index, text in enumerate(tokens):
+                if index:
+                    await asyncio.sleep(self._delay(self.token_ms))
+                self._count()
+                payload = json.dumps(event(index, text), ensure_ascii=False)
+                yield f"data:{payload}\n\n"
+        if done:
+            yield done
+
+    async def stats(self, request: Request) -> JSONResponse:
+        with self._lock:
+            return JSONResponse(
+                {
+                    "requests": self.requests,
+                    "errors": self.errors,
+                    "tokens_generated": self.tokens_generated,
+                }
+            )
+
+
+def _tgi_event(index: int, text: str) -> Dict[str, Any]:
+    return {
+        "token": {"id": index, "text": text, "special": False},
+        "generated_text": None,
+        "details": None,
+    }
+
+
+def _openai_event(index: int, text: str) -> Dict[str, Any]:
+    return {
+        "object": "text_completion",
+        "choices": [{"index": 0, "text": text, "finish_reason": None}],
+    }
+
+
+def create_app(model: FakeModel) -> Starlette:
+    return Starlette(
+        routes=[
+            Route("/models/{repo:path}", model.generate, methods=["POST"]),
+            Route("/generate", model.tgi_generate, methods=["POST"]),
+            Route("/generate_stream", model.tgi_generate, methods=["POST"]),
+            Route("/v1/completions", model.completions, methods=["POST"]),
+            Route("/stats", model.stats),
+        ]
+    )
+
+
+class BackgroundServer:
+    """Ejecuta una app ASGI con uvicorn en un hilo (para los benchmarks)."""
+
+    def __init__(self, app: Any, port: int) -> None:
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> "BackgroundServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--distribution", choices=("uniform", "lognormal"), default="uniform"
+    )
+    parser.add_argument("--item-error-rate", type=float, default=0.0)
+    parser.add_argument("--slots", type=int, default=0)
+    args = parser.parse_args()
+    model = FakeModel(
+        args.ttft_ms,
+        args.token_ms,
+        args.jitter,
+        args.error_rate,
+        args.distribution,
+        item_error_rate=args.item_error_rate,
+        slots=args.slots,
+    )
+    uvicorn.run(create_app(model), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
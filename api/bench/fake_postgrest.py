@@ -0,0 +1,274 @@
+"""Servidor falso de PostgREST (tabla ``tickets``) para benchmarks.
+
+Implementa lo que usa SupabaseService: PATCH por id (con el filtro ``or`` de
+la actualización condicional solo escribe tickets pendientes o con confianza
+0), SELECT por id o de tickets procesados y las funciones
+``update_ticket_classifications``, ``claim_pending_tickets``,
+``reject_queued_tickets`` y ``get_ticket_aggregates`` (que tampoco
+sobrescribe tickets ya procesados sin ``force``). A diferencia de la base
+real, los tickets que no existen se crean al actualizarlos, así el generador
+de carga no necesita sembrar la tabla.
+
+Uso:
+    python -m bench.fake_postgrest --port 8082 --latency-ms 40 --pending 1000
+"""
+
+import argparse
+import asyncio
+import bisect
+import random
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Clasificación guardada que devuelve ``update_ticket_classifications``.
+STORED_FIELDS = ("category", "sentiment", "confidence_score", "reasoning")
+
+# Clave con forma de JWT: supabase-py rechaza claves que no lo parezcan.
+SERVICE_ROLE_KEY = (
+    "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9."
+    "eyJyb2xlIjoic2VydmljZV9yb2xlIn0."
+    "ZmFrZS1zaWduYXR1cmU"
+)
+
+
+class FakeTickets:
+    """Tabla ``tickets`` en memoria con latencia y errores configurables."""
+
+    def __init__(
+        self,
+        latency_ms: float = 30.0,
+        jitter: float = 0.3,
+        error_rate: float = 0.0,
+        seed: int = 2,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        self.errors = 0
+
+    def seed_pending(self, count: int) -> None:
+        """Crea ``count`` tickets sin procesar (para el worker de cola)."""
+        for i in range(count):
+            ticket_id = str(uuid.uuid4())
+            self.rows[ticket_id] = {
+                "id": ticket_id,
+                "created_at": _now(),
+                "description": f"Ticket pendiente {i}: no puedo exportar el reporte.",
+                "processed": False,
+            }
+
+    async def _io(self, call: str) -> bool:
+        """Simula la latencia de red; devuelve False si la llamada debe fallar."""
+        with self._lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+        await asyncio.sleep(max(self.latency_ms * factor, 0.0) / 1000)
+        return not failed
+
+    @staticmethod
+    def _error() -> JSONResponse:
+        return JSONResponse(
+            {"message": "fake outage", "code": "57P01"}, status_code=503
+        )
+
+    async def tickets(self, request: Request) -> JSONResponse:
+        method = request.method
+        if not await self._io(method):
+            return self._error()
+        if method == "PATCH":
+            ticket_id = request.query_params.get("id", "").removeprefix("eq.")
+            payload = await request.json()
+            with self._lock:
+                row = self.rows.setdefault(
+                    ticket_id, {"id": ticket_id, "created_at": _now()}
+                )
+                if "or" in request.query_params and (
+                    row.get("processed") and row.get("confidence_score")
+                ):
+                    return JSONResponse([])
+                row.update(payload)
+                return JSONResponse([dict(row)])
+        if "id" in request.query_params:
+            ticket_id = request.query_params["id"].removeprefix("eq.")
+            with self._lock:
+                found = self.rows.get(ticket_id)
+                return JSONResponse([dict(found)] if found else [])
+        limit = int(request.query_params.get("limit", "1000"))
+        with self._lock:
+            processed = [r for r in self.rows.values() if r.get("processed")]
+        return JSONResponse(processed[-limit:][::-1])
+
+    async def update_many(self, request: Request) -> JSONResponse:
+        if not await self._io("update_many"):
+            return self._error()
+        rows: List[Dict[str, Any]] = (await request.json())["p_rows"]
+        written = []
+        with self._lock:
+            for payload in rows:
+                row = self.rows.setdefault(
+                    payload["id"], {"id": payload["id"], "created_at": _now()}
+                )
+                force = payload.pop("force", False)
+                stored = row.get("processed") and row.get("confidence_score")
+                if stored and not force:
+                    written.append(
+                        {
+                            "id": row["id"],
+                            "status": "already_processed",
+                            "created_at": row["created_at"],
+                            **{key: row.get(key) for key in STORED_FIELDS},
+                        }
+                    )
+                    continue
+                row.update(payload)
+                written.append(
+                    {
+                        "id": row["id"],
+                        "status": "updated",
+                        "created_at": row["created_at"],
+                    }
+                )
+        return JSONResponse(written)
+
+    async def claim(self, request: Request) -> JSONResponse:
+        if not await self._io("claim"):
+            return self._error()
+        params = await request.json()
+        claimed: List[Dict[str, Any]] = []
+        with self._lock:
+            for row in self.rows.values():
+                if len(claimed) >= params["p_limit"]:
+                    break
+                if (
+                    not row.get("processed")
+                    and not row.get("claimed_by")
+                    and not row.get("queue_error")
+                ):
+                    row["claimed_by"] = params["p_worker"]
+                    claimed.append(
+                        {"id": row["id"], "description": row["description"]}
+                    )
+        return JSONResponse(claimed)
+
+    async def reject(self, request: Request) -> JSONResponse:
+        if not await self._io("reject"):
+            return self._error()
+        params = await request.json()
+        rejected = 0
+        with self._lock:
+            for ticket_id in params["p_ids"]:
+                row = self.rows.get(ticket_id)
+                if row is not None and row.get("claimed_by") == params["p_worker"]:
+                    row["queue_error"] = params["p_reason"]
+                    row["claimed_by"] = None
+                    rejected += 1
+        return JSONResponse(rejected)
+
+    async def aggregates(self, request: Request) -> JSONResponse:
+        if not await self._io("aggregates"):
+            return self._error()
+        bounds = (await request.json())["p_bounds"]
+        groups: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        with self._lock:
+            for row in self.rows.values():
+                latency: Optional[int] = row.get("processing_time_ms")
+                bucket = None
+                if latency is not None:
+                    bucket = bisect.bisect_right(bounds, latency)
+                key = (
+                    bool(row.get("processed")),
+                    row.get("category"),
+                    row.get("sentiment"),
+                    bucket,
+                )
+                group = groups.setdefault(
+                    key,
+                    {
+                        "processed": key[0],
+                        "category": key[1],
+                        "sentiment": key[2],
+                        "latency_bucket": bucket,
+                        "tickets": 0,
+                        "latency_sum_ms": None,
+                    },
+                )
+                group["tickets"] += 1
+                if latency is not None:
+                    group["latency_sum_ms"] = (group["latency_sum_ms"] or 0) + latency
+        return JSONResponse({"snapshot_at": _now(), "groups": list(groups.values())})
+
+    async def stats(self, request: Request) -> JSONResponse:
+        with self._lock:
+            processed = sum(1 for r in self.rows.values() if r.get("processed"))
+            return JSONResponse(
+                {
+                    "rows": len(self.rows),
+                    "processed": processed,
+                    "calls": dict(self.calls),
+                    "errors": self.errors,
+                }
+            )
+
+
+def create_app(table: FakeTickets) -> Starlette:
+    return Starlette(
+        routes=[
+            Route(
+                "/rest/v1/tickets",
+                table.tickets,
+                methods=["GET", "PATCH"],
+            ),
+            Route(
+                "/rest/v1/rpc/update_ticket_classifications",
+                table.update_many,
+                methods=["POST"],
+            ),
+            Route(
+                "/rest/v1/rpc/claim_pending_tickets", table.claim, methods=["POST"]
+            ),
+            Route(
+                "/rest/v1/rpc/reject_queued_tickets", table.reject, methods=["POST"]
+            ),
+            Route(
+                "/rest/v1/rpc/get_ticket_aggregates",
+                table.aggregates,
+                methods=["POST"],
+            ),
+            Route("/stats", table.stats),
+        ]
+    )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--pending", type=int, default=0)
+    args = parser.parse_args()
+    table = FakeTickets(args.latency_ms, args.jitter, args.error_rate)
+    table.seed_pending(args.pending)
+    uvicorn.run(create_app(table), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
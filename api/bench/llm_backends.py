@@ -0,0 +1,123 @@
+"""Benchmark de los backends del LLM contra el servidor falso.
+
+Levanta ``bench.fake_hf`` (que expone las rutas de la Inference API, de TGI y
+de ``/v1/completions``) y clasifica los mismos tickets con cada valor de
+LLM_BACKEND, midiendo throughput, latencia y conexiones nuevas del pool.
+Sirve también como prueba de punta a punta de un backend contra un servidor
+local.
+
+Uso:
+    python -m bench.llm_backends --requests 300 --concurrency 32 --sync
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+from app.services.http_pool import PoolStats
+from app.services.llm_service import LLMService
+from bench.fake_hf import BackgroundServer, FakeModel, create_app
+
+BACKENDS = ("huggingface", "tgi", "openai")
+TICKET = "La aplicación se cierra al exportar el reporte mensual y no puedo trabajar."
+
+
+async def _run_backend(
+    backend: str, requests: int, concurrency: int, sync: bool
+) -> Dict[str, Any]:
+    os.environ["LLM_BACKEND"] = backend
+    pool_stats = PoolStats()
+    service = LLMService(
+        repo_id="fake/model", huggingface_api_token="bench", pool_stats=pool_stats
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    # Un hilo por request concurrente, como el threadpool de FastAPI.
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+    errors = 0
+
+    async def one() -> None:
+        nonlocal errors
+        async with semaphore:
+            t0 = time.perf_counter()
+            try:
+                if sync:
+                    await loop.run_in_executor(
+                        executor, service.classify_ticket, TICKET
+                    )
+                else:
+                    await service.aclassify_ticket(TICKET)
+            except Exception:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - t0
+    pool = pool_stats.snapshot()
+    executor.shutdown()
+    await service.aclose()
+    latencies.sort()
+    return {
+        "backend": backend,
+        "path": "sync" if sync else "async",
+        "streaming": os.getenv("LLM_STREAMING") == "true",
+        "requests": requests,
+        "errors": errors,
+        "req_per_s": round(requests / wall, 1),
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p95_ms": (
+            round(latencies[int(len(latencies) * 0.95) - 1], 1) if latencies else None
+        ),
+        "new_connections": pool["new_connections"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=1.0)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sync", action="store_true", help="Mide classify_ticket")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    model = FakeModel(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    with BackgroundServer(create_app(model), args.port) as server:
+        os.environ.update(
+            {
+                "HF_INFERENCE_URL": f"{server.url}/models",
+                "HF_TASK": "text-generation",
+                "LLM_STREAMING": "true" if args.streaming else "false",
+                "LLM_BACKEND_MAX_CONCURRENCY": str(args.max_concurrency),
+            }
+        )
+        results = []
+        for backend in args.backends.split(","):
+            os.environ["LLM_BACKEND_URL"] = (
+                f"{server.url}/v1" if backend == "openai" else server.url
+            )
+            result = asyncio.run(
+                _run_backend(backend, args.requests, args.concurrency, args.sync)
+            )
+            print(json.dumps(result))
+            results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""Prueba de carga de punta a punta de la API contra Hugging Face y PostgREST falsos.
+
+Levanta ``bench.fake_hf`` y ``bench.fake_postgrest`` como procesos aparte,
+arranca ``main:app`` con uvicorn y envía tickets a ``/process-ticket`` con la
+concurrencia indicada. Reporta req/s, tasa de errores, latencia del cliente,
+p50/p95/p99 por etapa (a partir de ``/metrics`` de cada worker) y CPU/RSS de
+cada worker (lee ``/proc``, solo Linux). Los resultados se guardan en JSON
+para comparar commits.
+
+Uso:
+    python -m bench.loadtest --workers 2 --concurrency 32 --requests 2000 \\
+        --hf-distribution lognormal --env LLM_STREAMING=true --output run.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter as CounterDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from bench.fake_postgrest import SERVICE_ROLE_KEY
+
+_SAMPLE_RE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+WORDS = (
+    "cuenta acceso reporte pedido envío contraseña plan soporte aplicación web "
+    "factura cobro tarjeta error servidor pantalla botón exportar usuario correo "
+    "integración precio demora urgente lento bloqueo sesión móvil descarga "
+    "actualización licencia"
+).split()
+DESCRIPTIONS = [
+    "La aplicación se cierra cada vez que intento exportar el reporte mensual.",
+    "Me llegó un cargo duplicado en mi tarjeta, revisen la factura por favor.",
+    "Quisiera saber si tienen planes empresariales y cómo es el onboarding.",
+    "Excelente atención, resolvieron mi problema en pocos minutos. Gracias.",
+    "No puedo conectarme al servidor, aparece el código 500 desde ayer.",
+]
+
+Metrics = Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]
+
+
+@contextmanager
+def _process(args: List[str], env: Dict[str, str]) -> Iterator[subprocess.Popen]:
+    proc = subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL)
+    try:
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout:.0f}s")
+
+
+def parse_metrics(text: str) -> Metrics:
+    """Muestras de un scrape de Prometheus indexadas por nombre y etiquetas."""
+    samples: Metrics = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        key = tuple(sorted(_LABEL_RE.findall(labels or "")))
+        samples[(name, key)] = float(value)
+    return samples
+
+
+def scrape_workers(api_url: str, workers: int) -> Dict[str, Metrics]:
+    """Un scrape de /metrics por worker (conexiones nuevas hasta verlos todos)."""
+    seen: Dict[str, Metrics] = {}
+    for _ in range(max(workers, 1) * 40):
+        response = httpx.get(
+            f"{api_url}/metrics", headers={"Connection": "close"}, timeout=5.0
+        )
+        samples = parse_metrics(response.text)
+        pids = [
+            dict(labels)["pid"]
+            for name, labels in samples
+            if name == "support_copilot_worker_info"
+        ]
+        if pids:
+            seen[pids[0]] = samples
+        if len(seen) >= workers:
+            break
+    if len(seen) < workers:
+        print(
+            f"aviso: solo se vieron {len(seen)} de {workers} workers", file=sys.stderr
+        )
+    return seen
+
+
+def stage_percentiles(
+    before: Dict[str, Metrics], after: Dict[str, Metrics]
+) -> Dict[str, Dict[str, Optional[float]]]:
+    """p50/p95/p99 por etapa sumando los buckets de todos los workers."""
+    buckets: Dict[str, Dict[float, float]] = {}
+    sums: Dict[str, float] = {}
+    for pid, samples in after.items():
+        previous = before.get(pid, {})
+        for (name, labels), value in samples.items():
+            delta = value - previous.get((name, labels), 0.0)
+            label_map = dict(labels)
+            stage = label_map.get("stage")
+            if name == "support_copilot_stage_duration_seconds_bucket":
+                bound = float(label_map["le"])
+                stage_buckets = buckets.setdefault(stage, {})
+                stage_buckets[bound] = stage_buckets.get(bound, 0.0) + delta
+            elif name == "support_copilot_stage_duration_seconds_sum":
+                sums[stage] = sums.get(stage, 0.0) + delta
+
+    result: Dict[str, Dict[str, Optional[float]]] = {}
+    for stage, cumulative in sorted(buckets.items()):
+        bounds = sorted(cumulative)
+        count = cumulative[bounds[-1]]
+        if not count:
+            continue
+        result[stage] = {
+            "count": count,
+            "mean_ms": round(sums.get(stage, 0.0) / count * 1000, 3),
+            "p50_ms": _bucket_quantile(bounds, cumulative, 0.50),
+            "p95_ms": _bucket_quantile(bounds, cumulative, 0.95),
+            "p99_ms": _bucket_quantile(bounds, cumulative, 0.99),
+        }
+    return result
+
+
+def _bucket_quantile(
+    bounds: List[float], cumulative: Dict[float, float], q: float
+) -> Optional[float]:
+    target = q * cumulative[bounds[-1]]
+    lower, lower_count = 0.0, 0.0
+    for bound in bounds:
+        count = cumulative[bound]
+        if count >= target:
+            if bound == float("inf"):
+                return round(lower * 1000, 3)
+            span = count - lower_count
+            fraction = (target - lower_count) / span if span else 1.0
+            return round((lower + (bound - lower) * fraction) * 1000, 3)
+        lower, lower_count = bound, count
+    return None
+
+
+def _proc_usage(pid: str) -> Dict[str, float]:
+    ticks = os.sysconf("SC_CLK_TCK")
+    with open(f"/proc/{pid}/stat", encoding="utf-8") as fh:
+        fields = fh.read().rsplit(")", 1)[1].split()
+    memory: Dict[str, float] = {}
+    with open(f"/proc/{pid}/status", encoding="utf-8") as fh:
+        for line in fh:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                memory[key] = int(value.split()[0]) / 1024
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks,
+        "rss_mb": memory.get("VmRSS", 0.0),
+        "peak_rss_mb": memory.get("VmHWM", 0.0),
+    }
+
+
+async def _drive(
+    api_url: str,
+    requests: int,
+    concurrency: int,
+    duplicate_ratio: float,
+) -> Dict[str, Any]:
+    rng = random.Random(3)
+    latencies: List[float] = []
+    statuses: CounterDict = CounterDict()
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=api_url, limits=limits, timeout=60
+    ) as client:
+
+        async def one() -> None:
+            if rng.random() < duplicate_ratio:
+                text = rng.choice(DESCRIPTIONS)
+            else:
+                # Texto aleatorio para que no lo resuelvan la caché ni el
+                # índice de casi duplicados.
+                words = rng.randint(10, 20)
+                text = " ".join(rng.choice(WORDS) for _ in range(words))
+            body = {"ticket_id": str(uuid.uuid4()), "description": text}
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    response = await client.post("/process-ticket", json=body)
+                    statuses[str(response.status_code)] += 1
+                except httpx.HTTPError as exc:
+                    statuses[type(exc).__name__] += 1
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        wall = time.perf_counter() - t0
+
+    latencies.sort()
+    errors = sum(count for code, count in statuses.items() if code != "200")
+    return {
+        "requests": requests,
+        "seconds": round(wall, 3),
+        "req_per_s": round(requests / wall, 1),
+        "error_rate": round(errors / requests, 4),
+        "status_counts": dict(statuses),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    base_env = dict(os.environ)
+    hf_url = f"http://127.0.0.1:{args.hf_port}"
+    pg_url = f"http://127.0.0.1:{args.pg_port}"
+    api_url = f"http://127.0.0.1:{args.port}"
+    app_env = {
+        **base_env,
+        "MOCK_LLM": "false",
+        "HUGGINGFACEHUB_API_TOKEN": "bench",
+        "HF_MODEL_ID": "fake/model",
+        "HF_TASK": "text-generation",
+        "HF_INFERENCE_URL": f"{hf_url}/models",
+        "SUPABASE_URL": pg_url,
+        "SUPABASE_SERVICE_ROLE_KEY": SERVICE_ROLE_KEY,
+        "SERVICE_RELOAD_INTERVAL_SECONDS": "0",
+        "ENVIRONMENT": "production",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        app_env[key] = value
+
+    hf_cmd = [
+        sys.executable, "-m", "bench.fake_hf",
+        "--port", str(args.hf_port),
+        "--ttft-ms", str(args.hf_ttft_ms),
+        "--token-ms", str(args.hf_token_ms),
+        "--jitter", str(args.hf_jitter),
+        "--distribution", args.hf_distribution,
+        "--error-rate", str(args.hf_error_rate),
+    ]
+    pg_cmd = [
+        sys.executable, "-m", "bench.fake_postgrest",
+        "--port", str(args.pg_port),
+        "--latency-ms", str(args.pg_latency_ms),
+        "--error-rate", str(args.pg_error_rate),
+    ]
+    api_cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--port", str(args.port),
+        "--workers", str(args.workers),
+        "--log-level", "warning",
+    ]
+
+    with _process(hf_cmd, base_env), _process(pg_cmd, base_env):
+        _wait_ready(f"{hf_url}/stats")
+        _wait_ready(f"{pg_url}/stats")
+        with _process(api_cmd, app_env):
+            _wait_ready(f"{api_url}/health")
+            if args.warmup:
+                asyncio.run(_drive(api_url, args.warmup, args.concurrency, 0.0))
+            before = scrape_workers(api_url, args.workers)
+            usage_before = {pid: _proc_usage(pid) for pid in before}
+            client = asyncio.run(
+                _drive(api_url, args.requests, args.concurrency, args.duplicate_ratio)
+            )
+            after = scrape_workers(api_url, args.workers)
+            workers = []
+            for pid in sorted(after):
+                usage = _proc_usage(pid)
+                cpu = usage["cpu_seconds"] - usage_before.get(pid, usage)["cpu_seconds"]
+                workers.append(
+                    {
+                        "pid": int(pid),
+                        "cpu_percent": round(cpu / client["seconds"] * 100, 1),
+                        "rss_mb": round(usage["rss_mb"], 1),
+                        "peak_rss_mb": round(usage["peak_rss_mb"], 1),
+                    }
+                )
+            stages = stage_percentiles(before, after)
+        fakes = {
+            "huggingface": httpx.get(f"{hf_url}/stats").json(),
+            "postgrest": httpx.get(f"{pg_url}/stats").json(),
+        }
+
+    return {
+        "label": args.label,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duplicate_ratio": args.duplicate_ratio,
+            "hf": {
+                "ttft_ms": args.hf_ttft_ms,
+                "token_ms": args.hf_token_ms,
+                "jitter": args.hf_jitter,
+                "distribution": args.hf_distribution,
+                "error_rate": args.hf_error_rate,
+            },
+            "postgrest": {
+                "latency_ms": args.pg_latency_ms,
+                "error_rate": args.pg_error_rate,
+            },
+            "env": args.env,
+        },
+        "client": client,
+        "stages": stages,
+        "workers": workers,
+        "fakes": fakes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--label", default="")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument(
+        "--duplicate-ratio",
+        type=float,
+        default=0.0,
+        help="Fracción de tickets repetidos (ejercita caché y casi duplicados)",
+    )
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--hf-port", type=int, default=8091)
+    parser.add_argument("--pg-port", type=int, default=8092)
+    parser.add_argument("--hf-ttft-ms", type=float, default=50.0)
+    parser.add_argument("--hf-token-ms", type=float, default=2.0)
+    parser.add_argument("--hf-jitter", type=float, default=0.3)
+    parser.add_argument(
+        "--hf-distribution", choices=("uniform", "lognormal"), default="lognormal"
+    )
+    parser.add_argument("--hf-error-rate", type=float, default=0.0)
+    parser.add_argument("--pg-latency-ms", type=float, default=30.0)
+    parser.add_argument("--pg-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Variable de entorno para la API (repetible)",
+    )
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
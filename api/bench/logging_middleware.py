@@ -0,0 +1,167 @@
+"""Benchmark del middleware de logging: BaseHTTPMiddleware frente a ASGI puro.
+
+Sirve la API en proceso (``httpx.ASGITransport``) con MOCK_LLM=true y un
+PostgREST falso sin latencia, para que el costo del middleware y del logging
+no quede oculto detrás del LLM. Compara:
+
+- ``legacy``: el ``BaseHTTPMiddleware`` anterior con logs de texto escritos
+  en el hilo de la request;
+- ``asgi``: el middleware ASGI con logs JSON en el mismo hilo;
+- ``asgi+queue``: además, formato y escritura en el hilo del QueueListener;
+- ``asgi+queue+sample``: además, ``LOG_SAMPLE_RATE`` de las respuestas 2xx.
+
+Los logs van a un archivo temporal con nivel INFO. Con ``--path`` se mide
+otra ruta GET (p. ej. ``/health/cache``) para aislar el costo por request.
+
+Uso:
+    python -m bench.logging_middleware --requests 3000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+import main as api_main
+from app.routers.system import router as system_router
+from app.routers.tickets import router as tickets_router
+from app.services.log_pipeline import configure_logging
+from bench.fake_hf import BackgroundServer
+from bench.fake_postgrest import SERVICE_ROLE_KEY, FakeTickets, create_app
+
+logger = logging.getLogger("main")
+
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    """Copia del middleware anterior, como referencia."""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        start_time = time.perf_counter()
+        logger.info("%s %s", request.method, request.url.path)
+        response = await call_next(request)
+        logger.info(
+            "%s %s - %d (%.2fms)",
+            request.method,
+            request.url.path,
+            response.status_code,
+            (time.perf_counter() - start_time) * 1000,
+        )
+        return response
+
+
+def _build_app(variant: str, sample_rate: float) -> FastAPI:
+    app = FastAPI(lifespan=api_main.lifespan)
+    if variant == "legacy":
+        app.add_middleware(LegacyLoggingMiddleware)
+    else:
+        app.add_middleware(api_main.LoggingMiddleware, sample_rate=sample_rate)
+    app.include_router(tickets_router)
+    app.include_router(system_router)
+    return app
+
+
+async def _run_variant(
+    variant: str, requests: int, concurrency: int, sample_rate: float, path: str
+) -> Dict[str, Any]:
+    os.environ["LOG_QUEUE_ENABLED"] = "true" if "queue" in variant else "false"
+    os.environ["LOG_FORMAT"] = "text" if variant == "legacy" else "json"
+    rate = sample_rate if variant.endswith("sample") else 1.0
+    with tempfile.NamedTemporaryFile("w", suffix=".log") as log_file:
+        listener = configure_logging(logging.INFO, stream=log_file)
+        app = _build_app(variant, rate)
+        transport = httpx.ASGITransport(app=app)
+        latencies: List[float] = []
+        async with api_main.lifespan(app), httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one(i: int) -> None:
+                async with semaphore:
+                    t0 = time.perf_counter()
+                    if path != "/process-ticket":
+                        response = await client.get(path)
+                    else:
+                        response = await client.post(
+                            path,
+                            json={
+                                "ticket_id": str(uuid.uuid4()),
+                                "description": f"No puedo exportar el reporte {i}.",
+                            },
+                        )
+                    response.raise_for_status()
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+            await asyncio.gather(*(one(i) for i in range(concurrency)))
+            latencies.clear()
+            t0 = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            wall = time.perf_counter() - t0
+        if listener is not None:
+            listener.stop()
+        log_file.flush()
+        log_lines = sum(1 for _ in open(log_file.name, encoding="utf-8"))
+    latencies.sort()
+    return {
+        "variant": variant,
+        "path": path,
+        "requests": requests,
+        "req_per_s": round(requests / wall, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "log_lines": log_lines,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    parser.add_argument("--path", default="/process-ticket")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    table = FakeTickets(latency_ms=0.0, jitter=0.0)
+    with BackgroundServer(create_app(table), args.port) as server:
+        os.environ.update(
+            {
+                "MOCK_LLM": "true",
+                "SUPABASE_URL": server.url,
+                "SUPABASE_SERVICE_ROLE_KEY": SERVICE_ROLE_KEY,
+                "SERVICE_RELOAD_INTERVAL_SECONDS": "0",
+                "NEAR_DUP_ENABLED": "false",
+            }
+        )
+        results = []
+        for variant in ("legacy", "asgi", "asgi+queue", "asgi+queue+sample"):
+            result = asyncio.run(
+                _run_variant(
+                    variant,
+                    args.requests,
+                    args.concurrency,
+                    args.sample_rate,
+                    args.path,
+                )
+            )
+            print(json.dumps(result))
+            results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark de micro-batching: un ticket por prompt frente a varios.
+
+Levanta ``bench.fake_hf`` con capacidad fija (``--slots``) y clasifica los
+mismos tickets sin micro-batching y con cada combinación de ventana y tamaño
+máximo de lote, midiendo throughput, latencia y llamadas al modelo.
+
+Uso:
+    python -m bench.micro_batch --requests 400 --windows 5,20 --max-tickets 4,8,16
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.services.llm_service import LLMService, TicketClassifier
+from app.services.micro_batch import MicroBatchingLLMService
+from bench.fake_hf import BackgroundServer, FakeModel, create_app
+
+TICKETS = [
+    "La aplicación se cierra al exportar el reporte mensual.",
+    "Me cobraron dos veces la suscripción de este mes.",
+    "Quisiera una cotización para 50 licencias del plan empresarial.",
+    "No puedo iniciar sesión desde el celular desde la última actualización.",
+]
+
+
+async def _run_mode(
+    url: str,
+    requests: int,
+    concurrency: int,
+    sync: bool,
+    window_ms: Optional[float],
+    max_tickets: int,
+) -> Dict[str, Any]:
+    base = LLMService(repo_id="fake/model", huggingface_api_token="bench")
+    service: TicketClassifier = base
+    if window_ms is not None:
+        service = MicroBatchingLLMService(base, window_ms, max_tickets)
+    before = httpx.get(f"{url}/stats").json()
+    semaphore = asyncio.Semaphore(concurrency)
+    # Un hilo por request concurrente, como el threadpool de FastAPI.
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+
+    async def one(i: int) -> None:
+        text = TICKETS[i % len(TICKETS)]
+        async with semaphore:
+            t0 = time.perf_counter()
+            if sync:
+                await loop.run_in_executor(executor, service.classify_ticket, text)
+            else:
+                await service.aclassify_ticket(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - t0
+    executor.shutdown()
+    await service.aclose()
+    after = httpx.get(f"{url}/stats").json()
+    latencies.sort()
+    result: Dict[str, Any] = {
+        "mode": "single" if window_ms is None else "micro_batch",
+        "window_ms": window_ms,
+        "max_tickets": max_tickets if window_ms is not None else 1,
+        "path": "sync" if sync else "async",
+        "requests": requests,
+        "req_per_s": round(requests / wall, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        "llm_calls_per_ticket": round(
+            (after["requests"] - before["requests"]) / requests, 3
+        ),
+        "tokens_per_ticket": round(
+            (after["tokens_generated"] - before["tokens_generated"]) / requests, 1
+        ),
+    }
+    if isinstance(service, MicroBatchingLLMService):
+        stats = service.stats()
+        result["avg_batch_size"] = stats["avg_batch_size"]
+        result["single_fallbacks"] = stats["single_fallbacks"]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--windows", default="5,20", help="Ventanas en ms")
+    parser.add_argument("--max-tickets", default="4,8,16")
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=1.0)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--item-error-rate", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sync", action="store_true", help="Mide classify_ticket")
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    model = FakeModel(
+        ttft_ms=args.ttft_ms,
+        token_ms=args.token_ms,
+        jitter=0.1,
+        item_error_rate=args.item_error_rate,
+        slots=args.slots,
+    )
+    modes: List[Any] = [(None, 1)]
+    for window in args.windows.split(","):
+        for size in args.max_tickets.split(","):
+            modes.append((float(window), int(size)))
+    with BackgroundServer(create_app(model), args.port) as server:
+        os.environ["HF_INFERENCE_URL"] = f"{server.url}/models"
+        os.environ["HF_TASK"] = "text-generation"
+        results = []
+        for window_ms, max_tickets in modes:
+            result = asyncio.run(
+                _run_mode(
+                    server.url,
+                    args.requests,
+                    args.concurrency,
+                    args.sync,
+                    window_ms,
+                    max_tickets,
+                )
+            )
+            print(json.dumps(result))
+            results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Benchmark del índice de casi duplicados (MinHash/LSH).
+
+Mide precisión, recall, latencia de búsqueda y memoria para varias
+combinaciones de umbral y permutaciones sobre tickets sintéticos.
+
+Uso:
+    python -m bench.near_duplicate --entries 20000 --output near_dup.json
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+from app.models import SentimentType, TicketCategory, TicketProcessResponse
+from app.services.near_duplicate import NearDuplicateIndex
+
+TEMPLATES: List[Tuple[str, TicketCategory, SentimentType]] = [
+    (
+        "Me llegó un cargo duplicado en mi tarjeta. Necesito que revisen la "
+        "factura #{num} urgentemente. Soy {name}.",
+        TicketCategory.FACTURACION,
+        SentimentType.NEGATIVO,
+    ),
+    (
+        "ERROR: No se puede conectar al servidor. Código {num}. Adjunto "
+        "screenshot del error, saludos {name}.",
+        TicketCategory.TECNICO,
+        SentimentType.NEGATIVO,
+    ),
+    (
+        "Hola, soy {name}. Quisiera saber si tienen planes empresariales para "
+        "{num} usuarios y cuál es el proceso de onboarding.",
+        TicketCategory.COMERCIAL,
+        SentimentType.NEUTRAL,
+    ),
+    (
+        "¡Excelente atención! {name} resolvió mi problema en menos de {num} "
+        "minutos. Muy satisfecho con el servicio.",
+        TicketCategory.OTRO,
+        SentimentType.POSITIVO,
+    ),
+]
+NAMES = ["Ana", "Luis", "María José", "Pedro", "Valentina", "Jorge", "Camila"]
+WORDS = "cuenta acceso reporte pedido envío contraseña plan soporte app web".split()
+
+
+def _variant(rng: random.Random, template: str) -> str:
+    text = template.format(num=rng.randint(1, 99999), name=rng.choice(NAMES))
+    if rng.random() < 0.5:
+        text = text.replace(".", "!!").upper() if rng.random() < 0.3 else text + " ..."
+    return text
+
+
+def _unique(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))) + "."
+
+
+def _result(
+    category: TicketCategory, sentiment: SentimentType
+) -> TicketProcessResponse:
+    return TicketProcessResponse(
+        category=category,
+        sentiment=sentiment,
+        confidence_score=0.9,
+        reasoning="bench",
+    )
+
+
+def run(
+    entries: int, queries: int, threshold: float, num_perm: int, bands: int
+) -> Dict[str, Any]:
+    rng = random.Random(7)
+    tracemalloc.start()
+    index = NearDuplicateIndex(
+        threshold=threshold,
+        num_perm=num_perm,
+        bands=bands,
+        max_entries=entries,
+    )
+    t0 = time.perf_counter()
+    for i in range(entries):
+        if i % 4 == 0:
+            template, category, sentiment = TEMPLATES[(i // 4) % len(TEMPLATES)]
+            index.add(str(i), _variant(rng, template), _result(category, sentiment))
+        else:
+            index.add(
+                str(i),
+                _unique(rng),
+                _result(TicketCategory.OTRO, SentimentType.NEUTRAL),
+            )
+    build_s = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    latencies: List[float] = []
+    true_hits = wrong_hits = misses = 0
+    for i in range(queries):
+        template, category, sentiment = TEMPLATES[i % len(TEMPLATES)]
+        t = time.perf_counter()
+        match = index.lookup(_variant(rng, template))
+        latencies.append((time.perf_counter() - t) * 1e6)
+        if match is None:
+            misses += 1
+        elif match.category == category and match.sentiment == sentiment:
+            true_hits += 1
+        else:
+            wrong_hits += 1
+    latencies.sort()
+    hits = true_hits + wrong_hits
+    return {
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "bands": bands,
+        "entries": entries,
+        "build_seconds": round(build_s, 3),
+        "memory_bytes": memory,
+        "peak_memory_bytes": peak,
+        "bytes_per_entry": memory // max(entries, 1),
+        "recall": round(hits / queries, 4),
+        "precision": round(true_hits / hits, 4) if hits else None,
+        "lookup_us_p50": round(statistics.median(latencies), 1),
+        "lookup_us_p99": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--thresholds", default="0.7,0.8,0.85,0.9")
+    parser.add_argument("--configs", default="64:16,128:32", help="num_perm:bands,...")
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    results = []
+    for config in args.configs.split(","):
+        num_perm, bands = (int(v) for v in config.split(":"))
+        for threshold in (float(t) for t in args.thresholds.split(",")):
+            result = run(args.entries, args.queries, threshold, num_perm, bands)
+            print(json.dumps(result))
+            results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
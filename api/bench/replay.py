@@ -0,0 +1,325 @@
+"""Reproduce una captura de tráfico (``TRAFFIC_CAPTURE_ENABLED``) contra una API.
+
+Lee los segmentos ``capture-*.jsonl.gz`` (de todos los workers), los ordena
+por hora de llegada y envía cada request a ``--target`` en su instante
+original dividido por ``--speed`` (1 = tiempo real, 50 = cincuenta veces más
+rápido). Las llegadas son de lazo abierto: una request no espera a las
+anteriores, así que si la API se satura las colas crecen como en producción.
+La latencia se mide desde el instante programado, no desde el envío, para no
+ocultar las esperas del propio cliente.
+
+Por defecto cada ticket_id de la captura se reemplaza por uno nuevo (el
+mismo para todas sus repeticiones), así dos corridas no chocan con la
+idempotencia de ``/process-ticket``; ``--keep-ids`` envía los originales.
+
+Reporta status, tasa de errores, p50/p95/p99 del cliente, retraso del
+planificador, p50/p95/p99 por etapa (de ``/metrics``) y, con ``--baseline``,
+la diferencia contra otra corrida guardada con ``--output``.
+
+Uso:
+    python -m bench.replay captures/ --target http://127.0.0.1:8000 \\
+        --speed 10 --output candidate.json --baseline baseline.json
+"""
+
+import argparse
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter as CounterDict
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+import httpx
+import orjson
+
+from bench.loadtest import _git_commit, scrape_workers, stage_percentiles
+
+# Métricas comparadas contra la corrida base.
+COMPARED = ("error_rate", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+
+
+def _capture_files(paths: List[str]) -> List[str]:
+    files: List[str] = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "capture-*.jsonl*"))))
+        else:
+            files.append(path)
+    return files
+
+
+def _open(path: str) -> IO[bytes]:
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _read_entries(path: str) -> Iterator[Dict[str, Any]]:
+    """Registros de un segmento; tolera el final truncado del segmento activo."""
+    try:
+        with _open(path) as fh:
+            for line in fh:
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
+    except (EOFError, gzip.BadGzipFile):
+        print(f"aviso: {path} está truncado", file=sys.stderr)
+
+
+def load_capture(
+    paths: List[str], limit: Optional[int], max_seconds: Optional[float]
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Registros ordenados por llegada y un resumen de la captura."""
+    files = _capture_files(paths)
+    entries = sorted(
+        (entry for path in files for entry in _read_entries(path)),
+        key=lambda entry: entry["ts"],
+    )
+    if entries and max_seconds is not None:
+        end = entries[0]["ts"] + max_seconds
+        entries = [entry for entry in entries if entry["ts"] <= end]
+    if limit is not None:
+        entries = entries[:limit]
+    if not entries:
+        raise SystemExit("la captura no tiene requests")
+    digest = hashlib.sha1()
+    for entry in entries:
+        digest.update(f"{entry['ts']}:{entry['path']}:{entry['body']}".encode())
+    return entries, {
+        "files": len(files),
+        "requests": len(entries),
+        "span_s": round(entries[-1]["ts"] - entries[0]["ts"], 3),
+        "fingerprint": digest.hexdigest()[:16],
+    }
+
+
+def _rewrite_ids(entries: List[Dict[str, Any]]) -> List[bytes]:
+    """Cuerpos con ticket_ids nuevos; las repeticiones siguen siendo repeticiones."""
+    fresh: Dict[str, str] = {}
+    bodies = []
+    for entry in entries:
+        body = entry["body"].encode()
+        try:
+            payload = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            bodies.append(body)
+            continue
+        if isinstance(payload, dict) and "ticket_id" in payload:
+            original = str(payload["ticket_id"])
+            payload["ticket_id"] = fresh.setdefault(original, str(uuid.uuid4()))
+            body = orjson.dumps(payload)
+        bodies.append(body)
+    return bodies
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    return round(values[min(int(len(values) * q), len(values) - 1)], 2)
+
+
+def _latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    return {
+        "p50_ms": round(statistics.median(values), 2) if values else None,
+        "p95_ms": _percentile(values, 0.95),
+        "p99_ms": _percentile(values, 0.99),
+        "max_ms": round(values[-1], 2) if values else None,
+    }
+
+
+def _error_rate(statuses: CounterDict, requests: int) -> float:
+    # Los 4xx de cuerpos inválidos también ocurrieron en producción; 429, 5xx
+    # y errores de conexión son la API fallando o rechazando carga.
+    errors = sum(
+        count
+        for code, count in statuses.items()
+        if not code.isdigit() or code == "429" or int(code) >= 500
+    )
+    return round(errors / requests, 4)
+
+
+def captured_summary(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Status, latencias y etapas tal como se registraron en producción."""
+    statuses = CounterDict(str(entry["status"]) for entry in entries)
+    stages: Dict[str, List[float]] = {}
+    for entry in entries:
+        for stage, ms in entry["stages"].items():
+            stages.setdefault(stage, []).append(ms)
+    return {
+        "status_counts": dict(statuses),
+        "error_rate": _error_rate(statuses, len(entries)),
+        **_latency_summary([entry["duration_ms"] for entry in entries]),
+        "stages": {
+            stage: _latency_summary(values) for stage, values in sorted(stages.items())
+        },
+    }
+
+
+async def replay(
+    target: str,
+    entries: List[Dict[str, Any]],
+    bodies: List[bytes],
+    speed: float,
+    max_connections: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    """Envía las requests en lazo abierto según sus horas de llegada."""
+    latencies: List[float] = []
+    lags: List[float] = []
+    statuses: CounterDict = CounterDict()
+    limits = httpx.Limits(
+        max_connections=max_connections, max_keepalive_connections=max_connections
+    )
+    headers = {"Content-Type": "application/json"}
+
+    async with httpx.AsyncClient(
+        base_url=target, limits=limits, timeout=timeout
+    ) as client:
+
+        async def one(due: float, path: str, body: bytes) -> None:
+            lags.append((time.perf_counter() - due) * 1000)
+            try:
+                response = await client.post(path, content=body, headers=headers)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as exc:
+                statuses[type(exc).__name__] += 1
+            latencies.append((time.perf_counter() - due) * 1000)
+
+        first = entries[0]["ts"]
+        tasks = []
+        t_start = time.perf_counter()
+        for entry, body in zip(entries, bodies):
+            due = t_start + (entry["ts"] - first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(due, entry["path"], body)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - t_start
+
+    requests = len(entries)
+    span = (entries[-1]["ts"] - first) / speed
+    return {
+        "requests": requests,
+        "seconds": round(wall, 3),
+        "offered_rate": round(requests / span, 1) if span else None,
+        "status_counts": dict(statuses),
+        "error_rate": _error_rate(statuses, requests),
+        **_latency_summary(latencies),
+        # Retraso del envío respecto del instante programado; si crece, el
+        # cliente no da abasto y la corrida deja de ser de lazo abierto.
+        "lag_p99_ms": _percentile(sorted(lags), 0.99),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Diferencias de errores y latencia contra la corrida base."""
+    deltas = {}
+    for key in COMPARED:
+        new, old = current["replay"][key], baseline["replay"][key]
+        if new is None or old is None:
+            continue
+        deltas[key] = {
+            "baseline": old,
+            "current": new,
+            "delta": round(new - old, 4),
+            "change_pct": round((new - old) / old * 100, 1) if old else None,
+        }
+    return {
+        "label": baseline.get("label"),
+        "commit": baseline.get("commit"),
+        # Solo es comparable la misma captura a la misma velocidad.
+        "comparable": (
+            baseline["capture"]["fingerprint"] == current["capture"]["fingerprint"]
+            and baseline["config"]["speed"] == current["config"]["speed"]
+        ),
+        "deltas": deltas,
+    }
+
+
+def _scrape(target: str, workers: int) -> Optional[Dict[str, Any]]:
+    try:
+        return scrape_workers(target, workers)
+    except httpx.HTTPError:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="Directorios o segmentos")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 a 50")
+    parser.add_argument("--limit", type=int, help="Solo las primeras N requests")
+    parser.add_argument(
+        "--max-seconds", type=float, help="Solo los primeros N segundos capturados"
+    )
+    parser.add_argument("--keep-ids", action="store_true")
+    parser.add_argument("--max-connections", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=1, help="Workers a scrapear")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior")
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+    if not 0 < args.speed <= 50:
+        parser.error("--speed debe estar entre 0 y 50")
+
+    entries, capture = load_capture(args.captures, args.limit, args.max_seconds)
+    bodies = (
+        [entry["body"].encode() for entry in entries]
+        if args.keep_ids
+        else _rewrite_ids(entries)
+    )
+    print(json.dumps({"capture": capture}))
+
+    before = _scrape(args.target, args.workers)
+    client = asyncio.run(
+        replay(
+            args.target,
+            entries,
+            bodies,
+            args.speed,
+            args.max_connections,
+            args.timeout,
+        )
+    )
+    after = _scrape(args.target, args.workers)
+    result: Dict[str, Any] = {
+        "label": args.label,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "target": args.target,
+            "speed": args.speed,
+            "keep_ids": args.keep_ids,
+            "max_connections": args.max_connections,
+        },
+        "capture": capture,
+        "captured": captured_summary(entries),
+        "replay": client,
+        "stages": (
+            stage_percentiles(before, after) if before and after else None
+        ),
+    }
+    print(json.dumps({"replay": client}))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            result["baseline"] = compare(result, json.load(fh))
+        if not result["baseline"]["comparable"]:
+            print(
+                "aviso: la base usó otra captura u otra velocidad", file=sys.stderr
+            )
+        print(json.dumps({"baseline": result["baseline"]}))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Microbenchmark del camino de request/response de ``POST /process-ticket``.
+
+Mide el CPU por request de dos formas:
+
+- ``stages``: solo el parseo del cuerpo y la serialización de la respuesta,
+  con el camino anterior (``Body`` -> dict -> ``TicketProcessRequest(**payload)``
+  y ``model_dump`` -> ``jsonable_encoder`` -> ``json.dumps``) frente al actual
+  (``model_validate_json`` sobre los bytes y el sobre serializado con orjson);
+- ``endpoint``: la request completa por ASGI, sin red ni middleware, con
+  MOCK_LLM=true y escritura diferida, contra una copia del endpoint anterior
+  montada en ``/legacy/process-ticket``.
+
+Uso:
+    python -m bench.request_path --requests 5000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import timeit
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Body, Depends, FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import main as api_main
+from app.models import TicketProcessRequest, TicketProcessResponse
+from app.routers import tickets
+from app.services.llm_service import TicketClassifier
+from app.services.pipeline import classify
+from app.services.supabase_service import build_ticket_row
+from app.services.write_behind import WriteBehindBuffer
+from bench.fake_hf import BackgroundServer
+from bench.fake_postgrest import SERVICE_ROLE_KEY, FakeTickets, create_app
+
+DESCRIPTION = (
+    "La aplicación se cierra al exportar el reporte mensual y no puedo trabajar."
+)
+RESULT = TicketProcessResponse(
+    category="Técnico",
+    sentiment="Negativo",
+    confidence_score=0.93,
+    reasoning="El usuario reporta un cierre inesperado al exportar el reporte.",
+)
+
+
+def _body() -> bytes:
+    return json.dumps(
+        {"ticket_id": str(uuid.uuid4()), "description": DESCRIPTION}
+    ).encode()
+
+
+def _legacy_parse(body: bytes) -> TicketProcessRequest:
+    payload = json.loads(body)
+    return TicketProcessRequest(**payload)
+
+
+def _legacy_render(result: TicketProcessResponse) -> bytes:
+    content = tickets._response(
+        "success",
+        "Ticket procesado correctamente.",
+        result.model_dump(mode="json"),
+        None,
+    )
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def _render(result: TicketProcessResponse) -> bytes:
+    return tickets._json(
+        200,
+        "success",
+        "Ticket procesado correctamente.",
+        data=tickets._result_json(result),
+    ).body
+
+
+def _per_call_us(fn: Callable[[], Any], number: int) -> float:
+    return round(min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6, 2)
+
+
+def _stages(number: int) -> Dict[str, Any]:
+    body = _body()
+    assert json.loads(_legacy_render(RESULT)) == json.loads(_render(RESULT))
+    return {
+        "parse_us": {
+            "legacy": _per_call_us(lambda: _legacy_parse(body), number),
+            "single_parse": _per_call_us(
+                lambda: TicketProcessRequest.model_validate_json(body), number
+            ),
+        },
+        "render_us": {
+            "legacy": _per_call_us(lambda: _legacy_render(RESULT), number),
+            "orjson": _per_call_us(lambda: _render(RESULT), number),
+        },
+    }
+
+
+def _build_app() -> FastAPI:
+    app = FastAPI(lifespan=api_main.lifespan)
+    app.include_router(tickets.router)
+
+    @app.post("/legacy/process-ticket")
+    async def legacy_process_ticket(
+        payload: Dict[str, Any] = Body(...),
+        llm_service: TicketClassifier = Depends(tickets.get_llm_service),
+        write_behind: Optional[WriteBehindBuffer] = Depends(tickets.get_write_behind),
+    ) -> Dict[str, Any]:
+        """Copia del camino anterior (sin logs ni métricas), como referencia."""
+        request_data = TicketProcessRequest(**payload)
+        result = await classify(llm_service, request_data.description)
+        if write_behind is not None:
+            write_behind.enqueue(
+                build_ticket_row(
+                    ticket_id=request_data.ticket_id,
+                    description=request_data.description,
+                    category=result.category,
+                    sentiment=result.sentiment,
+                    confidence_score=result.confidence_score,
+                    reasoning=result.reasoning,
+                    processing_time_ms=0,
+                )
+            )
+        return tickets._response(
+            "success",
+            "Ticket procesado correctamente.",
+            result.model_dump(mode="json"),
+            None,
+        )
+
+    return app
+
+
+async def _asgi_post(app: FastAPI, path: str, body: bytes) -> int:
+    """Request ASGI mínima, sin cliente HTTP."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    sent = False
+    status_code = 0
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+
+    await app(scope, receive, send)
+    return status_code
+
+
+async def _endpoint(requests: int) -> List[Dict[str, Any]]:
+    app = _build_app()
+    results = []
+    async with api_main.lifespan(app):
+        for path in ("/legacy/process-ticket", "/process-ticket") * 2:
+            bodies = [_body() for _ in range(requests)]
+            cpu0, wall0 = time.process_time(), time.perf_counter()
+            for body in bodies:
+                if await _asgi_post(app, path, body) != 200:
+                    raise RuntimeError(f"{path} failed")
+            cpu = time.process_time() - cpu0
+            wall = time.perf_counter() - wall0
+            results.append(
+                {
+                    "path": path,
+                    "requests": requests,
+                    "cpu_us_per_request": round(cpu / requests * 1e6, 1),
+                    "req_per_s": round(requests / wall, 1),
+                }
+            )
+    # La primera pasada de cada ruta calienta cachés; se reporta la segunda.
+    return results[2:]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--number", type=int, default=20000, help="Iteraciones")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result: Dict[str, Any] = {"stages": _stages(args.number)}
+    print(json.dumps(result["stages"]))
+    table = FakeTickets(latency_ms=0.0, jitter=0.0)
+    with BackgroundServer(create_app(table), args.port) as server:
+        os.environ.update(
+            {
+                "MOCK_LLM": "true",
+                "SUPABASE_URL": server.url,
+                "SUPABASE_SERVICE_ROLE_KEY": SERVICE_ROLE_KEY,
+                "SERVICE_RELOAD_INTERVAL_SECONDS": "0",
+                "WRITE_BEHIND_ENABLED": "true",
+                "CLASSIFICATION_CACHE_ENABLED": "false",
+                "NEAR_DUP_ENABLED": "false",
+                "SINGLE_FLIGHT_ENABLED": "false",
+                "TICKET_STATS_ENABLED": "false",
+            }
+        )
+        result["endpoint"] = asyncio.run(_endpoint(args.requests))
+    for row in result["endpoint"]:
+        print(json.dumps(row))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Benchmark del stream de resultados (``GET /stream/results``).
+
+Arranca ``main:app`` (MOCK_LLM=true) contra ``bench.fake_postgrest``, abre
+``--subscribers`` conexiones SSE inactivas y mide la memoria del worker por
+suscriptor. Después envía ``--tickets`` tickets y mide cuánto tarda cada
+evento en llegar a todos los suscriptores y la CPU del worker durante el
+reparto.
+
+Uso:
+    python -m bench.result_stream --subscribers 2000 --tickets 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Dict
+
+import httpx
+
+from bench.fake_postgrest import SERVICE_ROLE_KEY
+from bench.loadtest import _proc_usage, _process, _wait_ready
+
+
+class _Subscriber:
+    """Conexión SSE cruda (sin cliente HTTP) para poder abrir miles."""
+
+    def __init__(self) -> None:
+        self.received: Dict[str, float] = {}
+        self.ready = asyncio.Event()
+
+    async def run(self, host: str, port: int) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            f"GET /stream/results HTTP/1.1\r\nHost: {host}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await writer.drain()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"retry:"):
+                    self.ready.set()
+                elif line.startswith(b"data: {"):
+                    ticket_id = json.loads(line[6:])["ticket_id"]
+                    self.received[ticket_id] = time.perf_counter()
+        finally:
+            writer.close()
+
+
+def _worker_pid(api_pid: int) -> str:
+    # uvicorn con un worker sirve en el mismo proceso.
+    return str(api_pid)
+
+
+async def _run(args: argparse.Namespace, api_url: str, pid: str) -> Dict[str, Any]:
+    host, port = "127.0.0.1", args.port
+    idle_before = _proc_usage(pid)
+    subscribers = [_Subscriber() for _ in range(args.subscribers)]
+    tasks = [asyncio.create_task(s.run(host, port)) for s in subscribers]
+    await asyncio.wait_for(
+        asyncio.gather(*(s.ready.wait() for s in subscribers)), timeout=120
+    )
+    await asyncio.sleep(1.0)
+    idle_after = _proc_usage(pid)
+    async with httpx.AsyncClient(base_url=api_url) as client:
+        stream_stats = (await client.get("/health/result-stream")).json()
+        sent: Dict[str, float] = {}
+        cpu_before = _proc_usage(pid)["cpu_seconds"]
+        for i in range(args.tickets):
+            ticket_id = str(uuid.uuid4())
+            sent[ticket_id] = time.perf_counter()
+            response = await client.post(
+                "/process-ticket",
+                json={
+                    "ticket_id": ticket_id,
+                    "description": f"No puedo exportar el reporte mensual {i}.",
+                },
+            )
+            response.raise_for_status()
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and any(
+            len(s.received) < args.tickets for s in subscribers
+        ):
+            await asyncio.sleep(0.05)
+        cpu_after = _proc_usage(pid)["cpu_seconds"]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    delays = sorted(
+        (received - sent[ticket_id]) * 1000
+        for s in subscribers
+        for ticket_id, received in s.received.items()
+        if ticket_id in sent
+    )
+    expected = args.subscribers * args.tickets
+    return {
+        "subscribers": args.subscribers,
+        "connected": stream_stats.get("subscribers"),
+        "tickets": args.tickets,
+        "delivered": len(delays),
+        "delivery_ratio": round(len(delays) / expected, 4) if expected else None,
+        "rss_idle_mb": round(idle_before["rss_mb"], 1),
+        "rss_subscribed_mb": round(idle_after["rss_mb"], 1),
+        "kb_per_subscriber": round(
+            (idle_after["rss_mb"] - idle_before["rss_mb"])
+            * 1024
+            / max(args.subscribers, 1),
+            2,
+        ),
+        "delivery_p50_ms": round(statistics.median(delays), 1) if delays else None,
+        "delivery_p99_ms": (
+            round(delays[int(len(delays) * 0.99) - 1], 1) if delays else None
+        ),
+        "fanout_cpu_ms_per_event": round(
+            (cpu_after - cpu_before) * 1000 / max(args.tickets, 1), 2
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--tickets", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--pg-port", type=int, default=8082)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    base_env = dict(os.environ)
+    pg_url = f"http://127.0.0.1:{args.pg_port}"
+    api_url = f"http://127.0.0.1:{args.port}"
+    app_env = {
+        **base_env,
+        "MOCK_LLM": "true",
+        "SUPABASE_URL": pg_url,
+        "SUPABASE_SERVICE_ROLE_KEY": SERVICE_ROLE_KEY,
+        "SERVICE_RELOAD_INTERVAL_SECONDS": "0",
+        "CLASSIFICATION_CACHE_ENABLED": "false",
+        "ENVIRONMENT": "production",
+    }
+    pg_cmd = [
+        sys.executable, "-m", "bench.fake_postgrest",
+        "--port", str(args.pg_port),
+        "--latency-ms", "2",
+    ]
+    api_cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--port", str(args.port),
+        "--log-level", "warning",
+        "--timeout-graceful-shutdown", "1",
+    ]
+    with _process(pg_cmd, base_env):
+        _wait_ready(f"{pg_url}/stats")
+        with _process(api_cmd, app_env) as api:
+            _wait_ready(f"{api_url}/health")
+            result = asyncio.run(_run(args, api_url, _worker_pid(api.pid)))
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
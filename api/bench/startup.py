@@ -0,0 +1,164 @@
+"""Benchmark del arranque en frío de la API.
+
+Para cada modo (``mock``: MOCK_LLM=true, ``huggingface`` y ``tgi``) mide, en
+procesos nuevos:
+
+- ``import``: tiempo de ``import main``, RSS después del import, qué
+  dependencias pesadas quedaron cargadas y el tiempo y la RSS tras construir
+  el LLM y Supabase (lo que hace ``warm_up`` en segundo plano);
+- ``health``: tiempo desde que se lanza uvicorn hasta el primer ``/health``
+  200 y la RSS del worker en ese momento.
+
+No hace llamadas de red: Hugging Face, TGI y Supabase apuntan a URLs locales
+que no se usan durante el arranque.
+
+Uso:
+    python -m bench.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from bench.fake_postgrest import SERVICE_ROLE_KEY
+from bench.loadtest import _proc_usage, _process
+
+HEAVY_MODULES = (
+    "langchain_core",
+    "langchain_community",
+    "huggingface_hub",
+    "supabase",
+    "numpy",
+)
+
+MODES: Dict[str, Dict[str, str]] = {
+    "mock": {"MOCK_LLM": "true"},
+    "huggingface": {
+        "MOCK_LLM": "false",
+        "LLM_BACKEND": "huggingface",
+        "HUGGINGFACEHUB_API_TOKEN": "bench",
+        "HF_TASK": "text-generation",
+        "HF_INFERENCE_URL": "http://127.0.0.1:9/models",
+    },
+    "tgi": {
+        "MOCK_LLM": "false",
+        "LLM_BACKEND": "tgi",
+        "LLM_BACKEND_URL": "http://127.0.0.1:9",
+    },
+}
+
+# Se ejecuta en un intérprete nuevo para que ningún import quede en caché.
+CHILD = """
+import json, sys, time
+def rss_mb():
+    with open("/proc/self/status") as fh:
+        return next(int(l.split()[1]) for l in fh if l.startswith("VmRSS")) / 1024
+t0 = time.perf_counter()
+import main
+import_ms = (time.perf_counter() - t0) * 1000
+rss = rss_mb()
+loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+registry = main.get_registry(main.app)
+t1 = time.perf_counter()
+registry.llm
+registry.supabase
+print(json.dumps({
+    "import_ms": import_ms,
+    "rss_mb": rss,
+    "loaded": loaded,
+    "services_ms": (time.perf_counter() - t1) * 1000,
+    "services_rss_mb": rss_mb(),
+}))
+"""
+
+
+def _env(mode: str) -> Dict[str, str]:
+    return {
+        **os.environ,
+        **MODES[mode],
+        "SUPABASE_URL": "http://127.0.0.1:9",
+        "SUPABASE_SERVICE_ROLE_KEY": SERVICE_ROLE_KEY,
+        "SERVICE_RELOAD_INTERVAL_SECONDS": "0",
+        "CLASSIFICATION_CACHE_ENABLED": "false",
+        "ENVIRONMENT": "production",
+    }
+
+
+def _import_run(mode: str) -> Dict[str, Any]:
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{CHILD}"
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        env=_env(mode),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _health_run(mode: str, port: int) -> Dict[str, Any]:
+    url = f"http://127.0.0.1:{port}/health"
+    cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--port", str(port),
+        "--log-level", "warning",
+    ]
+    t0 = time.perf_counter()
+    with _process(cmd, _env(mode)) as proc:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if httpx.get(url, timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline or proc.poll() is not None:
+                raise RuntimeError(f"{url} no respondió")
+            time.sleep(0.01)
+        health_ms = (time.perf_counter() - t0) * 1000
+        rss = _proc_usage(str(proc.pid))["rss_mb"]
+    return {"health_ms": health_ms, "rss_mb": rss}
+
+
+def _median(runs: List[Dict[str, Any]], key: str) -> float:
+    return round(statistics.median(run[key] for run in runs), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes.split(","):
+        imports = [_import_run(mode) for _ in range(args.runs)]
+        healths = [_health_run(mode, args.port) for _ in range(args.runs)]
+        result = {
+            "mode": mode,
+            "import_ms": _median(imports, "import_ms"),
+            "import_rss_mb": _median(imports, "rss_mb"),
+            "loaded_after_import": imports[-1]["loaded"],
+            "services_ms": _median(imports, "services_ms"),
+            "services_rss_mb": _median(imports, "services_rss_mb"),
+            "first_health_ms": _median(healths, "health_ms"),
+            "health_rss_mb": _median(healths, "rss_mb"),
+        }
+        print(json.dumps(result))
+        results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
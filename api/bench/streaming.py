@@ -0,0 +1,94 @@
+"""Benchmark de generación completa frente a streaming con corte temprano.
+
+Levanta el servidor falso de ``bench.fake_hf`` y clasifica los mismos tickets
+con LLM_STREAMING=false y true, midiendo latencia y tokens generados.
+
+Uso:
+    python -m bench.streaming --requests 200 --token-ms 10 --output streaming.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from app.services.llm_service import LLMService
+from bench.fake_hf import BackgroundServer, FakeModel, create_app
+
+TICKET = "La aplicación se cierra al exportar el reporte mensual y no puedo trabajar."
+
+
+async def _run_mode(
+    streaming: bool, url: str, requests: int, concurrency: int, sync: bool
+) -> Dict[str, Any]:
+    os.environ["LLM_STREAMING"] = "true" if streaming else "false"
+    service = LLMService(repo_id="fake/model", huggingface_api_token="bench")
+    tokens_before = httpx.get(f"{url}/stats").json()["tokens_generated"]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            t0 = time.perf_counter()
+            if sync:
+                await asyncio.to_thread(service.classify_ticket, TICKET)
+            else:
+                await service.aclassify_ticket(TICKET)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - t0
+    await service.aclose()
+    # Deja que el servidor registre las cancelaciones antes de leer los contadores.
+    await asyncio.sleep(0.2)
+    tokens = httpx.get(f"{url}/stats").json()["tokens_generated"] - tokens_before
+    latencies.sort()
+    return {
+        "mode": "streaming" if streaming else "full",
+        "path": "sync" if sync else "async",
+        "requests": requests,
+        "req_per_s": round(requests / wall, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        "tokens_per_request": round(tokens / requests, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--sync", action="store_true", help="Mide classify_ticket")
+    parser.add_argument("--output", help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    model = FakeModel(ttft_ms=args.ttft_ms, token_ms=args.token_ms)
+    with BackgroundServer(create_app(model), args.port) as server:
+        os.environ["HF_INFERENCE_URL"] = f"{server.url}/models"
+        os.environ["HF_TASK"] = "text-generation"
+        results = []
+        for streaming in (False, True):
+            result = asyncio.run(
+                _run_mode(
+                    streaming, server.url, args.requests, args.concurrency, args.sync
+                )
+            )
+            print(json.dumps(result))
+            results.append(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
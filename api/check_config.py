@@ -45,12 +45,21 @@ print()
 mock_llm = os.getenv("MOCK_LLM", "").lower() == "true"
 hf_token = os.getenv("HUGGINGFACEHUB_API_TOKEN")
 hf_model = os.getenv("HF_MODEL_ID")
+llm_backend = os.getenv("LLM_BACKEND", "huggingface").lower()
+backend_url = os.getenv("LLM_BACKEND_URL")
 
 print("2. VARIABLES DE LLM")
 print("-" * 40)
 print(f"   MOCK_LLM: {mock_llm}")
 if mock_llm:
     print("   ✅ Modo MOCK activado - no se requiere Hugging Face")
+elif llm_backend != "huggingface":
+    print(f"   LLM_BACKEND: {llm_backend}")
+    if not backend_url:
+        errors.append(f"❌ LLM_BACKEND_URL no está definida (requerida con LLM_BACKEND={llm_backend})")
+        print("   ❌ LLM_BACKEND_URL: NO DEFINIDA")
+    else:
+        print(f"   ✅ LLM_BACKEND_URL: {backend_url}")
 else:
     if not hf_token:
         errors.append("❌ HUGGINGFACEHUB_API_TOKEN no está definida (requerida si MOCK_LLM=false)")
@@ -113,7 +122,7 @@ try:
             errors.append(f"❌ Error al inicializar MockLLMService: {exc}")
             print(f"   ❌ MockLLMService: Error al inicializar - {exc}")
     else:
-        if hf_token:
+        if hf_token or llm_backend != "huggingface":
             try:
                 service = LLMService()
                 print("   ✅ LLMService: inicializado correctamente")
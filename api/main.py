@@ -1,16 +1,28 @@
+import asyncio
 import logging
 import os
+import random
+import sys
 import time
-from typing import Callable, Dict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, MutableMapping
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.routers.system import router as system_router
 from app.routers.tickets import router as tickets_router
+from app.services import metrics
+from app.services.log_pipeline import configure_logging
+from app.services.profiling import PROFILED_PATHS
+from app.services.queue_worker import TicketQueueWorker
+from app.services.registry import get_registry
+from app.services.result_stream import close_on_exit_signals
+from app.services.traffic_capture import CAPTURE_PATHS, STAGES_SCOPE_KEY
 
 load_dotenv()
 
@@ -19,51 +31,176 @@ log_level = (
     if os.getenv("ENVIRONMENT") == "development"
     else logging.WARNING
 )
-logging.basicConfig(
-    level=log_level,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+configure_logging(log_level)
 logger = logging.getLogger(__name__)
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """Middleware para logging de requests."""
+class LoggingMiddleware:
+    """Middleware ASGI de logging y métricas por request.
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start_time = time.perf_counter()
+    A diferencia de ``BaseHTTPMiddleware`` no crea tareas ni envuelve el
+    stream de la respuesta: solo observa el ``http.response.start``. Las
+    respuestas exitosas se loguean con probabilidad ``sample_rate``; los
+    errores siempre.
 
-        logger.info("%s %s", request.method, request.url.path)
+    Con la captura de tráfico activa también copia el cuerpo de las rutas de
+    ``CAPTURE_PATHS`` y, al terminar, lo registra con los tiempos por etapa.
+    Con el profiler activo perfila las requests de ``PROFILED_PATHS`` que le
+    toquen (ver ``RequestProfiler``).
+    """
 
-        try:
-            response = await call_next(request)
-            process_time = (time.perf_counter() - start_time) * 1000
-
-            logger.info(
-                "%s %s - %d (%.2fms)",
-                request.method,
-                request.url.path,
-                response.status_code,
-                process_time,
+    def __init__(self, app: ASGIApp, sample_rate: float = 1.0) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+        capture = profiler = session = None
+        if scope["path"] in CAPTURE_PATHS or scope["path"] in PROFILED_PATHS:
+            registry = get_registry(scope["app"])
+            if scope["path"] in CAPTURE_PATHS:
+                capture = registry.traffic_capture
+            if scope["path"] in PROFILED_PATHS:
+                profiler = registry.profiler
+        if capture is not None:
+            arrived_at = time.time()
+            chunks: List[bytes] = []
+            receive = _copy_body(receive, chunks)
+        if profiler is not None:
+            # Las pilas se toman desde este frame: sin uvicorn ni Starlette.
+            session = profiler.start(
+                scope["path"], scope["headers"], asyncio.current_task(), sys._getframe()
             )
+        if capture is not None or session is not None:
+            scope[STAGES_SCOPE_KEY] = {}
 
-            return response
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
         except Exception as exc:
-            logger.error(
-                "%s %s - Error: %s",
-                request.method,
-                request.url.path,
-                str(exc),
-            )
+            logger.error("%s %s - Error: %s", scope["method"], scope["path"], exc)
             raise
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            route = _route_label(scope)
+            metrics.HTTP_REQUESTS.labels(scope["method"], route, str(status_code)).inc()
+            if status_code >= 400 or random.random() < self.sample_rate:
+                _log_request(scope, route, status_code, start_time)
+            duration_ms = (time.perf_counter() - start_time) * 1000
+            if capture is not None:
+                capture.record(
+                    arrived_at,
+                    scope["path"],
+                    b"".join(chunks),
+                    status_code,
+                    duration_ms,
+                    scope[STAGES_SCOPE_KEY],
+                )
+            if session is not None:
+                profiler.finish(
+                    session, status_code, duration_ms, scope[STAGES_SCOPE_KEY]
+                )
+
+
+def _copy_body(receive: Receive, chunks: List[bytes]) -> Receive:
+    async def receive_and_copy() -> Message:
+        message = await receive()
+        if message["type"] == "http.request":
+            chunks.append(message.get("body", b""))
+        return message
+
+    return receive_and_copy
+
+
+def _log_request(
+    scope: Scope, route: str, status_code: int, start_time: float
+) -> None:
+    level = logging.WARNING if status_code >= 500 else logging.INFO
+    if not logger.isEnabledFor(level):
+        return
+    process_time = (time.perf_counter() - start_time) * 1000
+    fields: Dict[str, Any] = {
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": route,
+        "status": status_code,
+        "duration_ms": round(process_time, 2),
+    }
+    logger.log(
+        level,
+        "%s %s - %d (%.2fms)",
+        scope["method"],
+        scope["path"],
+        status_code,
+        process_time,
+        extra={"fields": fields},
+    )
+
+
+def _route_label(scope: MutableMapping[str, Any]) -> str:
+    """Plantilla de la ruta (no la URL) para acotar la cardinalidad."""
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Construye los servicios una vez por worker y los cierra al apagar."""
+    registry = get_registry(app)
+    prime = os.getenv("WARMUP_PRIME_CONNECTIONS", "false").lower() == "true"
+    background = [asyncio.create_task(registry.awarm_up(prime))]
+    reload_interval = float(os.getenv("SERVICE_RELOAD_INTERVAL_SECONDS", "30"))
+    if reload_interval > 0:
+        grace = float(os.getenv("SERVICE_RELOAD_GRACE_SECONDS", "30"))
+        background.append(
+            asyncio.create_task(registry.watch(reload_interval, grace))
+        )
+    if registry.ticket_stats is not None:
+        interval = float(os.getenv("TICKET_STATS_RECONCILE_SECONDS", "300"))
+        background.append(
+            asyncio.create_task(registry.ticket_stats.watch(registry, interval))
+        )
+    if registry.result_stream is not None:
+        registry.result_stream.start()
+        close_on_exit_signals(registry.result_stream)
+    if registry.write_behind is not None:
+        registry.write_behind.start()
+    queue_worker = TicketQueueWorker.from_env(registry)
+    app.state.queue_worker = queue_worker
+    if queue_worker is not None:
+        queue_worker.start()
+    try:
+        yield
+    finally:
+        if queue_worker is not None:
+            await queue_worker.stop()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await registry.aclose()
 
 
 app = FastAPI(
     title="Support Copilot API",
     version="1.0.0",
     debug=os.getenv("ENVIRONMENT") == "development",
+    lifespan=lifespan,
 )
 
-app.add_middleware(LoggingMiddleware)
+app.add_middleware(
+    LoggingMiddleware, sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -72,6 +209,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.include_router(tickets_router)
+app.include_router(system_router)
 
 
 @app.exception_handler(RequestValidationError)
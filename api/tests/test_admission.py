@@ -0,0 +1,88 @@
+"""Control de admisión: rechazos con Retry-After y 429 en /process-ticket."""
+
+import asyncio
+import uuid
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.models import TicketPriority
+from app.routers import tickets
+from app.services.admission import (
+    AdmissionController,
+    AdmissionLLMService,
+    AdmissionRejectedError,
+)
+
+
+class UnreachableLLM:
+    """El control de admisión rechaza antes de llamarlo."""
+
+    model_id = "fake"
+    prompt_version = "v1"
+
+    async def aclassify_ticket(self, ticket_text):
+        raise AssertionError("no debería llegar a clasificar")
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_with_retry_after():
+    controller = AdmissionController(initial_limit=1, max_queue=1, queue_timeout=5)
+    await controller.acquire(TicketPriority.NORMAL)
+    queued = asyncio.create_task(controller.acquire(TicketPriority.NORMAL))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejectedError) as info:
+        await controller.acquire(TicketPriority.LOW)
+    assert info.value.reason == "queue_full"
+    assert 1 <= info.value.retry_after <= 60
+
+    controller.release(0.01)
+    await asyncio.wait_for(queued, 1)
+    assert controller.stats()["rejected"]["queue_full"] == 1
+
+
+@pytest.mark.asyncio
+async def test_urgent_call_evicts_least_urgent_waiter():
+    controller = AdmissionController(initial_limit=1, max_queue=1, queue_timeout=5)
+    await controller.acquire(TicketPriority.NORMAL)
+    low = asyncio.create_task(controller.acquire(TicketPriority.LOW))
+    await asyncio.sleep(0)
+    urgent = asyncio.create_task(controller.acquire(TicketPriority.URGENT))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejectedError) as info:
+        await asyncio.wait_for(low, 1)
+    assert info.value.reason == "evicted"
+    controller.release(0.01)
+    await asyncio.wait_for(urgent, 1)
+
+
+@pytest.mark.asyncio
+async def test_process_ticket_returns_429_with_retry_after():
+    controller = AdmissionController(initial_limit=1, max_queue=0, queue_timeout=5)
+    await controller.acquire(TicketPriority.NORMAL)
+    llm = AdmissionLLMService(UnreachableLLM(), controller)
+
+    app = FastAPI()
+    app.include_router(tickets.router)
+    app.dependency_overrides[tickets.get_llm_service] = lambda: llm
+    app.dependency_overrides[tickets.get_supabase_service] = lambda: None
+    app.dependency_overrides[tickets.get_write_behind] = lambda: None
+    app.dependency_overrides[tickets.get_idempotency] = lambda: None
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/process-ticket",
+            json={
+                "ticket_id": str(uuid.uuid4()),
+                "description": "No puedo exportar el reporte mensual.",
+                "priority": "low",
+            },
+        )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["status"] == "error"
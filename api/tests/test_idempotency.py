@@ -0,0 +1,98 @@
+"""Reservas de idempotencia: espera, tiempo agotado y liberación."""
+
+import asyncio
+
+import pytest
+
+from app.models import SentimentType, TicketCategory, TicketProcessResponse
+from app.services.idempotency import IdempotencyStore
+
+
+def _result(reasoning: str = "El cliente reporta una falla.") -> TicketProcessResponse:
+    return TicketProcessResponse(
+        category=TicketCategory.TECNICO,
+        sentiment=SentimentType.NEGATIVO,
+        confidence_score=0.9,
+        reasoning=reasoning,
+    )
+
+
+@pytest.mark.asyncio
+async def test_waiter_gets_owner_result():
+    store = IdempotencyStore()
+    owner = await store.claim("t1")
+    assert owner.token is not None and owner.stored is None
+
+    waiter = asyncio.create_task(store.claim("t1"))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    result = _result()
+    store.complete("t1", result, owner)
+
+    claim = await asyncio.wait_for(waiter, 1)
+    assert claim.stored == result
+    assert claim.token is None
+    assert store.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_timed_out_waiter_does_not_touch_owner_claim():
+    store = IdempotencyStore(wait_seconds=0.01)
+    owner = await store.claim("t1")
+    late = await store.claim("t1")
+    assert late.token is None and late.stored is None
+    assert store.stats()["wait_timeouts"] == 1
+
+    # La request que se cansó de esperar no libera ni completa la reserva ajena.
+    store.release("t1", late)
+    assert store.stats()["in_flight"] == 1
+    store.complete("t1", _result("del que no esperó"), late)
+    assert store.stats()["in_flight"] == 1
+
+    owned = _result("del dueño")
+    store.complete("t1", owned, owner)
+    assert store.stats()["in_flight"] == 0
+    claim = await store.claim("t1")
+    assert claim.stored == owned
+
+
+@pytest.mark.asyncio
+async def test_release_lets_one_waiter_claim_again():
+    store = IdempotencyStore()
+    owner = await store.claim("t1")
+    waiters = [asyncio.create_task(store.claim("t1")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+
+    store.release("t1", owner)
+    await asyncio.sleep(0.01)
+
+    # Uno de los que esperaban se queda la reserva; el resto espera su resultado.
+    new_owners = [task for task in waiters if task.done()]
+    assert len(new_owners) == 1
+    new_owner = new_owners[0].result()
+    assert new_owner.token is not None
+    assert store.stats()["claims"] == 2
+    # Una liberación repetida de la reserva vieja no afecta a la nueva.
+    store.release("t1", owner)
+    assert store.stats()["in_flight"] == 1
+
+    result = _result()
+    store.complete("t1", result, new_owner)
+    rest = [task for task in waiters if task is not new_owners[0]]
+    claims = await asyncio.wait_for(asyncio.gather(*rest), 1)
+    assert [claim.stored for claim in claims] == [result, result]
+    assert store.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_complete_without_claim_keeps_reservation():
+    store = IdempotencyStore()
+    owner = await store.claim("t1")
+
+    # Como el buffer de escritura diferida: guarda sin tocar reservas.
+    store.complete_stored("t1", _result())
+    assert store.stats()["in_flight"] == 1
+    store.release("t1", owner)
+    assert store.stats()["in_flight"] == 0
+    claim = await store.claim("t1")
+    assert claim.stored is not None
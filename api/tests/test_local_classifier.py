@@ -0,0 +1,48 @@
+"""Filas de entrenamiento del clasificador local."""
+
+from app.services.local_classifier import MODEL_VERSION, load_training_rows
+
+
+def _row(description, **overrides):
+    row = {
+        "description": description,
+        "category": "Técnico",
+        "sentiment": "Negativo",
+        "confidence_score": 0.92,
+        "reasoning": "El cliente reporta una falla.",
+    }
+    row.update(overrides)
+    return row
+
+
+def test_load_training_rows_skips_fallback_and_local_rows():
+    rows = [
+        _row("la app no abre"),
+        _row("respaldo", confidence_score=0, reasoning="Error al clasificar."),
+        _row("respaldo decimal", confidence_score="0.00"),
+        _row(
+            "del modelo local",
+            reasoning=f"Clasificación local ({MODEL_VERSION}), sin llamada al LLM.",
+        ),
+        _row("sin etiqueta", category=None),
+    ]
+
+    texts, categories, sentiments = load_training_rows(rows)
+
+    assert texts == ["la app no abre"]
+    assert categories == ["Técnico"]
+    assert sentiments == ["Negativo"]
+
+
+def test_load_training_rows_accepts_jsonl_without_confidence():
+    rows = [
+        {
+            "description": "quiero un reembolso",
+            "category": "Comercial",
+            "sentiment": "Neutral",
+        }
+    ]
+
+    texts, _, _ = load_training_rows(rows)
+
+    assert texts == ["quiero un reembolso"]
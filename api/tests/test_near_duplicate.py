@@ -0,0 +1,88 @@
+"""Índice de casi duplicados: filas guardadas, reutilizadas y alcance."""
+
+import uuid
+
+import pytest
+
+from app.models import SentimentType, TicketCategory, TicketProcessResponse
+from app.services.near_duplicate import (
+    REUSED_REASONING,
+    NearDuplicateIndex,
+    NearDuplicateLLMService,
+    near_duplicate_scope,
+    reused_result,
+)
+
+DESCRIPTION = "Hola, soy Ana. No puedo descargar la factura 12345 desde el portal."
+NEAR_DUPLICATE = "Hola soy Ana, no puedo descargar la factura 98765 desde el portal!"
+
+
+def _row(description=DESCRIPTION, **overrides):
+    row = {
+        "id": str(uuid.uuid4()),
+        "description": description,
+        "category": "Facturación",
+        "sentiment": "Negativo",
+        "confidence_score": 0.9,
+        "reasoning": "El cliente no puede descargar su factura.",
+        "processed": True,
+    }
+    row.update(overrides)
+    return row
+
+
+class CountingLLM:
+    model_id = "fake"
+    prompt_version = "v1"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def aclassify_ticket(self, ticket_text):
+        self.calls += 1
+        return TicketProcessResponse(
+            category=TicketCategory.FACTURACION,
+            sentiment=SentimentType.NEGATIVO,
+            confidence_score=0.9,
+            reasoning="El cliente no puede descargar su factura.",
+        )
+
+
+def test_saved_row_is_reused_only_in_its_scope():
+    index = NearDuplicateIndex()
+    index.add_row(_row(), scope="a")
+
+    match = index.lookup(NEAR_DUPLICATE, scope="a")
+    assert match is not None
+    assert match.reasoning.startswith(REUSED_REASONING)
+    assert index.lookup(NEAR_DUPLICATE, scope="b") is None
+
+
+def test_reused_and_fallback_rows_are_not_indexed():
+    index = NearDuplicateIndex()
+    original = TicketProcessResponse.model_validate(
+        {k: v for k, v in _row().items() if k in TicketProcessResponse.model_fields}
+    )
+    reused = reused_result(original, 0.91)
+    index.add_row(_row(reasoning=reused.reasoning))
+    index.add_row(_row(confidence_score=0))
+
+    assert index.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_wrapper_reuses_but_does_not_index_llm_answers():
+    index = NearDuplicateIndex()
+    llm = CountingLLM()
+    service = NearDuplicateLLMService(llm, index)
+
+    await service.aclassify_ticket(DESCRIPTION)
+    assert index.stats()["entries"] == 0
+
+    # Se indexa al guardarse en Supabase (listener).
+    scope = near_duplicate_scope(llm.model_id, llm.prompt_version)
+    index.add_row(_row(), scope=scope)
+    result = await service.aclassify_ticket(NEAR_DUPLICATE)
+    assert llm.calls == 1
+    assert result.reasoning.startswith(REUSED_REASONING)
+
@@ -0,0 +1,102 @@
+"""Worker de cola: tickets inválidos fuera de la cola y wake() a todas las tareas."""
+
+import asyncio
+import uuid
+
+import pytest
+
+from app.models import SentimentType, TicketCategory, TicketProcessResponse
+from app.services.queue_worker import TicketQueueWorker
+from app.services.supabase_service import BulkUpdateResult
+
+
+class FakeSupabase:
+    """Cola en memoria: claim devuelve las filas pendientes no descartadas."""
+
+    def __init__(self, rows) -> None:
+        self.rows = rows
+        self.rejected = {}
+        self.claims = 0
+
+    async def aclaim_pending_tickets(self, worker_id, limit, lease_seconds):
+        self.claims += 1
+        return [row for row in self.rows if row["id"] not in self.rejected][:limit]
+
+    async def areject_queued_tickets(self, worker_id, ticket_ids, reason):
+        for ticket_id in ticket_ids:
+            self.rejected[ticket_id] = reason
+        return len(ticket_ids)
+
+    async def abulk_update_tickets(self, rows):
+        written = {row["id"] for row in rows}
+        self.rows = [row for row in self.rows if row["id"] not in written]
+        return BulkUpdateResult(updated=sorted(written))
+
+
+class FakeLLM:
+    async def aclassify_ticket(self, description):
+        return TicketProcessResponse(
+            category=TicketCategory.TECNICO,
+            sentiment=SentimentType.NEGATIVO,
+            confidence_score=0.9,
+            reasoning="El cliente reporta una falla.",
+        )
+
+
+class FakeRegistry:
+    def __init__(self, supabase) -> None:
+        self.services = {"supabase": supabase, "llm": FakeLLM()}
+
+    async def aget(self, name):
+        return self.services[name]
+
+
+@pytest.mark.asyncio
+async def test_invalid_rows_leave_the_queue():
+    valid = {"id": str(uuid.uuid4()), "description": "No puedo exportar el reporte."}
+    short = {"id": str(uuid.uuid4()), "description": "corto"}
+    supabase = FakeSupabase([valid, short])
+    worker = TicketQueueWorker(FakeRegistry(supabase), worker_id="w1")
+
+    assert await worker.run_once() == 2
+    assert supabase.rejected == {short["id"]: "invalid_ticket"}
+    assert await worker.run_once() == 0
+
+    stats = worker.stats()
+    assert (stats["processed"], stats["failed"], stats["rejected"]) == (1, 1, 1)
+
+
+class StallingSupabase(FakeSupabase):
+    """La primera reserva espera a ``release``; el resto devuelve la cola vacía."""
+
+    def __init__(self) -> None:
+        super().__init__([])
+        self.release = asyncio.Event()
+
+    async def aclaim_pending_tickets(self, worker_id, limit, lease_seconds):
+        self.claims += 1
+        if self.claims == 1:
+            await self.release.wait()
+        return []
+
+
+@pytest.mark.asyncio
+async def test_wake_during_claim_is_not_lost_by_another_task():
+    supabase = StallingSupabase()
+    worker = TicketQueueWorker(
+        FakeRegistry(supabase), workers=2, poll_interval=60, worker_id="w1"
+    )
+    worker.start()
+    try:
+        await asyncio.sleep(0.01)
+        assert supabase.claims == 2
+        # Llega un aviso mientras la primera tarea reserva; la otra lo atiende.
+        worker.wake()
+        await asyncio.sleep(0.01)
+        assert supabase.claims == 3
+        # La primera tarea tampoco debe perderlo y vuelve a reservar.
+        supabase.release.set()
+        await asyncio.sleep(0.01)
+        assert supabase.claims == 4
+    finally:
+        await worker.stop()
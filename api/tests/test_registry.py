@@ -0,0 +1,29 @@
+"""Recarga del registro de servicios al cambiar la configuración."""
+
+import pytest
+
+from app.services.registry import ServiceRegistry
+
+
+@pytest.mark.asyncio
+async def test_reload_rebuilds_the_llm_chain(monkeypatch, tmp_path):
+    monkeypatch.setenv("MOCK_LLM", "true")
+    monkeypatch.setenv("LLM_RESILIENCE_ENABLED", "true")
+    monkeypatch.delenv("LLM_OUTPUT_PROTOCOL", raising=False)
+    registry = ServiceRegistry(env_file=str(tmp_path / ".env"))
+    try:
+        llm = registry.llm
+        resilience = registry.resilience
+        assert resilience is not None
+        assert not registry.reload_if_changed()
+
+        monkeypatch.setenv("LLM_OUTPUT_PROTOCOL", "compact")
+        assert registry.reload_if_changed()
+        # Sin servicios de la cadena retirada hasta el próximo acceso.
+        assert registry.resilience is None
+
+        assert registry.llm is not llm
+        assert registry.resilience is not None
+        assert registry.resilience is not resilience
+    finally:
+        await registry.aclose()
@@ -0,0 +1,41 @@
+"""Cierre de los streams SSE al apagar el servidor."""
+
+import asyncio
+import signal
+
+import pytest
+
+from app.services.result_stream import (
+    EXIT_SIGNALS,
+    ResultBroadcaster,
+    StreamFullError,
+    close_on_exit_signals,
+)
+
+
+@pytest.mark.asyncio
+async def test_exit_signal_ends_streams_and_chains_server_handler():
+    received = []
+    originals = {sig: signal.getsignal(sig) for sig in EXIT_SIGNALS}
+    try:
+        # Handler del servidor (uvicorn instala el suyo antes del lifespan).
+        signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+        broadcaster = ResultBroadcaster(heartbeat_seconds=0)
+        broadcaster.start()
+        subscription = broadcaster.subscribe()
+        close_on_exit_signals(broadcaster)
+
+        async def drain():
+            return [frame async for frame in subscription.frames()]
+
+        reader = asyncio.create_task(drain())
+        await asyncio.sleep(0)
+        signal.raise_signal(signal.SIGTERM)
+
+        assert await asyncio.wait_for(reader, 1) == []
+        assert received == [signal.SIGTERM]
+        with pytest.raises(StreamFullError):
+            broadcaster.subscribe()
+    finally:
+        for sig, handler in originals.items():
+            signal.signal(sig, handler)
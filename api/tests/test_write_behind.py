@@ -0,0 +1,124 @@
+"""Escritura diferida: cierre con un flush en curso, lotes y spill."""
+
+import asyncio
+import json
+
+import pytest
+
+from app.services.supabase_service import BulkUpdateResult, SupabaseServiceError
+from app.services.write_behind import WriteBehindBuffer
+
+
+class FakeSupabase:
+    """Supabase que puede quedarse esperando o fallar en una llamada dada."""
+
+    def __init__(self, stall: bool = False, fail_calls=()) -> None:
+        self.written = []
+        self.calls = 0
+        self.fail_calls = set(fail_calls)
+        self.entered = asyncio.Event()
+        self.release = asyncio.Event()
+        if not stall:
+            self.release.set()
+
+    async def abulk_update_tickets(self, rows):
+        self.calls += 1
+        self.entered.set()
+        await self.release.wait()
+        if self.calls in self.fail_calls:
+            raise SupabaseServiceError("caído")
+        self.written.extend(row["id"] for row in rows)
+        return BulkUpdateResult(updated=[row["id"] for row in rows])
+
+
+class FakeRegistry:
+    idempotency = None
+
+    def __init__(self, supabase: FakeSupabase) -> None:
+        self.supabase = supabase
+
+    async def aget(self, name):
+        return self.supabase
+
+
+def _buffer(supabase, **kwargs) -> WriteBehindBuffer:
+    kwargs.setdefault("max_retries", 0)
+    return WriteBehindBuffer(FakeRegistry(supabase), **kwargs)
+
+
+def _spill_ids(path):
+    with open(path, encoding="utf-8") as fh:
+        return sorted(json.loads(line)["id"] for line in fh)
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_in_flight_flush():
+    supabase = FakeSupabase(stall=True)
+    buffer = _buffer(supabase, flush_interval=0.01)
+    buffer.start()
+    buffer.enqueue({"id": "a"})
+    buffer.enqueue({"id": "b"})
+    await asyncio.wait_for(supabase.entered.wait(), 1)
+
+    closing = asyncio.create_task(buffer.close())
+    await asyncio.sleep(0.05)
+    assert not closing.done()
+    supabase.release.set()
+    await asyncio.wait_for(closing, 1)
+
+    assert sorted(supabase.written) == ["a", "b"]
+    assert buffer.stats()["depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_flush_keeps_rows(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    supabase = FakeSupabase(stall=True)
+    buffer = _buffer(supabase, spill_path=str(spill))
+    buffer.enqueue({"id": "a"})
+    buffer.enqueue({"id": "b"})
+
+    flushing = asyncio.create_task(buffer.flush())
+    await asyncio.wait_for(supabase.entered.wait(), 1)
+    flushing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flushing
+
+    assert buffer.stats()["depth"] == 2
+    assert _spill_ids(spill) == ["a", "b"]
+
+    supabase.release.set()
+    assert await buffer.flush() == 2
+    assert sorted(supabase.written) == ["a", "b"]
+    assert not spill.exists()
+
+
+@pytest.mark.asyncio
+async def test_flush_sends_chunks_and_spills_only_unsaved_rows(tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    supabase = FakeSupabase(fail_calls={2})
+    buffer = _buffer(supabase, max_rows=2, spill_path=str(spill))
+    for ticket_id in "abcde":
+        buffer.enqueue({"id": ticket_id})
+
+    assert await buffer.flush() == 2
+    assert supabase.written == ["a", "b"]
+    assert _spill_ids(spill) == ["c", "d", "e"]
+    assert buffer.stats()["failed_flushes"] == 1
+
+    assert await buffer.flush() == 3
+    assert supabase.written == ["a", "b", "c", "d", "e"]
+    assert supabase.calls == 4
+    assert not spill.exists()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_without_spill_keeps_rows_in_memory():
+    supabase = FakeSupabase(fail_calls={1})
+    buffer = _buffer(supabase)
+    buffer.enqueue({"id": "a"})
+
+    assert await buffer.flush() == 0
+    assert buffer.stats()["depth"] == 1
+    assert await buffer.flush() == 1
+    assert supabase.written == ["a"]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Entrena el clasificador local (TF-IDF + Naive Bayes) de la cascada.
+
+Lee tickets ya etiquetados desde Supabase (o desde un JSONL con
+description/category/sentiment), descarta los respaldos de confianza 0 y
+las respuestas del propio clasificador local, guarda el artefacto en --output y reporta
+exactitud y tasa de escalado al LLM sobre un conjunto de validación.
+
+Uso:
+    python train_classifier.py --output models/local_classifier
+    python train_classifier.py --input tickets.jsonl --output models/local_classifier
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from app.services.local_classifier import LocalClassifier, load_training_rows
+from app.services.supabase_service import SupabaseService
+
+
+def _read_rows(args: argparse.Namespace) -> list:
+    if args.input:
+        with open(args.input, encoding="utf-8") as fh:
+            return [json.loads(line) for line in fh if line.strip()]
+    return SupabaseService().fetch_processed_tickets(args.limit)
+
+
+def main() -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Entrena el clasificador local.")
+    parser.add_argument("--output", required=True, help="Directorio del artefacto")
+    parser.add_argument("--input", help="JSONL con description/category/sentiment")
+    parser.add_argument("--limit", type=int, default=50000)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--features", type=int, default=1 << 18)
+    args = parser.parse_args()
+
+    texts, categories, sentiments = load_training_rows(_read_rows(args))
+    if len(texts) < 10:
+        print(f"Solo hay {len(texts)} tickets etiquetados; se necesitan al menos 10.")
+        return 1
+
+    order = list(range(len(texts)))
+    random.Random(0).shuffle(order)
+    split = int(len(order) * (1 - args.holdout))
+    train_idx, test_idx = order[:split], order[split:]
+
+    t0 = time.perf_counter()
+    model = LocalClassifier.train(
+        [texts[i] for i in train_idx],
+        [categories[i] for i in train_idx],
+        [sentiments[i] for i in train_idx],
+        n_features=args.features,
+    )
+    train_s = time.perf_counter() - t0
+
+    answered = correct = 0
+    for i in test_idx:
+        prediction = model.predict(texts[i])
+        (category, cat_conf), (sentiment, sent_conf) = (
+            prediction["category"],
+            prediction["sentiment"],
+        )
+        if min(cat_conf, sent_conf) >= args.threshold:
+            answered += 1
+            correct += category == categories[i] and sentiment == sentiments[i]
+
+    # El artefacto final se entrena con todos los datos.
+    model = LocalClassifier.train(
+        texts, categories, sentiments, n_features=args.features
+    )
+    report = {
+        "tickets": len(texts),
+        "train_seconds": round(train_s, 3),
+        "threshold": args.threshold,
+        "holdout": len(test_idx),
+        "escalation_rate": (
+            round(1 - answered / len(test_idx), 4) if test_idx else None
+        ),
+        "local_accuracy": round(correct / answered, 4) if answered else None,
+    }
+    model.save(args.output, extra_meta={"training": report})
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
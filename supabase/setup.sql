@@ -48,6 +48,9 @@ CREATE TABLE tickets (
     
     -- Estado de procesamiento
     processed BOOLEAN NOT NULL DEFAULT false,
+    claimed_by TEXT, -- Worker de la API que tiene el ticket reservado
+    claimed_at TIMESTAMPTZ, -- Inicio de la reserva (expira tras el lease)
+    queue_error TEXT, -- Motivo por el que el worker de cola descartó el ticket
     
     -- Métricas adicionales (PLUS para destacar)
     confidence_score DECIMAL(3,2) CHECK (confidence_score >= 0 AND confidence_score <= 1),
@@ -171,6 +174,146 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Conteos agrupados por estado, categoría, sentimiento y bucket de latencia
+-- (width_bucket sobre p_bounds). La API los lee una vez al arrancar y cada
+-- TICKET_STATS_RECONCILE_SECONDS para servir GET /stats desde memoria.
+CREATE OR REPLACE FUNCTION get_ticket_aggregates(p_bounds INTEGER[])
+RETURNS JSONB AS $$
+    SELECT jsonb_build_object(
+        'snapshot_at', now(),
+        'groups', COALESCE(jsonb_agg(g), '[]'::jsonb)
+    )
+    FROM (
+        SELECT
+            t.processed,
+            t.category,
+            t.sentiment,
+            width_bucket(t.processing_time_ms, p_bounds) AS latency_bucket,
+            COUNT(*) AS tickets,
+            SUM(t.processing_time_ms) AS latency_sum_ms
+        FROM tickets t
+        GROUP BY 1, 2, 3, 4
+    ) g;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================================================
+-- COLA DE PROCESAMIENTO
+-- ============================================================================
+
+-- Reserva hasta p_limit tickets pendientes para un worker de la API.
+-- Las reservas expiran tras p_lease_seconds, así que los tickets de un worker
+-- caído vuelven a la cola. SKIP LOCKED evita que dos workers tomen el mismo.
+CREATE OR REPLACE FUNCTION claim_pending_tickets(
+    p_worker TEXT,
+    p_limit INTEGER,
+    p_lease_seconds INTEGER
+)
+RETURNS TABLE(id UUID, description TEXT) AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    UPDATE tickets
+    SET claimed_by = p_worker, claimed_at = now()
+    WHERE tickets.id IN (
+        SELECT t.id
+        FROM tickets t
+        WHERE t.processed = false
+          AND t.queue_error IS NULL
+          AND (t.claimed_at IS NULL
+               OR t.claimed_at < now() - make_interval(secs => p_lease_seconds))
+        ORDER BY t.created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING tickets.id, tickets.description;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Saca de la cola los tickets reservados por p_worker que no se pueden
+-- procesar (p. ej. una descripción inválida): quedan con processed = false y
+-- el motivo en queue_error, y claim_pending_tickets ya no los devuelve.
+CREATE OR REPLACE FUNCTION reject_queued_tickets(
+    p_worker TEXT,
+    p_ids UUID[],
+    p_reason TEXT
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    UPDATE tickets
+    SET queue_error = p_reason, claimed_by = NULL, claimed_at = NULL
+    WHERE tickets.id = ANY(p_ids) AND tickets.claimed_by = p_worker;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Guarda varias clasificaciones en una sola llamada (lotes, worker de cola y
+-- escritura diferida de la API). Solo actualiza: un id que no existe no se
+-- crea y se devuelve con status 'not_found'. Como la actualización de un
+-- ticket de la API, no sobrescribe un ticket ya procesado (salvo el respaldo
+-- de confianza 0) a menos que la fila traiga force = true; esos se devuelven
+-- con status 'already_processed' y la clasificación guardada.
+CREATE OR REPLACE FUNCTION update_ticket_classifications(p_rows JSONB)
+RETURNS TABLE(
+    id UUID,
+    status TEXT,
+    created_at TIMESTAMPTZ,
+    category TEXT,
+    sentiment TEXT,
+    confidence_score DECIMAL(3,2),
+    reasoning TEXT
+) AS $$
+#variable_conflict use_column
+BEGIN
+    RETURN QUERY
+    WITH input AS (
+        SELECT *
+        FROM jsonb_to_recordset(p_rows) AS r(
+            id UUID,
+            category ticket_category,
+            sentiment sentiment_type,
+            confidence_score DECIMAL(3,2),
+            reasoning TEXT,
+            processing_time_ms INTEGER,
+            force BOOLEAN
+        )
+    ),
+    updated AS (
+        UPDATE tickets t
+        SET category = i.category,
+            sentiment = i.sentiment,
+            confidence_score = i.confidence_score,
+            reasoning = i.reasoning,
+            processing_time_ms = i.processing_time_ms,
+            processed = true
+        FROM input i
+        WHERE t.id = i.id
+          AND (COALESCE(i.force, false)
+               OR t.processed = false
+               OR t.confidence_score = 0)
+        RETURNING t.id, t.created_at
+    )
+    -- ``tickets`` se lee con la foto previa a la actualización.
+    SELECT
+        i.id,
+        CASE
+            WHEN u.id IS NOT NULL THEN 'updated'
+            WHEN t.id IS NULL THEN 'not_found'
+            ELSE 'already_processed'
+        END,
+        COALESCE(u.created_at, t.created_at),
+        CASE WHEN u.id IS NULL THEN t.category::TEXT END,
+        CASE WHEN u.id IS NULL THEN t.sentiment::TEXT END,
+        CASE WHEN u.id IS NULL THEN t.confidence_score END,
+        CASE WHEN u.id IS NULL THEN t.reasoning END
+    FROM input i
+    LEFT JOIN updated u ON u.id = i.id
+    LEFT JOIN tickets t ON t.id = i.id;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ============================================================================
 -- VERIFICACIÓN FINAL
 -- ============================================================================